@@ -0,0 +1,265 @@
+# blade_control.py
+import math, queue, socket, struct, threading, time
+from collections import deque
+import numpy as np
+from field_model import choose_heading
+from implement import Implement
+
+# AgIO endpoint receiving the blade commands (AgIO listens for AgOpenGPS on 17777)
+AGIO_ENDPOINT = ("127.0.0.1", 17777)
+
+# Blade command PGN: 0x80 0x81, source, PGN number, length, "<BhH" payload, checksum
+BLADE_PGN_SOURCE = 0x7F
+BLADE_PGN = 0xF1
+BLADE_PAYLOAD = "<BhH"  # command, blade height error (mm, > 0 blade above target), latency (0.1 ms)
+COMMAND_HOLD, COMMAND_UP, COMMAND_DOWN = 0, 1, 2
+
+# Control defaults: lookahead along the heading (s), deadband (m)
+BLADE_LOOKAHEAD = 0.1
+BLADE_DEADBAND = 0.02
+
+# Fixes whose latency is kept for the p50/p99 metrics
+LATENCY_WINDOW = 1000
+
+
+def blade_pgn(command, error, latency):
+    """Blade command frame: command, height error (m) and fix to command latency (s)."""
+    error_mm = max(-32768, min(32767, int(round(error * 1000)))) if math.isfinite(error) else 0
+    latency_01ms = max(0, min(65535, int(round(latency * 10000))))
+    payload = struct.pack(BLADE_PAYLOAD, command, error_mm, latency_01ms)
+    frame = bytes([0x80, 0x81, BLADE_PGN_SOURCE, BLADE_PGN, len(payload)]) + payload
+    return frame + bytes([sum(frame[2:]) & 0xFF])
+
+
+def parse_blade_pgn(data):
+    """Parse a blade command frame, None if it is not one."""
+    size = struct.calcsize(BLADE_PAYLOAD)
+    if len(data) != 6 + size or data[:5] != bytes([0x80, 0x81, BLADE_PGN_SOURCE, BLADE_PGN, size]):
+        return None
+    if sum(data[2:-1]) & 0xFF != data[-1]:
+        return None
+    command, error_mm, latency_01ms = struct.unpack(BLADE_PAYLOAD, data[5:-1])
+    return {"command": command, "error": error_mm / 1000.0, "latency": latency_01ms / 10000.0}
+
+
+class TargetSurface:
+    """
+    Snapshot of the target raster for the blade controller: regular grid of cell
+    centres from (x0, y0) with step resolution, in field coordinates, together with
+    the lon/lat transform, reference altitude and rotation it belongs to. The GUI
+    builds a new one whenever the target changes and never modifies it afterwards,
+    so the controller thread reads it without locks.
+    """
+
+    def __init__(self, grid_x, grid_y, target, transform, ref_alt, rotation_deg):
+        self.x0 = float(grid_x[0, 0])
+        self.y0 = float(grid_y[0, 0])
+        self.resolution = float(grid_x[0, 1] - grid_x[0, 0]) if grid_x.shape[1] > 1 else 1.0
+        self.target = np.array(target, dtype=float)
+        self.rows = self.target.tolist()    # plain floats: a scalar lookup per fix
+        self.transform = np.array(transform, dtype=float).tolist()
+        self.ref_alt = float(ref_alt)
+        self.rotation_deg = float(rotation_deg)
+
+    def sample(self, x, y):
+        """
+        Bilinear interpolation of the target at (x, y); corners outside the field
+        (NaN) are left out and the others reweighted, NaN if none is valid.
+        """
+        ny, nx = self.target.shape
+        fx = (x - self.x0) / self.resolution
+        fy = (y - self.y0) / self.resolution
+        if not (0.0 <= fx <= nx - 1 and 0.0 <= fy <= ny - 1):
+            return math.nan
+        j = min(int(fx), nx - 2) if nx > 1 else 0
+        i = min(int(fy), ny - 2) if ny > 1 else 0
+        tx, ty = fx - j, fy - i
+        total = weight = 0.0
+        for di, wy in ((0, 1.0 - ty), (1, ty)):
+            if wy == 0.0 or i + di >= ny:
+                continue
+            row = self.rows[i + di]
+            for dj, wx in ((0, 1.0 - tx), (1, tx)):
+                if wx == 0.0 or j + dj >= nx:
+                    continue
+                value = row[j + dj]
+                if value == value:  # not NaN
+                    total += wy * wx * value
+                    weight += wy * wx
+        return total / weight if weight > 0.0 else math.nan
+
+
+class BladeController(threading.Thread):
+    """
+    Blade control loop, in its own thread so its latency does not depend on the GUI.
+
+    The GPS receiver thread hands every fix to submit(); the loop takes the newest
+    one (older ones still queued are dropped), projects the blade position from the
+    antenna (offsets of 'implement', replace the attribute to change it, plus speed x
+    lookahead along the heading), samples the target snapshot there and sends an
+    up/down/hold command PGN to AgIO by UDP. The time from reception of the fix to
+    the command being sent is kept for the last LATENCY_WINDOW fixes (metrics()).
+    With no target every fix gets hold.
+    """
+
+    def __init__(self, endpoint=AGIO_ENDPOINT, implement=None, lookahead=BLADE_LOOKAHEAD, deadband=BLADE_DEADBAND):
+        super().__init__(daemon=True)
+        self.endpoint = endpoint
+        self.implement = implement if implement is not None else Implement()
+        self.lookahead = lookahead
+        self.deadband = deadband
+        self.surface = None
+        self.fixes = queue.SimpleQueue()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.latency_lock = threading.Lock()
+        self.last_command = None    # (command, error m, blade x, blade y) of the last fix
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.running = True
+
+    def set_surface(self, surface):
+        """Replace the target snapshot (None: hold)."""
+        self.surface = surface
+
+    def submit(self, gps_data):
+        """Queue a parsed fix (called from the receiver thread)."""
+        self.fixes.put(gps_data)
+
+    def run(self):
+        while self.running:
+            try:
+                gps_data = self.fixes.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            # Only the newest fix matters
+            while gps_data is not None:
+                try:
+                    gps_data = self.fixes.get_nowait()
+                except queue.Empty:
+                    break
+            if gps_data is None:
+                break
+            try:
+                self.process(gps_data)
+            except Exception as e:
+                print("BladeController error:", e)
+        self.sock.close()
+
+    def blade_position(self, gps_data, surface, implement):
+        """Blade centre in field coordinates for a fix, speed x lookahead ahead of it."""
+        matrix = surface.transform
+        lon, lat = gps_data["longitude"], gps_data["latitude"]
+        x = matrix[0][0] * lon + matrix[0][1] * lat + matrix[0][2]
+        y = matrix[1][0] * lon + matrix[1][1] * lat + matrix[1][2]
+        heading = float(choose_heading(gps_data["headingTrue"], gps_data["headingTrueDual"],
+                                       gps_data["imuHeading"] / 10)) - surface.rotation_deg
+        return implement.blade_position(x, y, heading, ahead=gps_data["speed"] / 3.6 * self.lookahead)
+
+    def process(self, gps_data):
+        surface, implement = self.surface, self.implement
+        command, error = COMMAND_HOLD, math.nan
+        blade_x = blade_y = math.nan
+        if surface is not None:
+            blade_x, blade_y = self.blade_position(gps_data, surface, implement)
+            target = surface.sample(blade_x, blade_y)
+            blade_z = gps_data["altitudeFiltered"] - surface.ref_alt - implement.antenna_height
+            error = blade_z - target
+            if error > self.deadband:
+                command = COMMAND_DOWN
+            elif error < -self.deadband:
+                command = COMMAND_UP
+        received = gps_data.get("recvTime", time.monotonic())
+        self.sock.sendto(blade_pgn(command, error, time.monotonic() - received), self.endpoint)
+        latency = time.monotonic() - received
+        with self.latency_lock:
+            self.latencies.append(latency)
+        self.last_command = (command, error, blade_x, blade_y)
+
+    def metrics(self):
+        """p50 and p99 fix to command latency (s) over the last fixes, and their count."""
+        with self.latency_lock:
+            latencies = np.array(self.latencies)
+        if not len(latencies):
+            return None
+        p50, p99 = np.percentile(latencies, [50, 99])
+        return {"p50": float(p50), "p99": float(p99), "count": len(latencies)}
+
+    def stop(self):
+        self.running = False
+        self.fixes.put(None)
+        if self.is_alive():
+            self.join()
+
+
+class UdpSink(threading.Thread):
+    """Local stand-in for AgIO / the blade hardware: collects the command PGNs sent to it."""
+
+    def __init__(self, endpoint=("127.0.0.1", 0)):
+        super().__init__(daemon=True)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(endpoint)
+        self.sock.settimeout(0.2)
+        self.endpoint = self.sock.getsockname()
+        self.commands = []
+        self.running = True
+
+    def run(self):
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(64)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            parsed = parse_blade_pgn(data)
+            if parsed is not None:
+                parsed["recvTime"] = time.monotonic()
+                self.commands.append(parsed)
+        self.sock.close()
+
+    def stop(self):
+        self.running = False
+        self.join()
+
+
+def _benchmark(n_fixes=2000, rate=100.0, size=1000):
+    """Fixes at 'rate' Hz through the controller into a UdpSink, with a busy thread competing for the CPU."""
+    grid_x, grid_y = np.meshgrid(np.arange(size) * 0.5, np.arange(size) * 0.5)
+    target = 0.001 * grid_x
+    # 1 degree ~ 111 km: a transform from (lon, lat) straight to metres around (0, 0)
+    transform = [[111000.0, 0.0, 0.0], [0.0, 111000.0, 0.0]]
+    surface = TargetSurface(grid_x, grid_y, target, transform, ref_alt=100.0, rotation_deg=0.0)
+    sink = UdpSink()
+    sink.start()
+    controller = BladeController(endpoint=sink.endpoint)
+    controller.set_surface(surface)
+    controller.start()
+
+    busy = [True]
+
+    def gui_load():
+        while busy[0]:
+            sum(k * k for k in range(20000))
+
+    load = threading.Thread(target=gui_load, daemon=True)
+    load.start()
+    rng = np.random.default_rng(0)
+    for k in range(n_fixes):
+        controller.submit({
+            "longitude": (10 + k * 0.05) / 111000.0, "latitude": 250 / 111000.0,
+            "headingTrue": 90.0, "headingTrueDual": 0.0, "imuHeading": 900, "speed": 5.0,
+            "altitudeFiltered": 100.0 + 0.001 * (10 + k * 0.05) + rng.normal(0, 0.03),
+            "recvTime": time.monotonic(),
+        })
+        time.sleep(1.0 / rate)
+    time.sleep(0.2)
+    busy[0] = False
+    metrics = controller.metrics()
+    controller.stop()
+    sink.stop()
+    counts = np.bincount([c["command"] for c in sink.commands], minlength=3)
+    print(f"{n_fixes} fixes -> {len(sink.commands)} commands (hold {counts[0]}, up {counts[1]}, down {counts[2]}), "
+          f"latency p50 {metrics['p50'] * 1000:.2f} ms, p99 {metrics['p99'] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,182 @@
+# contours.py
+import math
+import numpy as np
+
+CONTOUR_TILE = 64               # squares per tile side
+MAX_CONTOUR_CELLS = 250000      # squares contoured at most, larger grids are sampled with a stride
+MAX_CONTOUR_SEGMENTS = 30000    # segments drawn at most, the stride is doubled until they fit
+MAX_LEVEL_SETS = 4              # level sets kept in the cache, the oldest is dropped
+
+# Marching squares: corner bits a (i, j) = 1, b (i, j+1) = 2, c (i+1, j+1) = 4, d (i+1, j) = 8 set when
+# above the level; edges 0 a-b, 1 b-c, 2 d-c, 3 a-d. Up to two segments (pairs of edges) per case;
+# cases 16 and 17 are the saddles 5 and 10 with the centre below the level.
+_SEGMENTS = np.full((18, 2, 2), -1, dtype=np.intp)
+for _case, _pairs in {1: [(0, 3)], 2: [(0, 1)], 3: [(1, 3)], 4: [(1, 2)], 5: [(0, 1), (2, 3)],
+                      6: [(0, 2)], 7: [(2, 3)], 8: [(2, 3)], 9: [(0, 2)], 10: [(0, 3), (1, 2)],
+                      11: [(1, 2)], 12: [(1, 3)], 13: [(0, 1)], 14: [(0, 3)],
+                      16: [(0, 3), (1, 2)], 17: [(0, 1), (2, 3)]}.items():
+    _SEGMENTS[_case, :len(_pairs)] = _pairs
+# Corner offsets (di, dj) of the two ends of every edge
+_EDGE_FROM = np.array([(0, 0), (0, 1), (1, 0), (0, 0)])
+_EDGE_TO = np.array([(0, 1), (1, 1), (1, 1), (1, 0)])
+
+
+def marching_squares(grid, levels):
+    """
+    Isolines of a grid at the given levels, all squares and levels at once.
+    Returns an (n, 4) array of segments (x1, y1, x2, y2) in cell units (x = column,
+    y = row); squares with a NaN corner are skipped.
+    """
+    if grid.shape[0] < 2 or grid.shape[1] < 2 or not len(levels):
+        return np.empty((0, 4))
+    a, b = grid[:-1, :-1], grid[:-1, 1:]
+    c, d = grid[1:, 1:], grid[1:, :-1]
+    valid = ~(np.isnan(a) | np.isnan(b) | np.isnan(c) | np.isnan(d))
+    low = np.fmin(np.fmin(a, b), np.fmin(c, d))
+    high = np.fmax(np.fmax(a, b), np.fmax(c, d))
+    segments = []
+    for level in levels:
+        i, j = np.nonzero(valid & (low <= level) & (high > level))
+        if not len(i):
+            continue
+        va, vb, vc, vd = grid[i, j], grid[i, j + 1], grid[i + 1, j + 1], grid[i + 1, j]
+        case = (va > level) * 1 + (vb > level) * 2 + (vc > level) * 4 + (vd > level) * 8
+        centre_below = (va + vb + vc + vd) / 4 <= level
+        case[(case == 5) & centre_below] = 16
+        case[(case == 10) & centre_below] = 17
+        for slot in range(2):
+            edges = _SEGMENTS[case, slot]
+            used = edges[:, 0] >= 0
+            if not used.any():
+                continue
+            ends = [_edge_point(grid, i[used], j[used], edges[used, k], level) for k in range(2)]
+            segments.append(np.column_stack(ends[0] + ends[1]))
+    return np.concatenate(segments) if segments else np.empty((0, 4))
+
+
+def _edge_point(grid, i, j, edge, level):
+    """Point where the level crosses the given edge of the squares (i, j), linearly interpolated."""
+    i0, j0 = i + _EDGE_FROM[edge, 0], j + _EDGE_FROM[edge, 1]
+    i1, j1 = i + _EDGE_TO[edge, 0], j + _EDGE_TO[edge, 1]
+    v0, v1 = grid[i0, j0], grid[i1, j1]
+    t = (level - v0) / (v1 - v0)
+    return j0 + t * (j1 - j0), i0 + t * (i1 - i0)
+
+
+def contour_levels(grid, interval):
+    """Multiples of interval spanning the values of the grid."""
+    low, high = np.nanmin(grid), np.nanmax(grid)
+    if not np.isfinite(low) or interval <= 0:
+        return ()
+    first, last = math.ceil(low / interval), math.floor(high / interval)
+    return tuple(round(k * interval, 9) for k in range(first, last + 1))
+
+
+class ContourLayer:
+    """
+    Isolines of a grid kept up to date cheaply. The grid is read through 'source'
+    (a function of a (rows, cols) pair of slices returning that block, so it can be
+    a difference of two grids); isolines are computed by tiles of CONTOUR_TILE
+    squares and cached per level set and stride. mark_dirty() drops the tiles of a
+    region of changed cells, invalidate() all of them; segments() recomputes only
+    the missing tiles.
+
+    Grids larger than MAX_CONTOUR_CELLS are contoured on every stride-th cell, and
+    the stride is doubled while there are more than MAX_CONTOUR_SEGMENTS segments,
+    which bounds what is drawn however large or rough the grid.
+    """
+
+    def __init__(self, tile=CONTOUR_TILE, max_cells=MAX_CONTOUR_CELLS, max_segments=MAX_CONTOUR_SEGMENTS):
+        self.tile = tile
+        self.max_cells = max_cells
+        self.max_segments = max_segments
+        self.source = None
+        self.shape = None
+        self.x0 = self.y0 = 0.0
+        self.resolution = 1.0
+        self.levels = ()
+        self.cache = {}     # (levels, stride) -> {(tile row, tile col): segments in grid units}
+
+    def set_source(self, source, shape, x0, y0, resolution, levels):
+        """Grid to contour; the cache is kept only if the geometry is the same (call invalidate() if the values changed)."""
+        geometry = (shape, x0, y0, resolution)
+        if geometry != (self.shape, self.x0, self.y0, self.resolution):
+            self.cache = {}
+        self.source = source
+        self.shape, self.x0, self.y0, self.resolution = geometry
+        self.levels = tuple(levels)
+        level_sets = list(dict.fromkeys(levels for levels, _ in self.cache))
+        for old in level_sets[:max(0, len(level_sets) - MAX_LEVEL_SETS)]:
+            for key in [key for key in self.cache if key[0] == old]:
+                del self.cache[key]
+
+    def invalidate(self):
+        self.cache = {}
+
+    def mark_dirty(self, i_min, i_max, j_min, j_max):
+        """Drop the cached tiles touching the cells [i_min, i_max) x [j_min, j_max)."""
+        for (levels, stride), tiles in self.cache.items():
+            span = self.tile * stride
+            # A cell is a corner of the squares of the row/column before it too
+            rows = range(max(i_min - 1, 0) // span, (i_max - 1) // span + 1)
+            cols = range(max(j_min - 1, 0) // span, (j_max - 1) // span + 1)
+            for key in [(r, c) for r in rows for c in cols]:
+                tiles.pop(key, None)
+
+    def segments(self):
+        """All the segments (n, 4) as x1, y1, x2, y2 in field coordinates."""
+        if self.source is None or not self.levels:
+            return np.empty((0, 4))
+        ny, nx = self.shape
+        stride = max(1, math.ceil(math.sqrt(ny * nx / self.max_cells)))
+        while True:
+            segments = self._segments(stride)
+            if len(segments) <= self.max_segments or stride >= max(ny, nx):
+                break
+            stride *= 2
+        return np.column_stack((self.x0 + segments[:, 0] * self.resolution, self.y0 + segments[:, 1] * self.resolution,
+                                self.x0 + segments[:, 2] * self.resolution, self.y0 + segments[:, 3] * self.resolution))
+
+    def _segments(self, stride):
+        """Segments at a stride in grid units, computing the tiles not cached."""
+        tiles = self.cache.setdefault((self.levels, stride), {})
+        ny, nx = self.shape
+        span = self.tile * stride
+        for r in range(math.ceil(max(ny - 1, 1) / span)):
+            for c in range(math.ceil(max(nx - 1, 1) / span)):
+                if (r, c) in tiles:
+                    continue
+                # Tile corners, one more sample than squares; sampled on the stride
+                rows = slice(r * span, min((r + 1) * span + 1, ny), stride)
+                cols = slice(c * span, min((c + 1) * span + 1, nx), stride)
+                block = np.asarray(self.source(rows, cols), dtype=float)
+                segments = marching_squares(block, self.levels) * stride
+                segments[:, [0, 2]] += c * span
+                segments[:, [1, 3]] += r * span
+                tiles[(r, c)] = segments
+        parts = [segments for segments in tiles.values() if len(segments)]
+        return np.concatenate(parts) if parts else np.empty((0, 4))
+
+
+def _benchmark(size=2000, interval=0.05):
+    """Full contouring of a size x size grid, then the update after a blade pass."""
+    import time
+    rng = np.random.default_rng(0)
+    grid_x, grid_y = np.meshgrid(np.arange(size, dtype=float), np.arange(size, dtype=float))
+    grid_z = 0.5 * np.sin(grid_x / 150) * np.cos(grid_y / 120) + rng.normal(0, 0.005, grid_x.shape)
+    layer = ContourLayer()
+    layer.set_source(lambda rows, cols: grid_z[rows, cols], grid_z.shape, 0.0, 0.0, 1.0,
+                     contour_levels(grid_z, interval))
+    start = time.perf_counter()
+    segments = layer.segments()
+    full = time.perf_counter() - start
+    grid_z[1000:1005, 1000:1005] += 0.1
+    layer.mark_dirty(1000, 1005, 1000, 1005)
+    start = time.perf_counter()
+    layer.segments()
+    print(f"{grid_z.size} cells, {len(layer.levels)} levels: {len(segments)} segments in {full:.2f} s, "
+          f"update after a blade pass {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,259 @@
+# design_surface.py
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+from scipy.spatial import ConvexHull, QhullError
+from raster_pyramid import RasterPyramid
+
+DIRECT_CELLS = 60000  # larger designs are solved through a reduced LP (see _solve_large)
+
+
+def block_zones(valid, n_cols, n_rows):
+    """Zone raster splitting the valid cells into n_cols x n_rows blocks of equal size (-1 outside)."""
+    rows = np.flatnonzero(valid.any(axis=1))
+    cols = np.flatnonzero(valid.any(axis=0))
+    zones = np.full(valid.shape, -1, dtype=int)
+    if not rows.size:
+        return zones
+    i = np.arange(valid.shape[0])
+    j = np.arange(valid.shape[1])
+    zone_row = np.clip((i - rows[0]) * n_rows // (rows[-1] - rows[0] + 1), 0, n_rows - 1)
+    zone_col = np.clip((j - cols[0]) * n_cols // (cols[-1] - cols[0] + 1), 0, n_cols - 1)
+    zones[...] = zone_row[:, None] * n_cols + zone_col[None, :]
+    zones[~valid] = -1
+    return zones
+
+
+def _boundary_points(grid_x, grid_y, zones):
+    """
+    Points on the borders between zones (midpoints of neighbouring cells in different
+    zones), keeping only the convex hull of each border: the plane difference is
+    linear, so it is largest at those points.
+    """
+    pairs = {}
+    for axis in (0, 1):
+        a = [slice(None), slice(None)]
+        b = [slice(None), slice(None)]
+        a[axis], b[axis] = slice(None, -1), slice(1, None)
+        za, zb = zones[tuple(a)], zones[tuple(b)]
+        border = (za >= 0) & (zb >= 0) & (za != zb)
+        mx = (grid_x[tuple(a)] + grid_x[tuple(b)])[border] / 2
+        my = (grid_y[tuple(a)] + grid_y[tuple(b)])[border] / 2
+        for p, q, x, y in zip(za[border], zb[border], mx, my):
+            pairs.setdefault((min(p, q), max(p, q)), []).append((x, y))
+    result = []
+    for (p, q), pts in pairs.items():
+        pts = np.unique(np.array(pts), axis=0)
+        if len(pts) > 3:
+            try:
+                pts = pts[ConvexHull(pts).vertices]
+            except QhullError:   # all on a line: its two ends
+                order = np.lexsort((pts[:, 1], pts[:, 0]))
+                pts = pts[[order[0], order[-1]]]
+        result.extend((p, q, x, y) for x, y in pts)
+    return result
+
+
+def _solve_dual(A, z, G, h, balance_row, fixed_rhs=None, weights=None, balance_bound=None):
+    """
+    Plane parameters minimizing sum w |z - A theta| subject to G theta <= h and the
+    balance row (an equality, or a penalty balance_bound * |Z - g theta| when
+    balance_bound is given), through the LP dual:
+        max z.l - mu Z - h.nu   s.t.  A^T l - mu g - G^T nu = -fixed_rhs,  |l| <= w, nu >= 0
+    fixed_rhs is the contribution of cells whose residual sign is fixed (see _solve_large).
+    The parameters are the multipliers of the equality rows. None if not feasible.
+    """
+    n = A.shape[0]
+    n_mu = 0 if balance_row is None else 1
+    blocks = [A.T.tocsr() if sp.issparse(A) else sp.csr_matrix(A.T)]
+    cost = [-z]
+    if balance_row is not None:
+        blocks.append(sp.csr_matrix(-balance_row[0].reshape(-1, 1)))
+        cost.append([balance_row[1]])
+    blocks.append(-G.T.tocsr())
+    cost.append(h)
+    A_eq = sp.hstack(blocks, format="csr")
+    cost = np.concatenate(cost)
+    bounds = np.empty((len(cost), 2))
+    w = 1.0 if weights is None else weights
+    bounds[:n, 0], bounds[:n, 1] = -w, w
+    mu = np.inf if balance_bound is None else balance_bound
+    bounds[n:n + n_mu] = (-mu, mu)
+    bounds[n + n_mu:] = (0.0, np.inf)
+    b_eq = np.zeros(A.shape[1]) if fixed_rhs is None else -fixed_rhs
+    result = linprog(cost, A_eq=A_eq, b_eq=b_eq, bounds=bounds, method="highs")
+    if result.status != 0:
+        return None
+    return -result.eqlin.marginals
+
+
+def _solve_sample(A, z, G, h, balance_row, zone_index, n_zones, sample_size=20000):
+    """First design from a random sample of cells: proportional to the zone size, but a few hundred cells at least per zone."""
+    n = A.shape[0]
+    rng = np.random.default_rng(0)
+    counts = np.bincount(zone_index, minlength=n_zones)
+    order = rng.permutation(n)
+    rank_in_zone = np.empty(n, dtype=int)
+    for k in range(n_zones):
+        members = order[zone_index[order] == k]
+        rank_in_zone[members] = np.arange(len(members))
+    quota = np.maximum(counts * sample_size // n, np.minimum(counts, 500))
+    sample = np.flatnonzero(rank_in_zone < quota[zone_index])
+    return _solve_dual(A[sample], z[sample], G, h, balance_row)
+
+
+def _solve_large(A, z, G, h, balance_row, theta, near_size=50000, balance_bound=None, weights=None):
+    """
+    Same result as _solve_dual on all the cells, for large grids (Portnoy-Koenker
+    preprocessing), starting from a first design theta (None: solve all the cells).
+    The cells far from it will be cut (or filled) in the optimum too, so their residual
+    sign is fixed and they only enter through their sums, and the LP is solved over
+    the near_size cells closest to the design. If some fixed signs turn out wrong, the
+    near set is taken again around the new solution, larger by twice the wrong cells
+    (doubled after a few rounds); when no sign is wrong the solution is exact.
+    """
+    n = A.shape[0]
+    w = np.ones(n) if weights is None else weights
+    rounds = 0
+    while theta is not None and near_size < n:
+        residual = z - A @ theta
+        near = np.argpartition(np.abs(residual), near_size)[:near_size]
+        fixed = np.ones(n, dtype=bool)
+        fixed[near] = False
+        signs = np.sign(residual) * fixed
+        candidate = _solve_dual(A[near], z[near], G, h, balance_row, fixed_rhs=A.T @ (w * signs),
+                                weights=w[near], balance_bound=balance_bound)
+        rounds += 1
+        if candidate is None:
+            near_size *= 2
+            continue
+        new_signs = np.sign(z - A @ candidate)
+        wrong = np.count_nonzero(fixed & (new_signs != signs) & (new_signs != 0))
+        if not wrong:
+            return candidate
+        theta = candidate
+        near_size = near_size * 2 if rounds >= 4 else near_size + 2 * wrong
+    return _solve_dual(A, z, G, h, balance_row, weights=weights, balance_bound=balance_bound)
+
+
+def best_plane(grid_x, grid_y, grid_z, balance_weight=0.5, coarse_cells=4000, near_cells=20000):
+    """
+    Plane (a, b, c) minimizing cut + fill + balance_weight * |cut - fill| over the grid
+    cells, i.e. sum |r| + balance_weight * |sum r| with r = z - (a + b*x + c*y), the
+    objective of leveling.compute_best_plane, solved exactly and coarse to fine:
+    a first plane from the block means of the finest pyramid level with at most
+    coarse_cells cells (weighted by the cells they cover), then on every finer level
+    down to the full grid the LP restricted to the near_cells cells closest to the
+    plane of the level above (_solve_large). Every level is checked against the sign
+    of all its residuals, so the last plane is the exact full resolution optimum.
+    """
+    valid = ~np.isnan(grid_z)
+    x, y, z = grid_x[valid], grid_y[valid], grid_z[valid]
+    n = len(z)
+    if n < 3:
+        raise ValueError("not enough cells")
+    no_constraints = sp.csr_matrix((0, 3))
+    A = np.column_stack((np.ones(n), x, y))   # dense: three columns, only subsets go to the LP
+    balance_row = (np.array([n, x.sum(), y.sum()]), z.sum())
+
+    theta = None
+    if n > near_cells:
+        heights = RasterPyramid(grid_z)
+        xs = RasterPyramid(np.where(valid, grid_x, np.nan))
+        ys = RasterPyramid(np.where(valid, grid_y, np.nan))
+        top = next(level for level in range(heights.num_levels)
+                   if np.count_nonzero(heights.counts[level]) <= coarse_cells)
+        for level in range(top, 0, -1):
+            counts = heights.counts[level]
+            cells = counts > 0
+            w = counts[cells].astype(float)
+            xc, yc, zc = xs.level(level)[cells], ys.level(level)[cells], heights.level(level)[cells]
+            Ac = np.column_stack((np.ones(len(zc)), xc, yc))
+            level_balance = (np.array([w.sum(), w @ xc, w @ yc]), w @ zc)
+            theta = _solve_large(Ac, zc, no_constraints, np.empty(0), level_balance, theta,
+                                 near_size=near_cells, balance_bound=balance_weight, weights=w)
+    theta = _solve_large(A, z, no_constraints, np.empty(0), balance_row, theta,
+                         near_size=near_cells, balance_bound=balance_weight)
+    if theta is None:
+        raise ValueError("plane not found")
+    return tuple(float(v) for v in theta)
+
+
+def solve_zone_design(grid_x, grid_y, grid_z, zones, max_step=0.0, slope_bounds=None, balance=True):
+    """
+    Best multi-zone design surface: one plane a + b*x + c*y per zone of the label raster
+    'zones' (-1 = not designed), minimizing the total cut + fill over the cells.
+
+    max_step: largest height step (m) allowed between the planes of adjacent zones along
+    their border (0 = continuous, None = independent zones).
+    slope_bounds: (b_min, b_max, c_min, c_max) in m/m for every zone, or a dict
+    zone -> bounds; None values are unbounded.
+    balance: cut and fill volumes equal.
+
+    Solved as one sparse LP with HiGHS, through its dual: one bounded variable per cell
+    and only three equality rows per zone, which is much faster than the primal with
+    its two slack variables and one row per cell. Large grids only put the cells near
+    the optimal surface in the LP (_solve_large).
+    Returns (planes, target): dict zone -> (a, b, c) and the target raster (NaN outside).
+    """
+    valid = (zones >= 0) & ~np.isnan(grid_z)
+    labels = np.unique(zones[valid])
+    if not labels.size:
+        raise ValueError("no cells to design")
+    column = {label: k for k, label in enumerate(labels)}
+    n_vars = 3 * len(labels)
+
+    # Cells: rows of the primal A theta = z
+    zone_index = np.searchsorted(labels, zones[valid])
+    x, y, z = grid_x[valid], grid_y[valid], grid_z[valid]
+    n = len(z)
+    cells = np.arange(n)
+    A = sp.csr_matrix((np.concatenate((np.ones(n), x, y)),
+                       (np.tile(cells, 3), np.concatenate((3 * zone_index, 3 * zone_index + 1, 3 * zone_index + 2)))),
+                      shape=(n, n_vars))
+
+    # Inequalities G theta <= h: steps at the zone borders and slope bounds
+    g_rows, g_cols, g_vals, h = [], [], [], []
+    def add_row(entries, bound):
+        row = len(h)
+        for col, val in entries:
+            g_rows.append(row)
+            g_cols.append(col)
+            g_vals.append(val)
+        h.append(bound)
+
+    if max_step is not None:
+        for p, q, bx, by in _boundary_points(grid_x, grid_y, np.where(valid, zones, -1)):
+            cp, cq = 3 * column[p], 3 * column[q]
+            diff = [(cp, 1.0), (cp + 1, bx), (cp + 2, by), (cq, -1.0), (cq + 1, -bx), (cq + 2, -by)]
+            add_row(diff, max_step)
+            add_row([(col, -val) for col, val in diff], max_step)
+    for label in labels:
+        bounds = slope_bounds.get(label) if isinstance(slope_bounds, dict) else slope_bounds
+        if bounds is None:
+            continue
+        base = 3 * column[label]
+        for offset, low, high in ((1, bounds[0], bounds[1]), (2, bounds[2], bounds[3])):
+            if high is not None:
+                add_row([(base + offset, 1.0)], high)
+            if low is not None:
+                add_row([(base + offset, -1.0)], -low)
+    G = sp.csr_matrix((g_vals, (g_rows, g_cols)), shape=(len(h), n_vars))
+    h = np.array(h, dtype=float)
+
+    # Balance: sum(z - A theta) = 0  <=>  (A^T 1) theta = sum(z)
+    balance_row = (np.asarray(A.sum(axis=0)).ravel(), z.sum()) if balance else None
+
+    if n <= DIRECT_CELLS:
+        theta = _solve_dual(A, z, G, h, balance_row)
+    else:
+        theta = _solve_sample(A, z, G, h, balance_row, zone_index, len(labels))
+        theta = _solve_large(A, z, G, h, balance_row, theta)
+    if theta is None:
+        raise ValueError("design not feasible")
+
+    planes = {int(label): tuple(float(v) for v in theta[3 * k:3 * k + 3]) for k, label in enumerate(labels)}
+    target = np.full(grid_z.shape, np.nan)
+    coeffs = theta.reshape(-1, 3)[zone_index]
+    target[valid] = coeffs[:, 0] + coeffs[:, 1] * x + coeffs[:, 2] * y
+    return planes, target
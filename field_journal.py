@@ -0,0 +1,269 @@
+# field_journal.py
+import os
+import time
+import queue
+import struct
+import threading
+import zlib
+import numpy as np
+
+JOURNAL_MAGIC = b"AGLJ"
+JOURNAL_VERSION = 2         # 2: grid writes carry their variance and time
+HEADER_FMT = "<4sBQ"        # magic, version, generation
+FRAME_FMT = "<BI"           # record type, payload length
+CRC_FMT = "<I"
+
+# Record types
+REC_POINT = 1               # survey fix: lat, lon, alt
+REC_CELLS = 2               # grid cells written under the blade: value, variance, time, count, flat indices
+REC_OFFSET = 3              # vertical offset applied to the whole grid
+
+JOURNAL_FILE = "journal.bin"
+SNAPSHOT_FILE = "snapshot.npz"
+CLEAN_FILE = "clean"
+
+_STOP = object()
+
+
+def _fsync_dir(directory):
+    """Make renames durable where the platform allows it."""
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _frame(rec_type, payload):
+    head = struct.pack(FRAME_FMT, rec_type, len(payload))
+    crc = zlib.crc32(payload, zlib.crc32(head[:1]))
+    return head + payload + struct.pack(CRC_FMT, crc)
+
+
+def read_journal(filename):
+    """
+    Read a journal file. Returns (generation, records) with records a list of
+    (type, payload). Reading stops at the first torn or corrupted record
+    (e.g. power loss during a write); generation is None if the file is not a journal.
+    """
+    with open(filename, "rb") as f:
+        data = f.read()
+    header_size = struct.calcsize(HEADER_FMT)
+    if len(data) < header_size:
+        return None, []
+    magic, version, generation = struct.unpack_from(HEADER_FMT, data, 0)
+    if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+        return None, []
+
+    records = []
+    frame_size = struct.calcsize(FRAME_FMT)
+    crc_size = struct.calcsize(CRC_FMT)
+    pos = header_size
+    while pos + frame_size <= len(data):
+        rec_type, length = struct.unpack_from(FRAME_FMT, data, pos)
+        end = pos + frame_size + length
+        if end + crc_size > len(data):
+            break
+        payload = data[pos + frame_size:end]
+        (crc,) = struct.unpack_from(CRC_FMT, data, end)
+        if crc != zlib.crc32(payload, zlib.crc32(data[pos:pos + 1])):
+            break
+        records.append((rec_type, payload))
+        pos = end + crc_size
+    return generation, records
+
+
+class FieldJournal:
+    """
+    Crash-safe autosave of the field being worked on.
+
+    Every survey fix and every grid edit is appended to 'journal.bin' as a small
+    binary record. Periodically the whole model is written to 'snapshot.npz' and a
+    new, empty journal is started (compaction). Files are written by a background
+    thread, fsync'ed at most every 'fsync_interval' seconds, so the GUI thread only
+    pays for packing the record.
+    """
+
+    def __init__(self, directory, fsync_interval=1.0, compact_every=20000):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self.field_model = None
+        self.generation = 0
+        self.records_since_snapshot = 0
+        self.queue = queue.Queue()
+        self.thread = None
+        self.file = None
+
+    @staticmethod
+    def has_recovery(directory):
+        """True if a session in 'directory' was not closed cleanly."""
+        return (os.path.exists(os.path.join(directory, SNAPSHOT_FILE))
+                and not os.path.exists(os.path.join(directory, CLEAN_FILE)))
+
+    @staticmethod
+    def recover(directory, field_model):
+        """Load the last snapshot into field_model and replay the journal written after it."""
+        snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        journal_path = os.path.join(directory, JOURNAL_FILE)
+        if not os.path.exists(snapshot_path):
+            return False
+
+        journal = field_model.journal
+        field_model.journal = None  # do not journal the replay itself
+        try:
+            with np.load(snapshot_path) as data:
+                state = {key: data[key] for key in data.files}
+            field_model.set_state(state)
+            generation = int(state["generation"])
+
+            if not os.path.exists(journal_path):
+                return True
+            journal_generation, records = read_journal(journal_path)
+            if journal_generation != generation:
+                # Journal belongs to an older snapshot, everything in it is already included
+                return True
+
+            for rec_type, payload in records:
+                if rec_type == REC_POINT:
+                    lat, lon, alt = struct.unpack("<ddd", payload)
+                    field_model.add_point({"latitude": lat, "longitude": lon, "altitude": alt})
+                elif rec_type == REC_CELLS:
+                    value, variance, when, n = struct.unpack_from("<dddI", payload, 0)
+                    idx = np.frombuffer(payload, dtype="<u4", count=n, offset=struct.calcsize("<dddI"))
+                    if field_model.grid_z is not None:
+                        field_model.write_cells(idx, value, variance, when)
+                elif rec_type == REC_OFFSET:
+                    (offset,) = struct.unpack("<d", payload)
+                    field_model.apply_vertical_offset_grid(offset)
+                    field_model.vertical_offset += offset
+                    field_model.vertical_offset_old += offset
+            print(f"Journal recovered: {len(field_model.points)} points, {len(records)} records replayed")
+            return True
+        finally:
+            field_model.journal = journal
+
+    def start(self, field_model):
+        """Begin journaling field_model, starting from a snapshot of its current state."""
+        os.makedirs(self.directory, exist_ok=True)
+        clean_path = os.path.join(self.directory, CLEAN_FILE)
+        if os.path.exists(clean_path):
+            os.remove(clean_path)
+        self.field_model = field_model
+        field_model.journal = self
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with np.load(snapshot_path) as data:
+                self.generation = int(data["generation"]) if "generation" in data.files else 0
+        self.thread = threading.Thread(target=self._run, name="FieldJournal", daemon=True)
+        self.thread.start()
+        self.compact()
+
+    def log_point(self, lat, lon, alt):
+        self._append(REC_POINT, struct.pack("<ddd", lat, lon, alt))
+
+    def log_cells(self, flat_indices, value, variance, when):
+        # The time is replayed too: the weight a cell keeps depends on it
+        idx = np.asarray(flat_indices, dtype="<u4")
+        self._append(REC_CELLS, struct.pack("<dddI", value, variance, when, idx.size) + idx.tobytes())
+
+    def log_offset(self, offset):
+        self._append(REC_OFFSET, struct.pack("<d", offset))
+
+    def compact(self):
+        """Queue a snapshot of the model; the journal restarts empty after it."""
+        if self.thread is None:
+            return
+        self.generation += 1
+        state = self.field_model.get_state()
+        state["generation"] = np.array(self.generation)
+        self.records_since_snapshot = 0
+        self.queue.put(("snapshot", state, self.generation))
+
+    def close(self):
+        """Flush everything, write a final snapshot and mark the session as cleanly closed."""
+        if self.thread is None:
+            return
+        self.compact()
+        self.queue.put(_STOP)
+        self.thread.join()
+        self.thread = None
+        with open(os.path.join(self.directory, CLEAN_FILE), "w") as f:
+            f.write("ok")
+        if self.field_model is not None and self.field_model.journal is self:
+            self.field_model.journal = None
+
+    def _append(self, rec_type, payload):
+        if self.thread is None:
+            return
+        self.queue.put(_frame(rec_type, payload))
+        self.records_since_snapshot += 1
+        if self.records_since_snapshot >= self.compact_every:
+            self.compact()
+
+    def _run(self):
+        """Writer thread: append records, write snapshots, fsync with bounded cadence."""
+        last_sync = time.monotonic()
+        dirty = False
+        while True:
+            timeout = max(0.0, self.fsync_interval - (time.monotonic() - last_sync)) if dirty else None
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                break
+            if isinstance(item, bytes):
+                if self.file is not None:
+                    self.file.write(item)
+                    dirty = True
+            elif item is not None:
+                _, state, generation = item
+                try:
+                    self._write_snapshot(state, generation)
+                except OSError as e:
+                    print("FieldJournal error:", e)
+                dirty = False
+                last_sync = time.monotonic()
+
+            if dirty and time.monotonic() - last_sync >= self.fsync_interval:
+                try:
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                except OSError as e:
+                    print("FieldJournal error:", e)
+                dirty = False
+                last_sync = time.monotonic()
+
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
+
+    def _write_snapshot(self, state, generation):
+        # 1) snapshot, written aside and atomically renamed
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp_path = snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **state)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, snapshot_path)
+
+        # 2) new empty journal tagged with the snapshot generation. If we crash before this
+        #    point the old journal has an older generation and is ignored at recovery.
+        if self.file is not None:
+            self.file.close()
+        journal_path = os.path.join(self.directory, JOURNAL_FILE)
+        tmp_path = journal_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack(HEADER_FMT, JOURNAL_MAGIC, JOURNAL_VERSION, generation))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, journal_path)
+        _fsync_dir(self.directory)
+        self.file = open(journal_path, "ab")
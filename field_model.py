@@ -1,8 +1,53 @@
 # field_model.py
 import math
 import json
+import time
 import numpy as np
-from scipy.interpolate import griddata
+from scipy import ndimage
+from spatial_index import PointIndex
+from survey_tin import SurveyTriangulator
+from grid_stats import AccumulationGrid, PlaneFitSums
+from tiled_grid import interpolate_grid
+from implement import Implement
+from grid_conditioning import condition_grid, SMOOTH_SIGMA, MAX_FILL_DISTANCE
+
+# Variance (m²) given to interpolated survey cells before the first blade pass,
+# also used for grid writes without a variance
+SURVEY_CELL_VARIANCE = 0.05**2
+# Variance (m²) added per second to the height of a cell since its last write: the
+# terrain is being moved, so a fresh blade pass outweighs what the cell held before
+GRID_PROCESS_NOISE = 0.05**2
+
+# Field outline used for the leveling grid
+HULL_EDGE_PERCENTILE = 90   # triangles with a longer max edge are outside the field
+MAX_HOLE_AREA = 25.0        # m², larger holes in the survey are filled in
+FIELD_BUFFER = 5.0          # m, the grid extends this far from the surveyed area
+
+
+def field_mask_from_cells(inside, resolution):
+    """
+    Turn the cells covered by survey triangles into the field mask: keep the largest
+    connected area, fill holes larger than MAX_HOLE_AREA and grow it by FIELD_BUFFER.
+    """
+    labels, n = ndimage.label(inside)
+    if n == 0:
+        return inside
+    sizes = ndimage.sum(inside, labels, index=np.arange(1, n + 1))
+    field = labels == (np.argmax(sizes) + 1)
+
+    holes = ndimage.binary_fill_holes(field) & ~field
+    hole_labels, n_holes = ndimage.label(holes)
+    if n_holes:
+        hole_areas = ndimage.sum(holes, hole_labels, index=np.arange(1, n_holes + 1)) * resolution**2
+        field |= np.isin(hole_labels, np.flatnonzero(hole_areas >= MAX_HOLE_AREA) + 1)
+
+    distance = ndimage.distance_transform_edt(~field) * resolution
+    return distance <= FIELD_BUFFER
+
+def choose_heading(heading_true, heading_dual, heading_imu):
+    """Single antenna heading, else dual antenna heading, else IMU heading (degrees, arrays or scalars)."""
+    return np.where((heading_true > 0) & (heading_true < 360), heading_true,
+                    np.where((heading_dual > 0) & (heading_dual < 360), heading_dual, heading_imu))
 
 class FieldModel:
     def __init__(self):
@@ -20,10 +65,31 @@ class FieldModel:
         self.grid_x = None
         self.grid_y = None
         self.grid_z = None
+        self.grid_stats = None  # Running per-cell statistics, grid_z is their mean
+        self.plane_sums = None  # Running least squares sums of the valid cells (PlaneFitSums)
         self.grid_resolution = 1.0  # Default grid resolution in meters
         self.rotation_angle = 0.0  # new field for storing rotation in radians
         self.vertical_offset = 0.0 # Vertical offset for leveling
         self.vertical_offset_old = 0.0 # Old vertical offset for leveling
+        self.last_modified_region = None # (i_min, i_max, j_min, j_max) of the last grid update
+        self.implement = Implement()     # blade geometry used to update the grid
+        self.journal = None # Optional FieldJournal receiving every fix and grid edit
+        
+        # Spatial index over self.points, rebuilt lazily when points are replaced or rotated
+        self.spatial_index = PointIndex()
+        self.spatial_index_stale = False
+        # Triangulation of self.points grown in the background during the survey
+        self.triangulator = SurveyTriangulator()
+        # Cache of the generated grids (GridCache), None to always regenerate
+        self.grid_cache = None
+        # Multi-zone design (design_surface.solve_zone_design): zone raster of the grid,
+        # zone -> (a, b, c) planes and the target raster; None = single plane_a/b/c
+        self.design_zones = None
+        self.design_planes = None
+        self.design_target = None
+        # Cached lat/lon -> field coordinates transform, see get_local_transform
+        self._transform = None
+        self._transform_key = None
 
 
     def add_point(self, gps_data):
@@ -47,6 +113,11 @@ class FieldModel:
             "y": y,
             "z": z
         })
+        if not self.spatial_index_stale:
+            self.spatial_index.append(x, y)
+        self.triangulator.add_point(x, y)
+        if self.journal is not None:
+            self.journal.log_point(lat, lon, alt)
 
     def latlon_to_xy(self, lat, lon):
         """Convert geographic coordinates to Cartesian coordinates"""
@@ -62,6 +133,74 @@ class FieldModel:
         y = self.R * (lat_rad - ref_lat_rad)
         return x, y
 
+    def invalidate_spatial_index(self):
+        """Mark the spatial index out of date after points were replaced or moved"""
+        self.spatial_index_stale = True
+
+    def invalidate_triangulation(self):
+        """The points were replaced, the survey triangulation no longer applies"""
+        self.triangulator.invalidate()
+
+    def get_spatial_index(self):
+        """Return the spatial index over self.points, rebuilding it if needed"""
+        if self.spatial_index_stale:
+            self.spatial_index.reset([(p["x"], p["y"]) for p in self.points])
+            self.spatial_index_stale = False
+        return self.spatial_index
+
+    def nearest_points(self, x, y, k=1):
+        """Return (distances, indices into self.points) of the k points closest to (x, y)"""
+        return self.get_spatial_index().nearest(x, y, k)
+
+    def points_within_radius(self, x, y, radius):
+        """Return the indices into self.points of the points within radius of (x, y)"""
+        return self.get_spatial_index().within_radius(x, y, radius)
+
+    def points_in_bbox(self, min_x, min_y, max_x, max_y):
+        """Return the indices into self.points of the points inside the bounding box"""
+        return self.get_spatial_index().within_bbox(min_x, min_y, max_x, max_y)
+
+    def get_local_transform(self):
+        """
+        Affine matrix (2x3) mapping (lon, lat, 1) in degrees to rotated field coordinates:
+        projection around the reference point, then rotation by rotation_angle.
+        Cached until the reference point or the rotation changes.
+        """
+        key = (self.ref_lat, self.ref_lon, self.rotation_angle)
+        if key != self._transform_key:
+            if self.ref_lat is None or self.ref_lon is None:
+                matrix = np.zeros((2, 3))
+            else:
+                scale_x = self.R * math.cos(math.radians(self.ref_lat)) * math.pi / 180.0
+                scale_y = self.R * math.pi / 180.0
+                projection = np.array([[scale_x, 0.0, -scale_x * self.ref_lon],
+                                       [0.0, scale_y, -scale_y * self.ref_lat]])
+                cos_a = math.cos(self.rotation_angle)
+                sin_a = math.sin(self.rotation_angle)
+                rotation = np.array([[cos_a, -sin_a], [sin_a, cos_a]])
+                matrix = rotation @ projection
+            self._transform = matrix
+            self._transform_key = key
+        return self._transform
+
+    def transform_fixes(self, fixes):
+        """
+        Field coordinates (x, y) and heading in field degrees for a list of parsed GPS fixes,
+        computed for the whole list at once. Returns three arrays.
+        """
+        n = len(fixes)
+        lon = np.fromiter((f["longitude"] for f in fixes), dtype=float, count=n)
+        lat = np.fromiter((f["latitude"] for f in fixes), dtype=float, count=n)
+        matrix = self.get_local_transform()
+        xs = matrix[0, 0] * lon + matrix[0, 1] * lat + matrix[0, 2]
+        ys = matrix[1, 0] * lon + matrix[1, 1] * lat + matrix[1, 2]
+
+        heading_true = np.fromiter((f["headingTrue"] for f in fixes), dtype=float, count=n)
+        heading_dual = np.fromiter((f["headingTrueDual"] for f in fixes), dtype=float, count=n)
+        heading_imu = np.fromiter((f["imuHeading"] for f in fixes), dtype=float, count=n) / 10 #TODO actually to do a manual VTG
+        heading = choose_heading(heading_true, heading_dual, heading_imu)
+        return xs, ys, heading - math.degrees(self.rotation_angle)
+
     def save_to_file(self, filename):
         """Save all points and field properties to JSON file"""
         data = {
@@ -69,6 +208,7 @@ class FieldModel:
             "ref_lon": self.ref_lon,
             "ref_alt": self.ref_alt,
             "rotation_angle": self.rotation_angle,  # Save the rotation angle
+            "ground_heights": True,  # antenna height already taken off the altitudes
             "points": self.points
         }
         with open(filename, "w") as f:
@@ -80,6 +220,8 @@ class FieldModel:
             data = json.load(f)
             
         self.points = data["points"]
+        self.invalidate_spatial_index()
+        self.invalidate_triangulation()
         self.ref_lat = data["ref_lat"]
         self.ref_lon = data["ref_lon"]
         self.ref_alt = data["ref_alt"]
@@ -87,6 +229,14 @@ class FieldModel:
         # Load the rotation angle if it exists, default to 0.0
         self.rotation_angle = data.get("rotation_angle", 0.0)
         
+        # Older files hold antenna heights: convert them once to ground heights,
+        # the next save marks them as converted
+        if not data.get("ground_heights", False) and self.implement.antenna_height:
+            for p in self.points:
+                p["alt"] -= self.implement.antenna_height
+            if self.ref_alt is not None:
+                self.ref_alt -= self.implement.antenna_height
+        
         # If the field had a non-zero rotation, apply it to points immediately
         if abs(self.rotation_angle) > 1e-9:
             print(f"Applying saved rotation angle of {math.degrees(self.rotation_angle):.2f}°")
@@ -94,6 +244,101 @@ class FieldModel:
         
         return True
 
+    def get_state(self):
+        """Return a copy of the whole model (points, references and grid) as a dict of arrays"""
+        def opt(value):
+            return np.nan if value is None else value
+
+        points = np.array([[p["lat"], p["lon"], p["alt"], p["x"], p["y"], p["z"]] for p in self.points],
+                          dtype=float).reshape(-1, 6)
+        state = {
+            "ref": np.array([opt(self.ref_lat), opt(self.ref_lon), opt(self.ref_alt)], dtype=float),
+            "rotation_angle": np.array(self.rotation_angle),
+            "vertical_offset": np.array([self.vertical_offset, self.vertical_offset_old]),
+            "plane": np.array([self.plane_a, self.plane_b, self.plane_c], dtype=float),
+            "points": points,
+            "leveling_mode": np.array(self.leveling_mode and self.grid_z is not None),
+            "grid_resolution": np.array(self.grid_resolution),
+        }
+        if self.grid_z is not None:
+            state["grid_x_range"] = self.grid_x[0, :].copy()
+            state["grid_y_range"] = self.grid_y[:, 0].copy()
+            state["grid_z"] = self.grid_z.copy()
+            state["grid_weight"] = self.grid_stats.weight.copy()
+            state["grid_m2"] = self.grid_stats.m2.copy()
+            state["grid_updated"] = self.grid_stats.updated.copy()
+        if self.design_target is not None:
+            state["design_zones"] = self.design_zones.copy()
+            state["design_planes"] = np.array([[label, a, b, c] for label, (a, b, c) in self.design_planes.items()],
+                                              dtype=float)
+        return state
+
+    def set_state(self, state):
+        """Restore the model from a dict produced by get_state"""
+        def opt(value):
+            return None if np.isnan(value) else float(value)
+
+        self.ref_lat, self.ref_lon, self.ref_alt = (opt(v) for v in state["ref"])
+        self.rotation_angle = float(state["rotation_angle"])
+        self.vertical_offset, self.vertical_offset_old = (float(v) for v in state["vertical_offset"])
+        self.plane_a, self.plane_b, self.plane_c = (float(v) for v in state["plane"])
+        keys = ("lat", "lon", "alt", "x", "y", "z")
+        self.points = [dict(zip(keys, row)) for row in state["points"].tolist()]
+        self.invalidate_spatial_index()
+        self.invalidate_triangulation()
+        self.grid_resolution = float(state["grid_resolution"])
+        self.leveling_mode = bool(state["leveling_mode"])
+        if "grid_z" in state:
+            self.grid_x, self.grid_y = np.meshgrid(state["grid_x_range"], state["grid_y_range"])
+            self.grid_z = np.array(state["grid_z"], dtype=float)
+            self.reset_grid_stats()
+            if "grid_weight" in state:
+                self.grid_stats.weight[...] = state["grid_weight"]
+                self.grid_stats.m2[...] = state["grid_m2"]
+            if "grid_updated" in state:
+                self.grid_stats.updated[...] = state["grid_updated"]
+        else:
+            self.grid_x = self.grid_y = self.grid_z = self.grid_stats = self.plane_sums = None
+        self.clear_design()
+        if "design_zones" in state and self.grid_z is not None:
+            self.set_design(state["design_zones"],
+                            {int(row[0]): tuple(float(v) for v in row[1:]) for row in state["design_planes"]})
+
+    def save_snapshot(self, filename):
+        """Save the whole model in binary form (.npz)"""
+        with open(filename, "wb") as f:
+            np.savez(f, **self.get_state())
+
+    def load_snapshot(self, filename):
+        """Load a model saved with save_snapshot"""
+        with np.load(filename) as data:
+            self.set_state({key: data[key] for key in data.files})
+        return True
+
+    def set_design(self, zones, planes):
+        """Use a multi-zone design (zone raster of the grid, zone -> (a, b, c)) as target."""
+        self.design_zones = np.asarray(zones, dtype=int)
+        self.design_planes = dict(planes)
+        target = np.full(self.grid_z.shape, np.nan)
+        for label, (a, b, c) in self.design_planes.items():
+            cells = self.design_zones == label
+            target[cells] = a + b * self.grid_x[cells] + c * self.grid_y[cells]
+        self.design_target = target
+
+    def clear_design(self):
+        self.design_zones = self.design_planes = self.design_target = None
+
+    def target_at(self, x, y):
+        """Target elevation at (x, y): plane of the design zone of the nearest cell, else plane_a/b/c."""
+        if self.design_target is not None:
+            i = int(round((y - self.grid_y[0, 0]) / self.grid_resolution))
+            j = int(round((x - self.grid_x[0, 0]) / self.grid_resolution))
+            if 0 <= i < self.design_zones.shape[0] and 0 <= j < self.design_zones.shape[1]:
+                plane = self.design_planes.get(int(self.design_zones[i, j]))
+                if plane is not None:
+                    return plane[0] + plane[1] * x + plane[2] * y
+        return self.plane_a + self.plane_b * x + self.plane_c * y
+
     def get_bounds(self):
         """Get bounding box of all points"""
         all_x = [p["x"] for p in self.points]
@@ -105,10 +350,11 @@ class FieldModel:
         """
         Generate a grid for leveling that follows the concave shape of the field points.
         Ignores large holes in the interior (>5m across) where no survey data was collected.
+        The triangulation built during the survey is reused when it matches the points,
+        and the whole grid is taken from grid_cache when nothing changed since it was made.
         """
-        from scipy.spatial import Delaunay, ConvexHull
-        from shapely.geometry import Polygon, Point
-        from shapely.ops import unary_union
+        from scipy.spatial import Delaunay, QhullError
+        from scipy.interpolate import LinearNDInterpolator
         
         points = self.points
         if not points:
@@ -122,6 +368,7 @@ class FieldModel:
 
         # 2) Extract x,y coordinates
         self.grid_resolution = resolution
+        self.clear_design()
         xs = np.array([p["x"] for p in points])
         ys = np.array([p["y"] for p in points])
         points_xy = np.column_stack((xs, ys))
@@ -130,169 +377,164 @@ class FieldModel:
         if len(points_xy) < 3:
             return False
 
-        # 3) Build concave hull via Delaunay -> alpha-like filtering. Fallback to convex hull on error.
-        try:
-            tri = Delaunay(points_xy)
-            triangles = points_xy[tri.simplices]
-            # Compute max edge length of each triangle
-            edge_lengths = []
-            for t in triangles:
-                e1 = np.linalg.norm(t[1] - t[0])
-                e2 = np.linalg.norm(t[2] - t[1])
-                e3 = np.linalg.norm(t[0] - t[2])
-                edge_lengths.append(max(e1, e2, e3))
-            # Filter out "large" triangles
-            alpha = np.percentile(edge_lengths, 90)
-            valid_triangles = [Polygon(t) for t, ln in zip(triangles, edge_lengths) if ln < alpha]
-
-            if not valid_triangles:
-                hull = ConvexHull(points_xy)
-                field_boundary = Polygon(points_xy[hull.vertices])
-            else:
-                polygons = unary_union(valid_triangles)
-                # If union is multi-polygon, keep the largest
-                if polygons.geom_type == 'MultiPolygon':
-                    field_boundary = max(polygons.geoms, key=lambda p: p.area)
-                else:
-                    field_boundary = polygons
-        except:
-            hull = ConvexHull(points_xy)
-            field_boundary = Polygon(points_xy[hull.vertices])
-
-        # 4) Remove large holes. Any interior ring with area > ~25 m² (≈ circle of diameter 5 m)
-        cleaned_interior_polygons = []
-        for interior in field_boundary.interiors:
-            hole_poly = Polygon(interior)
-            # If hole is smaller than 25 m², keep it. Otherwise skip it.
-            if hole_poly.area < 25:
-                cleaned_interior_polygons.append(hole_poly)
-
-        # Rebuild polygon without large holes
-        field_boundary = Polygon(field_boundary.exterior.coords, [p.exterior.coords for p in cleaned_interior_polygons])
-
-        # 5) Create a 5 m buffer inside the boundary for partial regions
-        #    (means we do NOT fill grid for regions more than 5 m away from survey boundaries).
-        actual_field = field_boundary.buffer(5.0)
-
-        # If buffering inward removes everything, just skip
-        if actual_field.is_empty:
-            return False
-
-        # 6) Enclose the boundary for final bounding box
-        min_x, min_y, max_x, max_y = actual_field.bounds
-        x_range = np.arange(min_x, max_x + resolution, resolution)
-        y_range = np.arange(min_y, max_y + resolution, resolution)
-        self.grid_x, self.grid_y = np.meshgrid(x_range, y_range)
-        grid_shape = self.grid_x.shape
-
-        # 7) Initialize grid_z with NaN
-        self.grid_z = np.full(grid_shape, np.nan)
-
-        # 8) Prepare interpolation
+        # Same points, rotation and parameters as a grid generated before: reuse it
         points_z = np.array([p["z"] for p in points])
+        cache_key = None
+        if self.grid_cache is not None:
+            cache_key = self.grid_cache.key(
+                (xs, ys, points_z),
+                {"rotation_angle": self.rotation_angle, "resolution": resolution,
+                 "hull_edge_percentile": HULL_EDGE_PERCENTILE, "max_hole_area": MAX_HOLE_AREA,
+                 "field_buffer": FIELD_BUFFER, "smooth_sigma": SMOOTH_SIGMA,
+                 "max_fill_distance": MAX_FILL_DISTANCE})
+            cached = self.grid_cache.get(cache_key)
+            if cached is not None:
+                self.grid_x, self.grid_y = np.meshgrid(cached["grid_x_range"], cached["grid_y_range"])
+                self.grid_z = cached["grid_z"].astype(float)
+                self.reset_grid_stats()
+                self.leveling_mode = True
+                return True
+
+        # 3) Triangulation. tri.points may be in the frame before the field rotation:
+        #    grid coordinates are rotated back by 'angle' before looking them up.
+        tri, angle = self.triangulator.result(len(points))
+        if tri is None:
+            try:
+                tri, angle = Delaunay(points_xy), 0.0
+            except QhullError:
+                return False
+
+        # 4) Concave outline: drop the triangles with the longest edges (alpha-like filtering).
+        #    Fallback to the convex hull if nothing is left.
+        corners = tri.points[tri.simplices]
+        edge_lengths = np.max([
+            np.linalg.norm(corners[:, 1] - corners[:, 0], axis=1),
+            np.linalg.norm(corners[:, 2] - corners[:, 1], axis=1),
+            np.linalg.norm(corners[:, 0] - corners[:, 2], axis=1),
+        ], axis=0)
+        alpha = np.percentile(edge_lengths, HULL_EDGE_PERCENTILE)
+        valid_triangles = edge_lengths < alpha
+        if not np.any(valid_triangles):
+            valid_triangles[:] = True
+
+        # 5) Grid enclosing the points plus the boundary buffer
+        x_range = np.arange(xs.min() - FIELD_BUFFER, xs.max() + FIELD_BUFFER + resolution, resolution)
+        y_range = np.arange(ys.min() - FIELD_BUFFER, ys.max() + FIELD_BUFFER + resolution, resolution)
+        grid_x, grid_y = np.meshgrid(x_range, y_range)
+        query = np.column_stack((grid_x.ravel(), grid_y.ravel()))
+        if abs(angle) > 1e-12:
+            cos_a, sin_a = math.cos(-angle), math.sin(-angle)
+            query = np.column_stack((query[:, 0] * cos_a - query[:, 1] * sin_a,
+                                     query[:, 0] * sin_a + query[:, 1] * cos_a))
+
+        # 6) Field mask: cells in a valid triangle, cleaned and buffered on the raster
+        simplex = tri.find_simplex(query)
+        inside = ((simplex >= 0) & valid_triangles[simplex]).reshape(grid_x.shape)
+        field_mask = field_mask_from_cells(inside, resolution)
+        rows = np.flatnonzero(field_mask.any(axis=1))
+        cols = np.flatnonzero(field_mask.any(axis=0))
+        if not rows.size:
+            return False
 
-        # 9) Assign z-values only inside actual_field polygon
-        inside_points = []
-        inside_indices = []
-        for i in range(grid_shape[0]):
-            for j in range(grid_shape[1]):
-                x = self.grid_x[i, j]
-                y = self.grid_y[i, j]
-                if actual_field.contains(Point(x, y)):
-                    inside_points.append((x, y))
-                    inside_indices.append((i, j))
-
-        # Interpolate wherever inside_points exist
-        if inside_points:
-            inside_points = np.array(inside_points)
-            z_values = griddata(points_xy, points_z, inside_points, method='linear')
-            for k, (i, j) in enumerate(inside_indices):
-                self.grid_z[i, j] = z_values[k]
+        # 7) Crop to the field and initialize grid_z with NaN
+        crop = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+        self.grid_x, self.grid_y = grid_x[crop], grid_y[crop]
+        field_mask = field_mask[crop]
+        self.grid_z = np.full(self.grid_x.shape, np.nan)
+
+        # 8) Interpolate z only inside the field, then smooth the GNSS noise and fill the interior holes
+        cells = query.reshape(grid_x.shape + (2,))[crop][field_mask]
+        if len(cells):
+            self.grid_z[field_mask] = LinearNDInterpolator(tri, points_z)(cells)
+        self.grid_z = condition_grid(self.grid_z, resolution)
+        self.reset_grid_stats()
+        if cache_key is not None:
+            try:
+                self.grid_cache.put(cache_key, {"grid_x_range": x_range[crop[1]], "grid_y_range": y_range[crop[0]],
+                                                "grid_z": self.grid_z, "field_mask": field_mask})
+            except OSError as e:
+                print("Grid cache error:", e)
 
         self.leveling_mode = True
         return True
     
-    def update_grid_elevation(self, x0, y0, current_elev, radius, direction_deg):
-        """Update grid points along a line that is perpendicular to the given heading,
-        centered at (x0, y0). 'radius' defines the total length of the line.
-        Only grid cells within a bounding box (derived from the line parameters)
-        are evaluated, to reduce computation.
+    def update_grid_elevation(self, x0, y0, current_elev, direction_deg, variance=None):
+        """Update the grid cells under the blade of self.implement, for the antenna at
+        (x0, y0) with the given heading and elevation (relative to ref_alt).
+        The cells come from the implement's stencil table for the heading and the
+        position of the blade centre inside its cell, shifted to that cell.
+        The new elevation is accumulated into the per-cell statistics, weighted by
+        the inverse of 'variance', instead of overwriting the cells.
         """
         if not self.leveling_mode or self.grid_z is None:
             return
 
-        # Convert navigation heading to a unit vector.
-        # Navigation: 0° is North, 90° is East.
-        direction_rad = math.radians(direction_deg)
-        dx_dir = math.sin(direction_rad)
-        dy_dir = math.cos(direction_rad)
-        mag = math.sqrt(dx_dir**2 + dy_dir**2)
-        if mag > 0:
-            dx_dir /= mag
-            dy_dir /= mag
-
-        # Get the line perpendicular to the heading (rotate 90° counterclockwise)
-        line_axis_x = -dy_dir
-        line_axis_y = dx_dir
-
-        # Line parameters
-        line_width = 0.5            # Maximum perpendicular distance from the line (in meters)
-        half_length = radius / 2.0    # Half the total length of the line
-
-        # Determine a bounding box that fully encloses the line area (line segment + tolerance)
-        # The extreme points of the line segment:
-        x1 = x0 + half_length * line_axis_x
-        y1 = y0 + half_length * line_axis_y
-        x2 = x0 - half_length * line_axis_x
-        y2 = y0 - half_length * line_axis_y
-        # Bounding box limits with extra margin of line_width
-        min_bound_x = min(x0, x1, x2) - line_width
-        max_bound_x = max(x0, x1, x2) + line_width
-        min_bound_y = min(y0, y1, y2) - line_width
-        max_bound_y = max(y0, y1, y2) + line_width
-
-        # Use the sorted 1D arrays from grid creation.
-        # Assuming self.grid_x[0, :] contains sorted x values
-        # and self.grid_y[:, 0] contains sorted y values.
-        x_range = self.grid_x[0, :]
-        y_range = self.grid_y[:, 0]
-
-        # Find index bounds using np.searchsorted
-        j_min = np.searchsorted(x_range, min_bound_x, side='left')
-        j_max = np.searchsorted(x_range, max_bound_x, side='right')
-        i_min = np.searchsorted(y_range, min_bound_y, side='left')
-        i_max = np.searchsorted(y_range, max_bound_y, side='right')
-
-        grid_shape = self.grid_x.shape
-        modified = False
-
-        # Loop only over the selected indices
-        for i in range(i_min, min(i_max, grid_shape[0])):
-            for j in range(j_min, min(j_max, grid_shape[1])):
-                # Skip grid cells with no interpolated value
-                if np.isnan(self.grid_z[i, j]):
-                    continue
-
-                x = self.grid_x[i, j]
-                y = self.grid_y[i, j]
-                dx = x - x0
-                dy = y - y0
-
-                # Project (dx, dy) onto the line_axis (perpendicular to heading)
-                proj = dx * line_axis_x + dy * line_axis_y
-
-                # Only consider points within half-length of the line segment
-                if abs(proj) > half_length:
-                    continue
-
-                # Compute perpendicular distance from the grid point to the line
-                perp = abs(dx * line_axis_y - dy * line_axis_x)
-                if perp <= line_width:
-                    self.grid_z[i, j] = current_elev
-                    modified = True
+        blade_x, blade_y = self.implement.blade_position(x0, y0, direction_deg)
+        i0, j0, di, dj, (di_min, di_max, dj_min, dj_max) = self.implement.stencils(self.grid_resolution).lookup(
+            direction_deg, (blade_y - self.grid_y[0, 0]) / self.grid_resolution,
+            (blade_x - self.grid_x[0, 0]) / self.grid_resolution)
 
+        grid_shape = self.grid_z.shape
+        i_min, i_max = max(i0 + di_min, 0), min(i0 + di_max + 1, grid_shape[0])
+        j_min, j_max = max(j0 + dj_min, 0), min(j0 + dj_max + 1, grid_shape[1])
+        if i_min >= i_max or j_min >= j_max:
+            return False
+        i, j = i0 + di, j0 + dj
+        if i_min > i0 + di_min or i_max < i0 + di_max + 1 or j_min > j0 + dj_min or j_max < j0 + dj_max + 1:
+            # Blade partly outside the grid
+            inside = (i >= 0) & (i < grid_shape[0]) & (j >= 0) & (j < grid_shape[1])
+            i, j = i[inside], j[inside]
+        written = i * grid_shape[1] + j
+        # Skip grid cells with no interpolated value
+        written = written[~np.isnan(self.grid_z.flat[written])]
+
+        modified = len(written) > 0
+        if modified:
+            self.write_cells(written, current_elev - self.implement.antenna_height, variance)
+            self.last_modified_region = (i_min, i_max, j_min, j_max)
         return modified
     
+    def reset_grid_stats(self):
+        """Start the per-cell statistics from the current grid_z (the interpolated survey)"""
+        self.grid_stats = AccumulationGrid(self.grid_z, 1.0 / SURVEY_CELL_VARIANCE, process_noise=GRID_PROCESS_NOISE)
+        self.plane_sums = PlaneFitSums(self.grid_x, self.grid_y, self.grid_z)
+    
+    def write_cells(self, flat_indices, value, variance=None, now=None):
+        """
+        Add a measured elevation, taken at time 'now' (default time.time()), to the grid
+        cells with the given flat indices. The measurement is weighted by its inverse
+        variance (SURVEY_CELL_VARIANCE if not given) and merged into the running
+        statistics; grid_z holds their mean.
+        """
+        if variance is None:
+            variance = SURVEY_CELL_VARIANCE
+        if now is None:
+            now = time.time()
+        cells = np.unique(flat_indices)
+        old_z = self.grid_z.flat[cells]
+        self.grid_stats.add(flat_indices, value, 1.0 / variance, now)
+        self.plane_sums.update(cells, old_z, self.grid_z.flat[cells])
+        if self.journal is not None:
+            self.journal.log_cells(flat_indices, value, variance, now)
+    
+    def get_live_fit(self):
+        """
+        Least squares plane (a, b, c) of the grid as it is now and the standard deviation
+        of the cells around it (m), in O(1) from the running sums; None without a grid.
+        """
+        if self.plane_sums is None:
+            return None
+        plane = self.plane_sums.plane()
+        if plane is None:
+            return None
+        return plane, math.sqrt(self.plane_sums.residual_variance())
+
+    def get_grid_confidence(self):
+        """Standard deviation of the measurements of every grid cell (confidence layer)"""
+        if self.grid_stats is None:
+            return None
+        return np.sqrt(self.grid_stats.variance())
+    
     def apply_vertical_offset_grid(self, offset):
         """
         Apply a vertical offset to all z values in the grid.
@@ -310,6 +552,9 @@ class FieldModel:
         valid_mask = ~np.isnan(self.grid_z)
         if np.any(valid_mask):
             self.grid_z[valid_mask] += offset
+            self.plane_sums.shift(offset)
+            if self.journal is not None:
+                self.journal.log_offset(offset)
             return True
         
         return False
@@ -380,6 +625,8 @@ class FieldModel:
         
         points = self.get_grid_as_points()
         self.points = points
+        self.invalidate_spatial_index()
+        self.invalidate_triangulation()
 
     def rotate_field(self, angle_radians):
         """Rotate all points in-place by angle_radians around origin."""
@@ -391,6 +638,8 @@ class FieldModel:
             y_new = x_old * sin_a + y_old * cos_a
             p["x"] = x_new
             p["y"] = y_new
+        self.invalidate_spatial_index()
+        self.triangulator.rotate(angle_radians)
 
     def import_from_elevation_txt_to_grid(self, filename, resolution=1.0):
         """Import data from Elevation.txt directly to a grid structure for efficiency"""
@@ -432,7 +681,8 @@ class FieldModel:
                     try:
                         lat = float(parts[0])
                         lon = float(parts[1])
-                        elev = float(parts[2])
+                        # Ground height, like the survey points
+                        elev = float(parts[2]) - self.implement.antenna_height
                         
                         # Set reference point to first point if not defined
                         if ref_lat is None or ref_lon is None:
@@ -478,10 +728,12 @@ class FieldModel:
         y_range = np.arange(min_y, max_y + resolution, resolution)
         self.grid_x, self.grid_y = np.meshgrid(x_range, y_range)
         
-        # Interpolate Z
+        # Interpolate Z, in tiles on every core for large imports
         points_xy = np.array([(p["x"], p["y"]) for p in temp_points])
         points_z = np.array([p["z"] for p in temp_points])
-        self.grid_z = griddata(points_xy, points_z, (self.grid_x, self.grid_y), method='linear')
+        self.grid_z = condition_grid(interpolate_grid(points_xy, points_z, x_range, y_range), resolution)
+        self.reset_grid_stats()
+        self.clear_design()
         
         self.leveling_mode = True
         self.rotation_angle = 0.0  # Initialize rotation angle
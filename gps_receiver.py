@@ -1,16 +1,41 @@
 # gps_receiver.py
-import socket, struct
+import asyncio, queue, socket, struct, time
+import numpy as np
 from PyQt5.QtCore import QThread, pyqtSignal
+from height_filter import HeightKalmanFilter, pitch_from_gps_data
+
+PGN_HEADER = bytes([0x80, 0x81, 0x7C, 0xD6, 0x33])
+PGN_SIZE = 57
+
+# Whole 57 byte frame as a structured dtype: header, "<ddfffffHBHHHhhh" payload, checksum
+PGN_DTYPE = np.dtype([
+    ("header", "u1", (5,)),
+    ("longitude", "<f8"),
+    ("latitude", "<f8"),
+    ("headingTrueDual", "<f4"),
+    ("headingTrue", "<f4"),
+    ("speed", "<f4"),
+    ("roll", "<f4"),
+    ("altitude", "<f4"),
+    ("satellitesTracked", "<u2"),
+    ("fixQuality", "u1"),
+    ("hdopX100", "<u2"),
+    ("ageX100", "<u2"),
+    ("imuHeading", "<u2"),
+    ("imuRoll", "<i2"),
+    ("imuPitch", "<i2"),
+    ("imuYawRate", "<i2"),
+    ("checksum", "u1"),
+])
 
 def parse_gps_data(data):
     """
     Parse del pacchetto GPS a 57 byte.
     Ritorna un dizionario con i valori parsati oppure None in caso di errore.
     """
-    if len(data) != 57:
+    if len(data) != PGN_SIZE:
         return None
-    header = data[:5]
-    if header[0] != 0x80 or header[1] != 0x81 or header[2] != 0x7C or header[3] != 0xD6 or header[4] != 0x33:
+    if data[:5] != PGN_HEADER:
         return None
     checksum = sum(data[2:56]) & 0xFF
     if checksum != data[56]:
@@ -36,30 +61,268 @@ def parse_gps_data(data):
     }
     return gps_data
 
+def _find_frames(raw):
+    """
+    Frames of a buffer as an (n, PGN_SIZE) array with their offsets: a plain reshape
+    if the buffer is a clean sequence of frames, else every position where the header starts.
+    """
+    header = np.frombuffer(PGN_HEADER, dtype=np.uint8)
+    n = len(raw) // PGN_SIZE
+    if n * PGN_SIZE == len(raw) and n:
+        aligned = raw.reshape(n, PGN_SIZE)
+        if np.all(aligned[:, :5] == header):
+            return aligned, np.arange(n) * PGN_SIZE
+    # Resync: look for the header at every byte where a whole frame fits
+    last = len(raw) - PGN_SIZE + 1
+    if last <= 0:
+        return np.empty((0, PGN_SIZE), dtype=np.uint8), np.empty(0, dtype=np.intp)
+    found = raw[:last] == header[0]
+    for k in range(1, 5):
+        found &= raw[k:last + k] == header[k]
+    offsets = np.flatnonzero(found)
+    # Copy the runs of back-to-back frames as whole blocks (there are few, one per glitch)
+    starts = np.flatnonzero(np.diff(offsets, prepend=-1) != PGN_SIZE)
+    ends = np.append(starts[1:], len(offsets))
+    frames = np.empty((len(offsets), PGN_SIZE), dtype=np.uint8)
+    for start, end in zip(starts, ends):
+        first = offsets[start]
+        frames[start:end] = raw[first:first + (end - start) * PGN_SIZE].reshape(-1, PGN_SIZE)
+    return frames, offsets
+
+def decode_pgn_buffer(buffer):
+    """
+    Decode a buffer of concatenated 57 byte PGN frames (e.g. a raw recording) in bulk.
+    Frames with a wrong header or checksum are dropped; garbage between frames is skipped.
+    Returns a dictionary of columns with the same keys as parse_gps_data.
+    """
+    raw = np.frombuffer(buffer, dtype=np.uint8)
+    frames, offsets = _find_frames(raw)
+    # The checksum is the sum of the bytes after the first two, modulo 256
+    checksum = np.add.reduce(frames[:, 2:PGN_SIZE - 1], axis=1, dtype=np.uint8)
+    valid = checksum == frames[:, PGN_SIZE - 1]
+    if not valid.all():
+        offsets, frames = offsets[valid], frames[valid]
+    if len(offsets) > 1 and np.any(np.diff(offsets) < PGN_SIZE):
+        # A valid header and checksum inside another frame: keep the frames that do not overlap
+        keep = []
+        end = 0
+        for k, offset in enumerate(offsets):
+            if offset >= end:
+                keep.append(k)
+                end = offset + PGN_SIZE
+        frames = frames[keep]
+    records = frames.reshape(-1).view(PGN_DTYPE)
+    return {name: records[name] for name in PGN_DTYPE.names if name not in ("header", "checksum")}
+
+def read_pgn_log(filename):
+    """Decode a raw PGN recording (see GPSReceiver record_path) into columns."""
+    return decode_pgn_buffer(np.fromfile(filename, dtype=np.uint8))
+
+class _PGNProtocol(asyncio.DatagramProtocol):
+    """Datagrams of one endpoint, handed to the receiver."""
+
+    def __init__(self, receiver, source):
+        self.receiver = receiver
+        self.source = source
+
+    def datagram_received(self, data, addr):
+        self.receiver._datagram_received(data, self.source)
+
+    def error_received(self, exc):
+        print(f"GPSReceiver error ({self.source}):", exc)
+
+
 class GPSReceiver(QThread):
-    new_data = pyqtSignal(dict)
+    """
+    UDP receiver of the GPS PGN, listening on one or more endpoints (AgIO instances,
+    base station, second antenna...) from an asyncio event loop run in this thread.
+
+    Every valid fix gets "source" (the "host:port" it came from) and "recvTime"
+    (time.monotonic() at reception). The fixes received in one pass of the event loop
+    are put as one batch in a thread-safe queue and batches_ready is emitted; the GUI
+    thread takes them with get_fixes(). stop() wakes the event loop, so it returns
+    immediately.
+
+    Callables in 'listeners' get every fix too, straight from this thread, before
+    the GUI sees it (the blade controller uses it to stay off the GUI event loop).
+
+    With 'record_path' every valid PGN frame is also appended, raw, to that file
+    (read it back with read_pgn_log).
+    """
+    batches_ready = pyqtSignal()
     
-    def __init__(self, port=15555, parent=None):
+    def __init__(self, endpoints=(("127.0.0.1", 15555),), record_path=None, parent=None):
         super().__init__(parent)
-        self.port = port
+        self.endpoints = list(endpoints)
+        self.record_path = record_path
+        self.record_file = None
+        self.batches = queue.SimpleQueue()
+        self.height_filters = {}    # one height filter per source
+        self.pending = []
+        self.listeners = []
+        self.loop = None
+        self.stop_event = None
         self.running = True
 
     def run(self):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.bind(('127.0.0.1', self.port))
-        sock.settimeout(1.0)
-        while self.running:
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self._serve(loop))
+        except Exception as e:
+            print("GPSReceiver error:", e)
+        finally:
+            loop.close()
+
+    async def _serve(self, loop):
+        self.stop_event = asyncio.Event()
+        transports = []
+        if self.record_path is not None:
+            self.record_file = open(self.record_path, "ab")
+        try:
+            # Datagram endpoints work on every event loop (the Windows proactor has no add_reader);
+            # an endpoint that cannot be bound is skipped, the others keep receiving
+            for host, port in self.endpoints:
+                source = f"{host}:{port}"
+                try:
+                    transport, _ = await loop.create_datagram_endpoint(
+                        lambda source=source: _PGNProtocol(self, source), local_addr=(host, port))
+                except OSError as e:
+                    print(f"GPSReceiver error ({source}):", e)
+                    continue
+                transports.append(transport)
+            self.loop = loop
+            if self.running:
+                await self.stop_event.wait()
+        finally:
+            self.loop = None
+            for transport in transports:
+                transport.close()
+            if self.record_file is not None:
+                self.record_file.close()
+                self.record_file = None
+
+    def _datagram_received(self, data, source):
+        parsed = parse_gps_data(data)
+        if not parsed:
+            return
+        if self.record_file is not None:
+            self.record_file.write(data)
+        parsed["source"] = source
+        parsed["recvTime"] = time.monotonic()
+        self.add_filtered_height(parsed)
+        for listener in self.listeners:
+            listener(parsed)
+        if not self.pending:
+            # Flush once the datagrams already waiting on every endpoint have been handled
+            self.loop.call_soon(self._flush)
+        self.pending.append(parsed)
+
+    def _flush(self):
+        batch, self.pending = self.pending, []
+        self.batches.put(batch)
+        self.batches_ready.emit()
+
+    def get_fixes(self):
+        """All the fixes received since the last call, oldest first (thread-safe)."""
+        fixes = []
+        while True:
             try:
-                data, addr = sock.recvfrom(1024)
-                parsed = parse_gps_data(data)
-                if parsed:
-                    self.new_data.emit(parsed)
-            except socket.timeout:
-                continue
-            except Exception as e:
-                print("GPSReceiver error:", e)
-        sock.close()
+                fixes.extend(self.batches.get_nowait())
+            except queue.Empty:
+                return fixes
+    
+    def add_filtered_height(self, gps_data):
+        """Add the Kalman filtered altitude and its variance to the parsed fix."""
+        height_filter = self.height_filters.get(gps_data.get("source"))
+        if height_filter is None:
+            height_filter = self.height_filters[gps_data.get("source")] = HeightKalmanFilter()
+        height, variance = height_filter.update(
+            gps_data["altitude"], gps_data["speed"], pitch_from_gps_data(gps_data))
+        gps_data["altitudeFiltered"] = height
+        gps_data["altitudeVariance"] = variance
     
     def stop(self):
         self.running = False
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self.stop_event.set)
+            except RuntimeError:  # loop already closed
+                pass
         self.wait()
+
+
+def _blocking_receive(sock, n_packets):
+    """The previous receiver loop (blocking recvfrom, one fix at a time), as a baseline."""
+    height_filter = HeightKalmanFilter()
+    received = 0
+    sock.settimeout(1.0)
+    while received < n_packets:
+        try:
+            data, addr = sock.recvfrom(1024)
+        except socket.timeout:
+            break
+        parsed = parse_gps_data(data)
+        if parsed:
+            height_filter.update(parsed["altitude"], parsed["speed"], pitch_from_gps_data(parsed))
+            received += 1
+    return received
+
+
+def _benchmark(n_packets=100000, port=15599):
+    """Fixes per second through the asyncio receiver and through the blocking loop."""
+    import threading
+    payload = struct.pack("<ddfffffHBHHHhhh", 9.2, 45.1, 0.0, 90.0, 5.0, 0.0, 100.0, 12, 4, 80, 100, 900, 0, 0, 0)
+    packet = bytes([0x80, 0x81, 0x7C, 0xD6, 0x33]) + payload
+    packet += bytes([sum(packet[2:]) & 0xFF])
+
+    def send(count):
+        out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for k in range(count):
+            out.sendto(packet, ("127.0.0.1", port))
+            if k % 64 == 63:
+                time.sleep(0)   # let the receiver keep up, UDP drops what overflows the buffer
+        out.close()
+
+    # Blocking baseline
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", port))
+    sender = threading.Thread(target=send, args=(n_packets,))
+    t0 = time.perf_counter()
+    sender.start()
+    received = _blocking_receive(sock, n_packets)
+    elapsed = time.perf_counter() - t0 - (1.0 if received < n_packets else 0.0)
+    sender.join()
+    sock.close()
+    print(f"blocking: {received}/{n_packets} fixes, {received / elapsed:9.0f} fixes/s")
+
+    # asyncio receiver
+    receiver = GPSReceiver(endpoints=[("127.0.0.1", port)])
+    receiver.start()
+    while receiver.loop is None:
+        time.sleep(0.01)
+    sender = threading.Thread(target=send, args=(n_packets,))
+    t0 = time.perf_counter()
+    sender.start()
+    received = 0
+    batches = 0
+    last = time.perf_counter()
+    while received < n_packets and time.perf_counter() - last < 1.0:
+        fixes = receiver.get_fixes()
+        if fixes:
+            received += len(fixes)
+            batches += 1
+            last = time.perf_counter()
+        else:
+            time.sleep(0.001)
+    elapsed = last - t0
+    sender.join()
+    t_stop = time.perf_counter()
+    receiver.stop()
+    t_stop = time.perf_counter() - t_stop
+    print(f"asyncio:  {received}/{n_packets} fixes, {received / elapsed:9.0f} fixes/s, "
+          f"{received / max(batches, 1):.1f} fixes/batch, stop in {t_stop * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    _benchmark()
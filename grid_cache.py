@@ -0,0 +1,76 @@
+# grid_cache.py
+import hashlib
+import os
+import numpy as np
+
+
+class GridCache:
+    """
+    On-disk cache of the products of generate_leveling_grid, addressed by a hash of
+    everything they are computed from (points, rotation, resolution, outline parameters),
+    so reopening an unchanged field skips the triangulation and the interpolation.
+
+    One .npz file per entry; the least recently used ones are deleted once the cache
+    is larger than max_bytes (use is tracked through the file modification time).
+    """
+
+    def __init__(self, directory, max_bytes=500 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(arrays, params):
+        """Hash of a list of arrays and a dict of scalar parameters."""
+        h = hashlib.sha256()
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            h.update(str((array.dtype.str, array.shape)).encode())
+            h.update(array.tobytes())
+        h.update(repr(sorted(params.items())).encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key):
+        """The arrays stored under key, or None."""
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return arrays
+
+    def put(self, key, arrays):
+        tmp = self._path(key) + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".npz"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+                total -= size
+            except OSError:
+                pass
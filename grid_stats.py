@@ -0,0 +1,164 @@
+# grid_stats.py
+import time
+import numpy as np
+
+
+class AccumulationGrid:
+    """
+    Running weighted statistics (weight, mean, M2) for every cell of the leveling grid.
+
+    Every blade pass adds weighted samples instead of overwriting the cells, so the
+    result no longer depends on the order of the passes. The weight of a cell is the
+    inverse variance of its mean; with 'process_noise' (m²/s) that variance grows with
+    the time since the cell last received samples, as in a Kalman filter with the
+    terrain as a random walk. A cell written again within the same pass keeps part of
+    its history, while a pass after a while finds little weight left and the new
+    samples dominate, so the mean follows the terrain as it is being moved.
+
+    'mean' is the grid_z array itself, so everything reading grid_z sees the mean.
+    'updated' holds the time (time.time()) of the last samples of every cell.
+    """
+
+    def __init__(self, grid_z, prior_weight, process_noise=0.0, now=None):
+        self.mean = grid_z
+        valid = ~np.isnan(grid_z)
+        self.weight = np.where(valid, prior_weight, 0.0)
+        self.m2 = np.zeros(grid_z.shape)
+        self.updated = np.full(grid_z.shape, time.time() if now is None else now)
+        self.process_noise = process_noise
+
+    def add(self, flat_indices, values, weights, now=None):
+        """
+        Add weighted samples, taken at time 'now' (default time.time()), to the cells with
+        the given flat indices. Indices may repeat; samples of the same cell are combined
+        first (Chan's parallel update).
+        """
+        if now is None:
+            now = time.time()
+        idx = np.asarray(flat_indices).ravel()
+        values = np.broadcast_to(np.asarray(values, dtype=float), idx.shape)
+        weights = np.broadcast_to(np.asarray(weights, dtype=float), idx.shape)
+        cells, inverse = np.unique(idx, return_inverse=True)
+
+        # Statistics of the new samples per cell
+        batch_w = np.zeros(len(cells))
+        batch_wx = np.zeros(len(cells))
+        np.add.at(batch_w, inverse, weights)
+        np.add.at(batch_wx, inverse, weights * values)
+        batch_mean = batch_wx / batch_w
+        batch_m2 = np.zeros(len(cells))
+        np.add.at(batch_m2, inverse, weights * (values - batch_mean[inverse]) ** 2)
+
+        # Process noise: the variance of the mean grows with the time since the last samples
+        old_w = self.weight.flat[cells]
+        old_m2 = self.m2.flat[cells]
+        if self.process_noise > 0:
+            elapsed = np.maximum(now - self.updated.flat[cells], 0.0)
+            kept = 1.0 / (1.0 + old_w * self.process_noise * elapsed)
+            old_w = old_w * kept
+            old_m2 = old_m2 * kept
+
+        # Merge with the accumulated statistics
+        old_mean = self.mean.flat[cells]
+        has_old = old_w > 0
+        old_mean = np.where(has_old, old_mean, batch_mean)
+        new_w = old_w + batch_w
+        delta = batch_mean - old_mean
+        self.mean.flat[cells] = old_mean + delta * batch_w / new_w
+        self.m2.flat[cells] = old_m2 + batch_m2 + delta ** 2 * old_w * batch_w / new_w
+        self.weight.flat[cells] = new_w
+        self.updated.flat[cells] = now
+
+    def variance(self):
+        """Weighted variance of the samples of every cell (NaN where there are none)."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.weight > 0, self.m2 / self.weight, np.nan)
+
+    def mean_variance(self):
+        """Variance of the mean of every cell, from the accumulated inverse-variance weights."""
+        with np.errstate(divide="ignore"):
+            return np.where(self.weight > 0, 1.0 / self.weight, np.nan)
+
+
+class PlaneFitSums:
+    """
+    Running sums over the valid cells of the grid (n, Σx, Σy, Σz, Σx², Σxy, Σy², Σxz,
+    Σyz, Σz²), from which the least squares plane z = a + b*x + c*y and the variance of
+    its residuals come in O(1). Cell writes and vertical offsets update them in O(cells
+    changed).
+
+    x, y and z are taken relative to their mean at the last refresh, which keeps the
+    sums well conditioned; after refresh_cells incremental cell updates the sums are
+    rebuilt from the grid so that rounding errors cannot pile up.
+    """
+
+    def __init__(self, grid_x, grid_y, grid_z, refresh_cells=1000000):
+        self.grid_x = grid_x
+        self.grid_y = grid_y
+        self.grid_z = grid_z
+        self.refresh_cells = refresh_cells
+        self.refresh()
+
+    @staticmethod
+    def _sums(x, y, z):
+        return np.array([len(z), x.sum(), y.sum(), z.sum(), x @ x, x @ y, y @ y, x @ z, y @ z, z @ z])
+
+    def refresh(self):
+        """Recompute the sums from the whole grid."""
+        valid = ~np.isnan(self.grid_z)
+        x, y, z = self.grid_x[valid], self.grid_y[valid], self.grid_z[valid]
+        self.x0 = x.mean() if len(z) else 0.0
+        self.y0 = y.mean() if len(z) else 0.0
+        self.z0 = z.mean() if len(z) else 0.0
+        self.sums = self._sums(x - self.x0, y - self.y0, z - self.z0)
+        self.changed = 0
+
+    def update(self, cells, old_z, new_z):
+        """Cells (unique flat indices) changed from old_z to new_z (NaN = not valid)."""
+        x = self.grid_x.flat[cells] - self.x0
+        y = self.grid_y.flat[cells] - self.y0
+        old_valid = ~np.isnan(old_z)
+        new_valid = ~np.isnan(new_z)
+        self.sums += self._sums(x[new_valid], y[new_valid], new_z[new_valid] - self.z0)
+        self.sums -= self._sums(x[old_valid], y[old_valid], old_z[old_valid] - self.z0)
+        self.changed += len(cells)
+        if self.changed >= self.refresh_cells:
+            self.refresh()
+
+    def shift(self, offset):
+        """All valid cells moved up by offset."""
+        n, sx, sy, sz = self.sums[:4]
+        self.sums[9] += 2 * offset * sz + n * offset * offset
+        self.sums[7] += offset * sx
+        self.sums[8] += offset * sy
+        self.sums[3] += n * offset
+
+    def _solve(self):
+        n, sx, sy, sz, sxx, sxy, syy, sxz, syz, szz = self.sums
+        if n < 3:
+            return None
+        normal = np.array([[n, sx, sy], [sx, sxx, sxy], [sy, sxy, syy]])
+        rhs = np.array([sz, sxz, syz])
+        try:
+            theta = np.linalg.solve(normal, rhs)
+        except np.linalg.LinAlgError:
+            return None
+        return theta, rhs
+
+    def plane(self):
+        """Least squares plane (a, b, c) of the valid cells, None with fewer than 3 cells or all on a line."""
+        solved = self._solve()
+        if solved is None:
+            return None
+        (a, b, c), _ = solved
+        return a + self.z0 - b * self.x0 - c * self.y0, b, c
+
+    def residual_variance(self):
+        """Variance of the cells around the least squares plane (m²), None if there is no plane."""
+        solved = self._solve()
+        if solved is None:
+            return None
+        theta, rhs = solved
+        n = self.sums[0]
+        rss = self.sums[9] - theta @ rhs
+        return max(rss, 0.0) / max(n - 3, 1)
@@ -0,0 +1,196 @@
+# haul_plan.py
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+from scipy.special import logsumexp
+from raster_pyramid import RasterPyramid
+
+MAX_TRANSPORT_CELLS = 1500  # cut (and fill) cells of the transport problem, the grid is coarsened to fit
+EXACT_MAX_PAIRS = 20000     # cut x fill pairs up to which the plan is solved exactly
+
+
+class HaulPlan:
+    """
+    Earth moving plan: which cut cells feed which fill cells, with the least total
+    volume x distance. The cut/fill raster is reduced (RasterPyramid block sums of the
+    net volume) to the finest level with no more than max_cells cut and fill cells,
+    then the transport problem between them is solved exactly (linprog) when it is
+    small, else with entropic regularized Sinkhorn iterations.
+
+    When cut and fill are not balanced the excess is left where moving it would cost
+    the most (it has to be exported or imported anyway).
+
+    Attributes after compute:
+        sources, sinks: (n, 2) cut and fill cell centres (m)
+        flows: (k, 3) rows (source index, sink index, volume m3)
+        total_m3km: sum of volume x straight distance (m3 * km)
+        moved, excess_cut, excess_fill: volumes in m3
+        cell_size: size of the coarsened cells (m)
+    """
+
+    def __init__(self, grid_x, grid_y, grid_z, target, max_cells=MAX_TRANSPORT_CELLS):
+        self.grid_x = grid_x
+        self.grid_y = grid_y
+        self.grid_z = grid_z
+        self.target = target
+        self.max_cells = max_cells
+        self.sources = self.sinks = self.flows = None
+        self.total_m3km = self.moved = self.excess_cut = self.excess_fill = 0.0
+        self.cell_size = None
+
+    def compute(self):
+        resolution = self.grid_x[0, 1] - self.grid_x[0, 0] if self.grid_x.shape[1] > 1 else 1.0
+        volume = (self.grid_z - self.target) * resolution ** 2  # m3, > 0 cut
+        valid = ~np.isnan(volume)
+        volumes = RasterPyramid(volume)
+        centres_x = RasterPyramid(np.where(valid, self.grid_x, np.nan))
+        centres_y = RasterPyramid(np.where(valid, self.grid_y, np.nan))
+
+        # Finest level small enough (blocks of both cut and fill only carry their net volume)
+        for level in range(volumes.num_levels):
+            net = volumes.totals[level]
+            counts = volumes.counts[level]
+            tolerance = 1e-9 * max(float(np.abs(net).max()), 1e-12)
+            cut = (counts > 0) & (net > tolerance)
+            fill = (counts > 0) & (net < -tolerance)
+            if max(np.count_nonzero(cut), np.count_nonzero(fill)) <= self.max_cells:
+                break
+        self.cell_size = resolution * 2**level
+        cx, cy = centres_x.level(level), centres_y.level(level)
+        self.sources = np.column_stack((cx[cut], cy[cut]))
+        self.sinks = np.column_stack((cx[fill], cy[fill]))
+        supply, demand = net[cut], -net[fill]
+
+        total_cut, total_fill = supply.sum(), demand.sum()
+        self.moved = min(total_cut, total_fill)
+        self.excess_cut = total_cut - self.moved
+        self.excess_fill = total_fill - self.moved
+        if not len(supply) or not len(demand):
+            self.flows = np.empty((0, 3))
+            self.total_m3km = 0.0
+            return self
+
+        cost = np.hypot(self.sources[:, 0, None] - self.sinks[None, :, 0],
+                        self.sources[:, 1, None] - self.sinks[None, :, 1])
+        # Balance with a free dummy cell taking the excess
+        cost_b, supply_b, demand_b = cost, supply, demand
+        if self.excess_cut > 0:
+            cost_b = np.hstack((cost, np.zeros((len(supply), 1))))
+            demand_b = np.append(demand, self.excess_cut)
+        elif self.excess_fill > 0:
+            cost_b = np.vstack((cost, np.zeros((1, len(demand)))))
+            supply_b = np.append(supply, self.excess_fill)
+
+        if cost_b.size <= EXACT_MAX_PAIRS:
+            plan = _transport_exact(supply_b, demand_b, cost_b)
+        else:
+            plan = _transport_sinkhorn(supply_b, demand_b, cost_b, epsilon=self.cell_size / 50)
+        plan = plan[:len(supply), :len(demand)]
+
+        i, j = np.nonzero(plan > 1e-9 * max(self.moved, 1e-12))
+        self.flows = np.column_stack((i, j, plan[i, j]))
+        self.total_m3km = float(np.sum(plan * cost)) / 1000.0
+        return self
+
+    def arrows(self):
+        """
+        Flow field: for every cut cell its centre, the mean displacement of the soil it
+        sends (volume weighted) and that volume; arrays x, y, dx, dy, volume.
+        """
+        if self.flows is None or not len(self.flows):
+            return (np.empty(0),) * 5
+        i = self.flows[:, 0].astype(int)
+        j = self.flows[:, 1].astype(int)
+        v = self.flows[:, 2]
+        n = len(self.sources)
+        sent = np.bincount(i, weights=v, minlength=n)
+        dx = np.bincount(i, weights=v * (self.sinks[j, 0] - self.sources[i, 0]), minlength=n)
+        dy = np.bincount(i, weights=v * (self.sinks[j, 1] - self.sources[i, 1]), minlength=n)
+        keep = sent > 0
+        return (self.sources[keep, 0], self.sources[keep, 1],
+                dx[keep] / sent[keep], dy[keep] / sent[keep], sent[keep])
+
+
+def _transport_exact(supply, demand, cost):
+    """Balanced transport plan of least cost, as an LP (HiGHS)."""
+    n, m = cost.shape
+    rows = sp.vstack((sp.kron(sp.eye(n), np.ones((1, m))),
+                      sp.kron(np.ones((1, n)), sp.eye(m))), format="csr")
+    result = linprog(cost.ravel(), A_eq=rows, b_eq=np.concatenate((supply, demand)),
+                     bounds=(0, None), method="highs")
+    if result.status != 0:
+        raise ValueError(f"transport problem not solved: {result.message}")
+    return result.x.reshape(n, m)
+
+
+def _transport_sinkhorn(supply, demand, cost, epsilon, tolerance=1e-4, max_iter=2000):
+    """
+    Balanced transport plan with entropic regularization epsilon (same unit as cost),
+    by Sinkhorn iterations. epsilon is decreased geometrically from the largest cost;
+    every stage starts with one log-domain update of the dual potentials f, g and the
+    scalings are absorbed into them whenever they grow, so the kernel
+    exp((f + g - C) / eps) never under- or overflows.
+    """
+    rows, cols = supply > 0, demand > 0
+    if not rows.all() or not cols.all():
+        plan = np.zeros(cost.shape)
+        plan[np.ix_(rows, cols)] = _transport_sinkhorn(supply[rows], demand[cols], cost[np.ix_(rows, cols)],
+                                                       epsilon, tolerance, max_iter)
+        return plan
+    total = supply.sum()
+    a, b = supply / total, demand / total
+    f = np.zeros(len(a))
+    g = np.zeros(len(b))
+    schedule = [max(float(cost.max()), epsilon)]
+    while schedule[-1] > epsilon:
+        schedule.append(max(schedule[-1] / 2, epsilon))
+
+    for k, eps in enumerate(schedule):
+        last = k == len(schedule) - 1
+        f = eps * (np.log(a) - logsumexp((g[None, :] - cost) / eps, axis=1))
+        g = eps * (np.log(b) - logsumexp((f[:, None] - cost) / eps, axis=0))
+        kernel = np.exp((f[:, None] + g[None, :] - cost) / eps)
+        u = np.ones(len(a))
+        v = np.ones(len(b))
+        for it in range(max_iter if last else 50):
+            u = a / np.maximum(kernel @ v, 1e-300)
+            v = b / np.maximum(kernel.T @ u, 1e-300)
+            if max(np.abs(np.log(u)).max(), np.abs(np.log(v)).max()) > 30:
+                f += eps * np.log(u)
+                g += eps * np.log(v)
+                kernel = np.exp((f[:, None] + g[None, :] - cost) / eps)
+                u[:] = 1.0
+                v[:] = 1.0
+            if it % 10 == 9 and np.abs(u * (kernel @ v) - a).sum() < tolerance:
+                break
+        f += eps * np.log(u)
+        g += eps * np.log(v)
+    plan = np.exp((f[:, None] + g[None, :] - cost) / schedule[-1])
+    return plan * total
+
+
+def _benchmark(size=400, resolution=1.0):
+    """Plan on a size x size grid, and exact against Sinkhorn on the same coarse problem."""
+    import time
+    rng = np.random.default_rng(0)
+    grid_x, grid_y = np.meshgrid(np.arange(size) * resolution, np.arange(size) * resolution)
+    grid_z = 0.3 * np.sin(grid_x / 40) * np.cos(grid_y / 55) + rng.normal(0, 0.02, grid_x.shape)
+    target = np.full(grid_z.shape, grid_z.mean())
+    t0 = time.perf_counter()
+    plan = HaulPlan(grid_x, grid_y, grid_z, target).compute()
+    print(f"{grid_z.size} cells -> {len(plan.sources)} x {len(plan.sinks)} ({plan.cell_size:.0f} m): "
+          f"{plan.total_m3km:.1f} m3km, {plan.moved:.0f} m3 in {time.perf_counter() - t0:.1f} s")
+
+    small = HaulPlan(grid_x, grid_y, grid_z, target, max_cells=120)
+    small.compute()
+    cost = np.hypot(small.sources[:, 0, None] - small.sinks[None, :, 0],
+                    small.sources[:, 1, None] - small.sinks[None, :, 1])
+    supply = np.bincount(small.flows[:, 0].astype(int), weights=small.flows[:, 2], minlength=len(small.sources))
+    demand = np.bincount(small.flows[:, 1].astype(int), weights=small.flows[:, 2], minlength=len(small.sinks))
+    exact = np.sum(_transport_exact(supply, demand, cost) * cost) / 1000
+    entropic = np.sum(_transport_sinkhorn(supply, demand, cost, small.cell_size / 50) * cost) / 1000
+    print(f"{len(supply)} x {len(demand)} cells: exact {exact:.2f} m3km, Sinkhorn {entropic:.2f} m3km")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,73 @@
+# height_filter.py
+import math
+import time
+
+
+class HeightKalmanFilter:
+    """
+    1-D Kalman filter of the antenna height, run on every fix.
+
+    The prediction step moves the height by the vertical speed implied by the ground
+    speed and the IMU pitch (driving up a slope raises the antenna), the update step
+    blends in the GNSS altitude. Fixes far outside the expected range are skipped,
+    and the filter restarts from the measurement if that keeps happening.
+    """
+
+    def __init__(self, measurement_std=0.02, process_std=0.03, pitch_std_deg=1.0, gate=5.0, max_skipped=10):
+        self.measurement_var = measurement_std ** 2
+        self.process_var = process_std ** 2          # m² per second of random walk
+        self.pitch_std = math.radians(pitch_std_deg)
+        self.gate = gate
+        self.max_skipped = max_skipped
+        self.reset()
+
+    def reset(self):
+        self.height = None
+        self.variance = None
+        self.last_time = None
+        self.skipped = 0
+
+    def update(self, altitude, speed_kmh=0.0, pitch_deg=None, now=None):
+        """Add a fix and return (filtered height, variance)."""
+        if now is None:
+            now = time.monotonic()
+        if self.height is None:
+            self.height = altitude
+            self.variance = self.measurement_var
+            self.last_time = now
+            return self.height, self.variance
+
+        # Predict
+        dt = min(max(now - self.last_time, 0.0), 1.0)
+        self.last_time = now
+        speed = speed_kmh / 3.6
+        self.variance += self.process_var * dt
+        if pitch_deg is not None:
+            self.height += speed * math.sin(math.radians(pitch_deg)) * dt
+            self.variance += (speed * dt * self.pitch_std) ** 2
+
+        # Update, with a gate on the innovation against spikes
+        innovation = altitude - self.height
+        innovation_var = self.variance + self.measurement_var
+        if innovation * innovation > self.gate * self.gate * innovation_var:
+            self.skipped += 1
+            if self.skipped > self.max_skipped:
+                self.reset()
+                return self.update(altitude, speed_kmh, pitch_deg, now)
+            return self.height, self.variance
+        self.skipped = 0
+        gain = self.variance / innovation_var
+        self.height += gain * innovation
+        self.variance *= (1.0 - gain)
+        return self.height, self.variance
+
+
+def pitch_from_gps_data(gps_data):
+    """IMU pitch in degrees from the parsed PGN (tenths of degree), None if not available."""
+    pitch = gps_data.get("imuPitch")
+    if pitch is None:
+        return None
+    pitch = pitch / 10.0
+    if abs(pitch) > 45.0:  # no IMU or invalid reading
+        return None
+    return pitch
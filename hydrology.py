@@ -0,0 +1,227 @@
+# hydrology.py
+import heapq
+import math
+import numpy as np
+from scipy import ndimage
+
+PONDING_MIN_DEPTH = 0.005   # m, shallower ponding is not shown nor counted
+CHANNEL_MIN_AREA = 500.0    # m², cells draining at least this area are drawn as channels
+
+# D8 neighbour offsets (row, column)
+D8_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def flow_directions(grid_z, resolution=1.0):
+    """
+    D8 flow directions: for every cell the flat index of its steepest lower neighbour
+    (drop / distance), -1 where there is none (pits, flats, NaN cells).
+    """
+    ny, nx = grid_z.shape
+    padded = np.pad(grid_z, 1, constant_values=np.nan)
+    index = np.arange(ny * nx).reshape(ny, nx)
+    receivers = np.full((ny, nx), -1, dtype=np.intp)
+    best = np.zeros((ny, nx))
+    with np.errstate(invalid="ignore"):
+        for di, dj in D8_OFFSETS:
+            slope = (grid_z - padded[1 + di:1 + di + ny, 1 + dj:1 + dj + nx]) / (resolution * math.hypot(di, dj))
+            steeper = slope > best  # False where either cell is NaN
+            best[steeper] = slope[steeper]
+            receivers[steeper] = index[steeper] + di * nx + dj
+    return receivers.ravel()
+
+
+class Hydrology:
+    """
+    Where water ponds on a surface and where it runs, for the survey grid or the
+    target surface (NaN outside the field; water leaves the field at its edge).
+
+    The depressions are filled with a priority-flood over the basins of the D8 flow
+    directions instead of over the single cells: every cell drains downhill to one
+    pit, and a basin spills into its neighbour over the lowest pass between them
+    (max of the two adjacent cells), so flooding the basin graph from the field edge
+    with a heap gives the exact spill level of every basin in O(b log b). The pits
+    then drain through the pass that floods them, and the flow accumulation follows
+    the directions frontier by frontier (Kahn's order, vectorized).
+
+    Attributes after compute:
+        filled: surface with the depressions filled (m)
+        ponding: water depth left on the surface, filled - grid_z (m)
+        receivers: flat index of the cell every cell drains to, -1 where the water leaves the field
+        accumulation: area draining through every cell, the cell included (m²)
+        basins: number of D8 basins
+    """
+
+    def __init__(self, grid_z, resolution=1.0):
+        self.grid_z = np.asarray(grid_z, dtype=float)
+        self.resolution = resolution
+        self.filled = self.ponding = self.receivers = self.accumulation = None
+        self.basins = 0
+
+    def compute(self):
+        z = self.grid_z
+        ny, nx = z.shape
+        flat_z = z.ravel()
+        valid = ~np.isnan(z)
+        receivers = flow_directions(z, self.resolution)
+
+        # Basins: cells with no lower neighbour are pits (adjacent pits are equal, so a flat
+        # is one basin); every other cell belongs to the pit it drains to (pointer jumping)
+        pits = valid.ravel() & (receivers < 0)
+        pit_labels, n_basins = ndimage.label(pits.reshape(ny, nx), structure=np.ones((3, 3)))
+        self.basins = n_basins
+        outlet = np.where(receivers >= 0, receivers, np.arange(ny * nx))
+        while True:
+            jumped = outlet[outlet]
+            if np.array_equal(jumped, outlet):
+                break
+            outlet = jumped
+        basin = pit_labels.ravel()[outlet] - 1  # -1 outside the field
+        if n_basins == 0:
+            self.filled = z.copy()
+            self.ponding = np.where(valid, 0.0, np.nan)
+            self.receivers = receivers
+            self.accumulation = self._accumulate(receivers, valid.ravel()).reshape(ny, nx)
+            return self
+
+        # Passes between basins: lowest max(z_a, z_b) over their adjacent cells
+        index = np.arange(ny * nx).reshape(ny, nx)
+        cells_a, cells_b = [], []
+        for a, b in ((index[:, :-1], index[:, 1:]), (index[:-1, :], index[1:, :]),
+                     (index[:-1, :-1], index[1:, 1:]), (index[:-1, 1:], index[1:, :-1])):
+            a, b = a.ravel(), b.ravel()
+            crossing = (basin[a] >= 0) & (basin[b] >= 0) & (basin[a] != basin[b])
+            cells_a.append(a[crossing])
+            cells_b.append(b[crossing])
+        cells_a, cells_b = np.concatenate(cells_a), np.concatenate(cells_b)
+        height = np.maximum(flat_z[cells_a], flat_z[cells_b])
+        low, high = np.minimum(basin[cells_a], basin[cells_b]), np.maximum(basin[cells_a], basin[cells_b])
+        first = _group_minimum(low * n_basins + high, height)
+        cells_a, cells_b, height = cells_a[first], cells_b[first], height[first]
+
+        # Outlets: field edge cells (next to NaN or the grid border) let the water out at their height
+        edge = np.flatnonzero(valid.ravel() & ~ndimage.binary_erosion(valid, structure=np.ones((3, 3))).ravel())
+        first = _group_minimum(basin[edge], flat_z[edge])
+        edge = edge[first]
+
+        # Priority-flood over the basins from the outlets
+        level, exit_cell = self._flood(n_basins, basin, cells_a, cells_b, height, edge, flat_z)
+
+        spill = level[np.maximum(basin, 0)]
+        filled = np.where(valid.ravel() & (spill > flat_z), spill, flat_z)
+        self.filled = filled.reshape(ny, nx)
+        self.ponding = (filled - flat_z).reshape(ny, nx)
+
+        # The pits drain through the pass that floods them
+        routed = receivers.copy()
+        pit_cells = np.flatnonzero(pits)
+        routed[pit_cells] = exit_cell[basin[pit_cells]]
+        self.receivers = routed
+        self.accumulation = self._accumulate(routed, valid.ravel()).reshape(ny, nx)
+        return self
+
+    @staticmethod
+    def _flood(n_basins, basin, cells_a, cells_b, height, edge, flat_z):
+        """
+        Spill level of every basin and the cell its water leaves through (in the basin
+        it spills into, -1 when it leaves the field), by a priority-flood with a heap.
+        """
+        # Adjacency of the basins, both directions: neighbour, pass height, cell of the pass on this side
+        source = np.concatenate((basin[cells_a], basin[cells_b]))
+        order = np.argsort(source, kind="stable")
+        neighbour = np.concatenate((basin[cells_b], basin[cells_a]))[order].tolist()
+        weight = np.concatenate((height, height))[order].tolist()
+        via = np.concatenate((cells_a, cells_b))[order].tolist()
+        start = np.concatenate(([0], np.cumsum(np.bincount(source, minlength=n_basins)))).tolist()
+
+        level = [math.inf] * n_basins
+        exit_cell = [-1] * n_basins
+        done = bytearray(n_basins)
+        heap = list(zip(flat_z[edge].tolist(), basin[edge].tolist(), [-1] * len(edge)))
+        heapq.heapify(heap)
+        while heap:
+            key, u, cell = heapq.heappop(heap)
+            if done[u]:
+                continue
+            done[u] = 1
+            level[u] = key
+            exit_cell[u] = cell
+            for k in range(start[u], start[u + 1]):
+                v = neighbour[k]
+                if not done[v]:
+                    heapq.heappush(heap, (weight[k] if weight[k] > key else key, v, via[k]))
+        return np.array(level), np.array(exit_cell, dtype=np.intp)
+
+    def _accumulate(self, receivers, valid):
+        """Upstream area of every cell: Kahn's topological order, one vectorized frontier at a time."""
+        accumulation = np.where(valid, self.resolution ** 2, 0.0)
+        draining = receivers >= 0
+        indegree = np.bincount(receivers[draining], minlength=len(receivers))
+        frontier = np.flatnonzero(valid & (indegree == 0))
+        while frontier.size:
+            frontier = frontier[draining[frontier]]
+            downstream = receivers[frontier]
+            np.add.at(accumulation, downstream, accumulation[frontier])
+            np.subtract.at(indegree, downstream, 1)
+            downstream = np.unique(downstream)
+            frontier = downstream[indegree[downstream] == 0]
+        return np.where(valid, accumulation, np.nan)
+
+    def ponding_volume(self, min_depth=PONDING_MIN_DEPTH):
+        """Volume of the ponds deeper than min_depth (m³)."""
+        depth = self.ponding[self.ponding >= min_depth]
+        return float(depth.sum()) * self.resolution ** 2
+
+
+def _group_minimum(keys, values):
+    """Index of the smallest value of every group of equal keys."""
+    order = np.argsort(values)
+    order = order[np.argsort(keys[order], kind="stable")]
+    sorted_keys = keys[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    return order[first]
+
+
+def _fill_reference(grid_z):
+    """Plain cell by cell priority-flood (heap over the cells), to check Hydrology on small grids."""
+    ny, nx = grid_z.shape
+    valid = ~np.isnan(grid_z)
+    filled = grid_z.copy()
+    done = ~valid
+    heap = []
+    edge = valid & ~ndimage.binary_erosion(valid, structure=np.ones((3, 3)))
+    for i, j in zip(*np.nonzero(edge)):
+        heap.append((grid_z[i, j], i, j))
+        done[i, j] = True
+    heapq.heapify(heap)
+    while heap:
+        h, i, j = heapq.heappop(heap)
+        for di, dj in D8_OFFSETS:
+            a, b = i + di, j + dj
+            if 0 <= a < ny and 0 <= b < nx and not done[a, b]:
+                done[a, b] = True
+                filled[a, b] = max(grid_z[a, b], h)
+                heapq.heappush(heap, (filled[a, b], a, b))
+    return filled
+
+
+def _benchmark(size=2000):
+    """Hydrology of a noisy size x size grid, checked against the cell by cell flood on a small one."""
+    import time
+    rng = np.random.default_rng(0)
+    small = rng.normal(0, 1, (60, 80))
+    small[rng.random(small.shape) < 0.05] = np.nan
+    error = np.nanmax(np.abs(Hydrology(small).compute().filled - _fill_reference(small)))
+    print(f"check 60 x 80: max difference from the cell by cell flood {error:.1e}")
+
+    grid_x, grid_y = np.meshgrid(np.arange(size, dtype=float), np.arange(size, dtype=float))
+    grid_z = 0.002 * grid_x + 0.2 * np.sin(grid_x / 50) * np.cos(grid_y / 40) + rng.normal(0, 0.01, grid_x.shape)
+    grid_z[np.hypot(grid_x - size / 2, grid_y - size / 2) > size * 0.49] = np.nan
+    start = time.perf_counter()
+    result = Hydrology(grid_z).compute()
+    print(f"{grid_z.size} cells, {result.basins} basins in {time.perf_counter() - start:.1f} s: "
+          f"ponding {result.ponding_volume():.0f} m3, max accumulation {np.nanmax(result.accumulation):.0f} m2")
+
+
+if __name__ == "__main__":
+    _benchmark()
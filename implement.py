@@ -0,0 +1,124 @@
+# implement.py
+import json
+import math
+import numpy as np
+
+HEADING_BINS = 360  # stencil table headings, 1° each
+PHASE_BINS = 8      # stencil table positions of the blade centre per cell side
+
+
+class Implement:
+    """
+    Blade geometry relative to the GPS antenna, all in metres:
+    width across the direction of travel, thickness along it (the strip of cells
+    written by one fix), forward and lateral offset of the blade centre from the
+    antenna (forward > 0 ahead, lateral > 0 to the right) and antenna height above
+    the blade edge. The antenna height is taken off the survey points as well as off
+    the blade writes, target readout and blade control, so they all compare ground
+    heights.
+    """
+
+    def __init__(self, width=4.5, thickness=1.0, forward_offset=0.0, lateral_offset=0.0, antenna_height=0.0):
+        self.width = float(width)
+        self.thickness = float(thickness)
+        self.forward_offset = float(forward_offset)
+        self.lateral_offset = float(lateral_offset)
+        self.antenna_height = float(antenna_height)
+        self._tables = {}   # resolution -> StencilTable
+
+    def blade_position(self, x, y, heading_deg, ahead=0.0):
+        """Blade centre in field coordinates for the antenna at (x, y), 'ahead' metres further along the heading."""
+        heading = math.radians(heading_deg)
+        dx, dy = math.sin(heading), math.cos(heading)
+        forward = self.forward_offset + ahead
+        return (x + dx * forward + dy * self.lateral_offset,
+                y + dy * forward - dx * self.lateral_offset)
+
+    def stencils(self, resolution):
+        """Stencil table of this blade at a grid resolution (built once per resolution)."""
+        table = self._tables.get(resolution)
+        if table is None:
+            table = self._tables[resolution] = StencilTable(self.width, self.thickness, resolution)
+        return table
+
+    def to_dict(self):
+        return {"width": self.width, "thickness": self.thickness, "forward_offset": self.forward_offset,
+                "lateral_offset": self.lateral_offset, "antenna_height": self.antenna_height}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**{key: values[key] for key in cls().to_dict() if key in values})
+
+
+class StencilTable:
+    """
+    Cells under a width x thickness blade, rasterized once per heading bin and per
+    sub-cell phase of the blade centre (phases x phases positions inside its cell)
+    at the grid resolution: offsets (di, dj) of the cell centres from the cell
+    holding the blade centre. Those of entry k are di[start[k]:start[k + 1]], dj[...];
+    extent[k] is their (di_min, di_max, dj_min, dj_max).
+    """
+
+    def __init__(self, width, thickness, resolution, bins=HEADING_BINS, phases=PHASE_BINS):
+        self.resolution = resolution
+        self.bins = bins
+        self.phases = phases
+        reach = int(math.ceil(math.hypot(width, thickness) / 2 / resolution)) + 1
+        offsets = np.arange(-reach, reach + 1)
+        di, dj = np.meshgrid(offsets, offsets, indexing="ij")
+        di, dj = di.ravel(), dj.ravel()
+        # Blade centre at the middle of every phase, in cells from the corner of its cell
+        centre = (np.arange(phases) + 0.5) / phases
+        phase_i, phase_j = np.meshgrid(centre, centre, indexing="ij")
+        ys = (di[None, :] - phase_i.reshape(-1, 1)) * resolution
+        xs = (dj[None, :] - phase_j.reshape(-1, 1)) * resolution
+
+        all_di, all_dj = [], []
+        entries = bins * phases * phases
+        self.start = np.zeros(entries + 1, dtype=np.intp)
+        self.extent = np.zeros((entries, 4), dtype=np.intp)
+        for k in range(bins):
+            heading = math.radians(k * 360.0 / bins)
+            along = xs * math.sin(heading) + ys * math.cos(heading)
+            across = xs * math.cos(heading) - ys * math.sin(heading)
+            inside = (np.abs(across) <= width / 2) & (np.abs(along) <= thickness / 2)
+            for p in range(phases * phases):
+                entry = k * phases * phases + p
+                cells = inside[p]
+                all_di.append(di[cells])
+                all_dj.append(dj[cells])
+                self.start[entry + 1] = self.start[entry] + np.count_nonzero(cells)
+                if cells.any():
+                    self.extent[entry] = di[cells].min(), di[cells].max(), dj[cells].min(), dj[cells].max()
+                else:
+                    self.extent[entry] = 0, -1, 0, -1
+        self.di = np.concatenate(all_di)
+        self.dj = np.concatenate(all_dj)
+
+    def lookup(self, heading_deg, row, col):
+        """
+        Cells under the blade for a heading in degrees, with its centre at (row, col) in
+        grid cell units (cell centres at whole numbers): the cell (i0, j0) the offsets
+        are taken from, the offsets (di, dj) and their extent.
+        """
+        # Cell whose centre is the lower-left corner of the square holding the blade centre
+        i0, j0 = math.floor(row), math.floor(col)
+        phase_i = min(int((row - i0) * self.phases), self.phases - 1)
+        phase_j = min(int((col - j0) * self.phases), self.phases - 1)
+        k = (int(round(heading_deg * self.bins / 360.0)) % self.bins) * self.phases * self.phases
+        k += phase_i * self.phases + phase_j
+        return i0, j0, self.di[self.start[k]:self.start[k + 1]], self.dj[self.start[k]:self.start[k + 1]], self.extent[k]
+
+
+def load_implement(path):
+    """Implement stored in a JSON file, the default one if there is none."""
+    try:
+        with open(path, "r") as f:
+            return Implement.from_dict(json.load(f))
+    except (OSError, ValueError, TypeError):
+        return Implement()
+
+
+def save_implement(implement, path):
+    with open(path, "w") as f:
+        json.dump(implement.to_dict(), f, indent=1)
@@ -0,0 +1,156 @@
+# ingest_filter.py
+import math
+import time
+from collections import deque
+import numpy as np
+
+
+class IngestFilter:
+    """
+    Streaming filter deciding which GPS fixes become survey points.
+
+    Each fix goes through three gates, all O(1):
+    1) quality: fix type, HDOP and age of the differential corrections;
+    2) spike rejection: Hampel test of the altitude against the rolling median/MAD
+       of the last 'window' fixes that passed the quality gate;
+    3) spacing: a point is kept only after moving 'min_distance' metres (and/or
+       waiting 'min_interval' seconds) from the last kept point, so the point count
+       follows the covered area instead of the time spent on the field.
+    """
+
+    R = 6371000  # Earth radius in meters
+
+    def __init__(self, min_distance=1.0, min_interval=None, fix_qualities=(4,), max_hdop=2.0,
+                 max_age=5.0, window=9, hampel_k=3.0, min_spike=0.05):
+        self.min_distance = min_distance
+        self.min_interval = min_interval
+        self.fix_qualities = fix_qualities
+        self.max_hdop = max_hdop
+        self.max_age = max_age
+        self.hampel_k = hampel_k
+        self.min_spike = min_spike
+        self.altitudes = deque(maxlen=window)
+        self.last_lat = None
+        self.last_lon = None
+        self.last_time = None
+        self.rejected = {"quality": 0, "spike": 0, "spacing": 0}
+        self.accepted = 0
+
+    def reset(self):
+        """Start over for another field: no spike window, no last point, counts to 0."""
+        self.altitudes.clear()
+        self.last_lat = self.last_lon = self.last_time = None
+        self.rejected = {"quality": 0, "spike": 0, "spacing": 0}
+        self.accepted = 0
+
+    def passes_quality(self, gps_data):
+        if self.fix_qualities is not None and gps_data["fixQuality"] not in self.fix_qualities:
+            return False
+        if self.max_hdop is not None and gps_data["hdopX100"] / 100.0 > self.max_hdop:
+            return False
+        if self.max_age is not None and gps_data["ageX100"] / 100.0 > self.max_age:
+            return False
+        return True
+
+    def is_spike(self, altitude):
+        """Hampel test against the previous fixes; the fix is then added to the window."""
+        window = self.altitudes
+        spike = False
+        if len(window) >= window.maxlen // 2 + 1:
+            ordered = sorted(window)
+            median = ordered[len(ordered) // 2]
+            mad = sorted(abs(a - median) for a in ordered)[len(ordered) // 2]
+            threshold = max(self.hampel_k * 1.4826 * mad, self.min_spike)
+            spike = abs(altitude - median) > threshold
+        window.append(altitude)
+        return spike
+
+    def is_spaced(self, lat, lon, now):
+        if self.last_lat is None:
+            return True
+        if self.min_distance is not None:
+            dx = self.R * math.radians(lon - self.last_lon) * math.cos(math.radians(lat))
+            dy = self.R * math.radians(lat - self.last_lat)
+            if dx * dx + dy * dy < self.min_distance * self.min_distance:
+                return False
+        if self.min_interval is not None and now - self.last_time < self.min_interval:
+            return False
+        return True
+
+    def accept(self, gps_data, now=None):
+        """Return True if the fix should be added to the survey."""
+        if now is None:
+            now = time.monotonic()
+        if not self.passes_quality(gps_data):
+            self.rejected["quality"] += 1
+            return False
+        if self.is_spike(gps_data["altitude"]):
+            self.rejected["spike"] += 1
+            return False
+        lat, lon = gps_data["latitude"], gps_data["longitude"]
+        if not self.is_spaced(lat, lon, now):
+            self.rejected["spacing"] += 1
+            return False
+        self.last_lat, self.last_lon, self.last_time = lat, lon, now
+        self.accepted += 1
+        return True
+
+    def spike_mask(self, altitudes):
+        """Vectorized is_spike over a sequence of altitudes (same result, same window afterwards)."""
+        altitudes = np.asarray(altitudes, dtype=float)
+        size = self.altitudes.maxlen
+        history = np.concatenate((np.array(self.altitudes, dtype=float), altitudes))
+        first = len(self.altitudes)
+        spikes = np.zeros(len(altitudes), dtype=bool)
+
+        # Fixes whose window is not full yet: streaming test
+        warmup = min(max(size - first, 0), len(altitudes))
+        for k in range(warmup):
+            spikes[k] = self.is_spike(altitudes[k])
+
+        # The others: median and MAD of the previous 'size' altitudes
+        if len(altitudes) > warmup:
+            windows = np.lib.stride_tricks.sliding_window_view(history[:-1], size)[first + warmup - size:]
+            middle = size // 2
+            median = np.partition(windows, middle, axis=1)[:, middle]
+            mad = np.partition(np.abs(windows - median[:, None]), middle, axis=1)[:, middle]
+            threshold = np.maximum(self.hampel_k * 1.4826 * mad, self.min_spike)
+            spikes[warmup:] = np.abs(altitudes[warmup:] - median) > threshold
+            self.altitudes.clear()
+            self.altitudes.extend(history[-size:].tolist())
+        return spikes
+
+    def accept_many(self, columns):
+        """
+        Vectorized accept() over a batch of fixes given as columns (see
+        gps_receiver.decode_pgn_buffer). Returns a boolean mask of the fixes to keep.
+        Recordings have no timestamps, so min_interval is not applied.
+        """
+        n = len(columns["altitude"])
+        good = np.ones(n, dtype=bool)
+        if self.fix_qualities is not None:
+            good &= np.isin(columns["fixQuality"], self.fix_qualities)
+        if self.max_hdop is not None:
+            good &= columns["hdopX100"] / 100.0 <= self.max_hdop
+        if self.max_age is not None:
+            good &= columns["ageX100"] / 100.0 <= self.max_age
+        self.rejected["quality"] += int(n - good.sum())
+
+        candidates = np.flatnonzero(good)
+        spikes = self.spike_mask(columns["altitude"][candidates])
+        self.rejected["spike"] += int(spikes.sum())
+        candidates = candidates[~spikes]
+
+        # Spacing depends on the last kept point: sequential, on plain floats
+        keep = np.zeros(n, dtype=bool)
+        lats = columns["latitude"][candidates].tolist()
+        lons = columns["longitude"][candidates].tolist()
+        now = time.monotonic()
+        for k, lat, lon in zip(candidates.tolist(), lats, lons):
+            if self.is_spaced(lat, lon, now):
+                keep[k] = True
+                self.last_lat, self.last_lon, self.last_time = lat, lon, now
+        accepted = int(keep.sum())
+        self.rejected["spacing"] += len(candidates) - accepted
+        self.accepted += accepted
+        return keep
@@ -1,6 +1,5 @@
 import numpy as np
 from scipy.optimize import minimize
-from scipy.optimize import minimize_scalar
 
 def get_initial_plane_params(points):
     """Calculate initial plane parameters using least squares"""
@@ -54,6 +53,22 @@ def compute_best_plane(points):
     
     return result.x
 
+def balanced_offset(residuals):
+    """
+    Offset 'a' minimizing cut + fill + |cut - fill| / 2 for the residuals z - (b*x + c*y).
+
+    The objective is convex and piecewise linear in a: below the mean residual its slope
+    is 2*#(r < a) - 1.5*n, above it 2*#(r < a) - 0.5*n. So the minimum is the mean when it
+    lies between the lower and upper quartile, else the nearest quartile, with quartiles
+    taken as order statistics (inverted CDF: r sorted, Q(q) = r[ceil(q*n) - 1]).
+    """
+    residuals = np.asarray(residuals, dtype=float)
+    n = residuals.shape[-1]
+    k25, k75 = int(np.ceil(0.25 * n)) - 1, int(np.ceil(0.75 * n)) - 1
+    ordered = np.partition(residuals, (k25, k75), axis=-1)
+    return np.clip(residuals.mean(axis=-1), ordered[..., k25], ordered[..., k75])
+
+
 def compute_best_offset(points, plane_b, plane_c):
     """Find the plane offset 'a' that minimizes total dirt movement (cut+fill)."""
     if not points:
@@ -63,19 +78,36 @@ def compute_best_offset(points, plane_b, plane_c):
     ys = np.array([p["y"] for p in points])
     zs = np.array([p["z"] for p in points])
     
-    def total_movement(a):
-        deviations = zs - (a + plane_b * xs + plane_c * ys)
-        cut = np.sum(deviations[deviations > 0])
-        fill = np.sum(-deviations[deviations < 0])
-        balance_penalty = abs(cut - fill) * 0.5
-        return cut + fill + balance_penalty
-
-    # Use scipy’s minimize_scalar to find the ‘a’ that minimizes cut+fill
-    result = minimize_scalar(total_movement, method='brent')
+    # Closed form of the minimum of cut + fill + |cut - fill| / 2, see balanced_offset
+    a = float(balanced_offset(zs - (plane_b * xs + plane_c * ys)))
     
-    print(f"Manual plane: a={result.x:.8f}, b={plane_b:.8f}, c={plane_c:.8f}")
+    print(f"Manual plane: a={a:.8f}, b={plane_b:.8f}, c={plane_c:.8f}")
     
-    return result.x
+    return a
+
+
+def explore_slopes(xs, ys, zs, slopes_x, slopes_y, cell_area=1.0, chunk_elements=4000000):
+    """
+    Balanced offset, cut and fill (m3, cells of cell_area) for every pair of candidate
+    slopes (m/m): arrays of shape (len(slopes_y), len(slopes_x)). The residuals of a
+    chunk of candidates are computed together by broadcasting, chunk_elements at most.
+    """
+    xs, ys, zs = (np.asarray(v, dtype=float) for v in (xs, ys, zs))
+    b, c = np.meshgrid(np.asarray(slopes_x, dtype=float), np.asarray(slopes_y, dtype=float))
+    b, c = b.ravel(), c.ravel()
+    offsets = np.empty(len(b))
+    cut = np.empty(len(b))
+    fill = np.empty(len(b))
+    step = max(1, chunk_elements // max(len(zs), 1))
+    for start in range(0, len(b), step):
+        sl = slice(start, start + step)
+        residuals = zs - (b[sl, None] * xs + c[sl, None] * ys)
+        offsets[sl] = balanced_offset(residuals)
+        residuals -= offsets[sl, None]
+        cut[sl] = np.maximum(residuals, 0).sum(axis=1) * cell_area
+        fill[sl] = np.maximum(-residuals, 0).sum(axis=1) * cell_area
+    shape = (len(slopes_y), len(slopes_x))
+    return offsets.reshape(shape), cut.reshape(shape), fill.reshape(shape)
     
 def compute_target_grid(grid_x, grid_y, plane_a, plane_b, plane_c):
     """
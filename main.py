@@ -1,15 +1,29 @@
 # main.py
+import os
 import sys
 import math
+import time
 import platform
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QStackedWidget, QPushButton, QVBoxLayout, 
-                             QHBoxLayout, QLabel, QLineEdit, QFileDialog, QMessageBox, QDialog, QDialogButtonBox, QDockWidget, QSlider)
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QFont
+                             QHBoxLayout, QLabel, QLineEdit, QFileDialog, QMessageBox, QDialog, QDialogButtonBox, QDockWidget, QSlider,
+                             QListWidget, QListWidgetItem)
+from PyQt5.QtCore import Qt, QTimer, QSize
+from PyQt5.QtGui import QFont, QIcon, QImage, QPixmap
 from gps_receiver import GPSReceiver
 from field_model import FieldModel
-from plot_widget import FieldPlotWidget, LevelingPlotWidget, ElevationDiffColorBar
-from leveling import compute_target_grid, compute_best_plane, compute_best_offset
+from field_journal import FieldJournal
+from workspace import Workspace
+from grid_cache import GridCache
+from survey_coverage import CoverageGrid
+from ingest_filter import IngestFilter
+from plot_widget import FieldPlotWidget, LevelingPlotWidget, ElevationDiffColorBar, SlopeCostPlotWidget
+from leveling import compute_target_grid, compute_best_plane, compute_best_offset, balanced_offset, explore_slopes
+from design_surface import block_zones, solve_zone_design, best_plane
+from haul_plan import HaulPlan
+from hydrology import Hydrology, PONDING_MIN_DEPTH, CHANNEL_MIN_AREA
+from contours import ContourLayer, contour_levels
+from blade_control import BladeController, TargetSurface
+from implement import Implement, load_implement, save_implement
 import numpy as np
 
 # Application-wide style constants
@@ -18,8 +32,34 @@ MEDIUM_FONT = "10pt"
 SMALL_FONT = "7pt"
 XLARGE_FONT = "20pt"
 
+# Survey coverage: cells with no fix within this distance (m) are marked as gaps
+COVERAGE_GAP_DISTANCE = 5.0
+
+# Survey point filter: spacing between points (m) and accepted fix types (4 = RTK fix)
+SURVEY_POINT_SPACING = 1.0
+SURVEY_FIX_QUALITIES = (4,)
+
+# Slope explorer: candidates per axis, half range around the least squares slopes (cm/100m),
+# and cells evaluated (larger grids are sampled with a stride)
+EXPLORER_STEPS = 41
+EXPLORER_HALF_RANGE = 30.0
+EXPLORER_MAX_CELLS = 100000
+
+# Contour lines: interval between the isolines of elevation and of cut/fill depth (m)
+CONTOUR_INTERVAL = 0.05
+
+# Crash recovery journal location
+AUTOSAVE_DIR = os.path.join(os.path.expanduser("~"), ".ag_gps_leveling", "autosave")
+# Fields saved with their grid, listed at startup
+WORKSPACE_DIR = os.path.join(os.path.expanduser("~"), ".ag_gps_leveling", "workspace")
+# Generated grids, reused when a field is reopened unchanged
+GRID_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".ag_gps_leveling", "grid_cache")
+GRID_CACHE_MAX_BYTES = 500 * 1024 * 1024
+# Blade geometry of the machine
+IMPLEMENT_FILE = os.path.join(os.path.expanduser("~"), ".ag_gps_leveling", "implement.json")
+
 class StartupDialog(QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, can_recover=False, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Avvio rilevamento")
         layout = QVBoxLayout(self)
@@ -29,6 +69,11 @@ class StartupDialog(QDialog):
         self.new_field_btn = buttons.addButton("Nuovo Campo", QDialogButtonBox.AcceptRole)
         self.continue_field_btn = buttons.addButton("Continua Campo", QDialogButtonBox.ActionRole)
         self.import_field_btn = buttons.addButton("Importa Campo Elevation.txt", QDialogButtonBox.ActionRole)
+        self.workspace_btn = buttons.addButton("Apri da Area di Lavoro", QDialogButtonBox.ActionRole)
+        self.auto_field_btn = buttons.addButton("Campo da Posizione GPS", QDialogButtonBox.ActionRole)
+        if can_recover:
+            self.recover_btn = buttons.addButton("Recupera Sessione Interrotta", QDialogButtonBox.ActionRole)
+            self.recover_btn.clicked.connect(self.choose_recover)
         buttons.accepted.connect(self.accept)
         buttons.rejected.connect(self.reject)
         layout.addWidget(buttons)
@@ -36,6 +81,8 @@ class StartupDialog(QDialog):
         self.new_field_btn.clicked.connect(self.choose_new)
         self.continue_field_btn.clicked.connect(self.choose_continue)
         self.import_field_btn.clicked.connect(self.choose_import)
+        self.workspace_btn.clicked.connect(self.choose_workspace)
+        self.auto_field_btn.clicked.connect(self.choose_auto)
     
     def choose_new(self):
         self.choice = "new"
@@ -48,6 +95,64 @@ class StartupDialog(QDialog):
     def choose_import(self):
         self.choice = "import"
         self.accept()
+    
+    def choose_recover(self):
+        self.choice = "recover"
+        self.accept()
+    
+    def choose_workspace(self):
+        self.choice = "workspace"
+        self.accept()
+    
+    def choose_auto(self):
+        self.choice = "auto"
+        self.accept()
+
+class WorkspaceDialog(QDialog):
+    """List of the fields in the workspace, with their thumbnail. Only the index is read here."""
+    def __init__(self, workspace, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Area di Lavoro")
+        self.resize(500, 600)
+        self.workspace = workspace
+        self.selected_id = None
+        layout = QVBoxLayout(self)
+        self.field_list = QListWidget()
+        self.field_list.setIconSize(QSize(64, 64))
+        for entry in sorted(workspace.fields, key=lambda e: e.get("modified", 0), reverse=True):
+            modified = time.strftime("%d/%m/%Y %H:%M", time.localtime(entry.get("modified", 0)))
+            item = QListWidgetItem(f"{entry['name']}\n{entry['points']} punti, modificato {modified}")
+            item.setData(Qt.UserRole, entry["id"])
+            thumbnail = workspace.thumbnail(entry["id"])
+            if thumbnail is not None:
+                item.setIcon(QIcon(thumbnail_pixmap(thumbnail)))
+            self.field_list.addItem(item)
+        self.field_list.itemDoubleClicked.connect(self.accept)
+        layout.addWidget(self.field_list)
+        buttons = QDialogButtonBox(QDialogButtonBox.Open | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+    
+    def accept(self):
+        item = self.field_list.currentItem()
+        if item is None:
+            return
+        self.selected_id = item.data(Qt.UserRole)
+        super().accept()
+
+def thumbnail_pixmap(thumbnail):
+    """Thumbnail raster to a pixmap, blue (low) to red (high) like the survey points, transparent outside the field."""
+    valid = ~np.isnan(thumbnail)
+    low, high = (np.nanmin(thumbnail), np.nanmax(thumbnail)) if valid.any() else (0.0, 0.0)
+    norm = np.where(valid, (thumbnail - low) / max(high - low, 1e-9), 0.0)
+    rgba = np.zeros(thumbnail.shape + (4,), dtype=np.uint8)
+    rgba[..., 0] = (255 * norm).astype(np.uint8)
+    rgba[..., 2] = (255 * (1 - norm)).astype(np.uint8)
+    rgba[..., 3] = np.where(valid, 255, 0)
+    rgba = np.ascontiguousarray(rgba[::-1])  # north up
+    image = QImage(rgba.data, rgba.shape[1], rgba.shape[0], 4 * rgba.shape[1], QImage.Format_RGBA8888)
+    return QPixmap.fromImage(image.copy()).scaled(64, 64, Qt.KeepAspectRatio)
 
 class SurveyWidget(QWidget):
     def __init__(self, field_model, parent=None):
@@ -58,9 +163,14 @@ class SurveyWidget(QWidget):
         layout.addWidget(self.plot_widget)
         self.end_survey_btn = QPushButton("Termina Rilevamento")
         layout.addWidget(self.end_survey_btn)
+        self.coverage = CoverageGrid(resolution=1.0, gap_distance=COVERAGE_GAP_DISTANCE)
     
     def update_plot(self):
         self.plot_widget.update_points(self.field_model.points)
+        self.plot_widget.update_coverage(self.coverage)
+    
+    def add_coverage(self, x, y):
+        self.coverage.add_fix(x, y)
     
     def update_tractor(self, x, y, heading):
         self.plot_widget.update_tractor(x, y, heading)
@@ -122,6 +232,40 @@ class LevelingWidget(QWidget):
         self.save_grid_btn.setStyleSheet(f"font-size: {MEDIUM_FONT};")
         input_layout.addWidget(self.compute_btn)
         input_layout.addWidget(self.auto_compute_btn)
+        self.explore_btn = QPushButton("Esplora pendenze")
+        self.explore_btn.setStyleSheet(f"font-size: {MEDIUM_FONT};")
+        input_layout.addWidget(self.explore_btn)
+
+        # Multi-zone design: blocks of the field, each with its own plane
+        self.zones_input = QLineEdit("2x1")
+        self.zones_input.setPlaceholderText("Zone (es. 2x1)")
+        self.zones_input.setStyleSheet(f"font-size: {MEDIUM_FONT};")
+        self.max_step_input = QLineEdit("0")
+        self.max_step_input.setPlaceholderText("Salto max (cm)")
+        self.max_step_input.setStyleSheet(f"font-size: {MEDIUM_FONT};")
+        self.zone_design_btn = QPushButton("Progetto a zone")
+        self.zone_design_btn.setStyleSheet(f"font-size: {MEDIUM_FONT};")
+        zones_label = QLabel("Zone:")
+        zones_label.setStyleSheet(f"font-size: {MEDIUM_FONT};")
+        max_step_label = QLabel("Salto max (cm):")
+        max_step_label.setStyleSheet(f"font-size: {MEDIUM_FONT};")
+        input_layout.addWidget(zones_label)
+        input_layout.addWidget(self.zones_input)
+        input_layout.addWidget(max_step_label)
+        input_layout.addWidget(self.max_step_input)
+        input_layout.addWidget(self.zone_design_btn)
+        self.haul_btn = QPushButton("Piano trasporto")
+        self.haul_btn.setStyleSheet(f"font-size: {MEDIUM_FONT};")
+        input_layout.addWidget(self.haul_btn)
+        self.contours_btn = QPushButton("Curve di livello")
+        self.contours_btn.setStyleSheet(f"font-size: {MEDIUM_FONT};")
+        input_layout.addWidget(self.contours_btn)
+        self.drainage_btn = QPushButton("Drenaggio")
+        self.drainage_btn.setStyleSheet(f"font-size: {MEDIUM_FONT};")
+        input_layout.addWidget(self.drainage_btn)
+        self.implement_btn = QPushButton("Attrezzo")
+        self.implement_btn.setStyleSheet(f"font-size: {MEDIUM_FONT};")
+        input_layout.addWidget(self.implement_btn)
         input_layout.addWidget(self.save_grid_btn)
         self.diff_label = QLabel("--")
         self.diff_label.setStyleSheet(f"font-size: {XLARGE_FONT};")
@@ -136,6 +280,15 @@ class LevelingWidget(QWidget):
         self.cut_fill_label = QLabel("Terra da togliere: -- m³, Terra da mettere: -- m³")
         self.cut_fill_label.setStyleSheet(f"font-size: {LARGE_FONT};")
         elev_cut_fill_layout.addWidget(self.cut_fill_label)
+        self.haul_label = QLabel("")
+        self.haul_label.setStyleSheet(f"font-size: {LARGE_FONT};")
+        elev_cut_fill_layout.addWidget(self.haul_label)
+        self.drainage_label = QLabel("")
+        self.drainage_label.setStyleSheet(f"font-size: {LARGE_FONT};")
+        elev_cut_fill_layout.addWidget(self.drainage_label)
+        self.flatness_label = QLabel("Planarità: --")
+        self.flatness_label.setStyleSheet(f"font-size: {LARGE_FONT};")
+        elev_cut_fill_layout.addWidget(self.flatness_label)
         elev_cut_fill_layout.setSpacing(0)  # Optionally adjust spacing specifically for this layout
 
         # Add the two layouts to the main layout with minimal spacing
@@ -153,8 +306,24 @@ class LevelingWidget(QWidget):
         # Connessione bottoni
         self.compute_btn.clicked.connect(self.apply_levelling)
         self.auto_compute_btn.clicked.connect(self.auto_compute)
+        self.explore_btn.clicked.connect(self.explore_slopes)
+        self.zone_design_btn.clicked.connect(self.zone_design)
+        self.haul_btn.clicked.connect(self.haul_plan)
+        self.implement_btn.clicked.connect(self.edit_implement)
+        self.drainage_btn.clicked.connect(self.drainage)
+        self.contours_btn.clicked.connect(self.toggle_contours)
         self.save_grid_btn.clicked.connect(self.save_grid)
         
+        self.target_grid = None
+        self.blade_controller = None    # set by MainWindow
+        self.drainage_surface = None    # surface of the drainage overlay: None, "attuale" or "progetto"
+        # Contour lines of the elevation ("quota") and of target - survey ("riporto"), one shown at a time
+        self.contour_layers = {
+            "quota": ContourLayer(),
+            "riporto": ContourLayer(),
+        }
+        self.contour_mode = None
+        self.contour_grid = None        # grid_z the elevation contours were computed from
     
     def apply_levelling(self):
         try:
@@ -173,9 +342,11 @@ class LevelingWidget(QWidget):
             offset = self.field_model.vertical_offset - self.field_model.vertical_offset_old
             self.field_model.apply_vertical_offset_grid(offset)
             self.field_model.vertical_offset_old = self.field_model.vertical_offset
+            self.contour_layers["quota"].invalidate()
             
         
         self.field_model.update_points_from_grid()
+        self.field_model.clear_design()
         
         self.field_model.plane_b = slope_x / 10000.0
         self.field_model.plane_c = slope_y / 10000.0
@@ -190,17 +361,27 @@ class LevelingWidget(QWidget):
         self.update_cut_fill()
 
     def auto_compute(self):
-        self.field_model.update_points_from_grid()
-        if not self.field_model.points:
-            QMessageBox.warning(self, "Errore", "Nessun dato di rilevamento disponibile.")
-            return
+        grid_z = self.field_model.grid_z
+        use_grid = self.field_model.leveling_mode and grid_z is not None and np.count_nonzero(~np.isnan(grid_z)) >= 3
+        if not use_grid:
+            self.field_model.update_points_from_grid()
+            if not self.field_model.points:
+                QMessageBox.warning(self, "Errore", "Nessun dato di rilevamento disponibile.")
+                return
         
         try:
             plane_offset = float(self.plane_offset_input.text()) / 100.0  # Convert from cm to meters
         except ValueError:
             plane_offset = 0.0
         
-        a, b, c = compute_best_plane(self.field_model.points)
+        if use_grid:
+            # Exact optimum on the grid cells, coarse to fine
+            start = time.perf_counter()
+            a, b, c = best_plane(self.field_model.grid_x, self.field_model.grid_y, grid_z)
+            print(f"Piano ottimo: a={a:.8f}, b={b:.8f}, c={c:.8f} in {time.perf_counter() - start:.2f} s")
+        else:
+            a, b, c = compute_best_plane(self.field_model.points)
+        self.field_model.clear_design()
         
         # Apply the plane offset to the computed a value
         self.field_model.plane_a = a + plane_offset
@@ -214,6 +395,162 @@ class LevelingWidget(QWidget):
         self.update_interpolated_grid()
         self.update_cut_fill()
     
+    def explore_slopes(self):
+        if not self.field_model.leveling_mode or self.field_model.grid_z is None:
+            QMessageBox.warning(self, "Errore", "Nessuna griglia di livellamento disponibile.")
+            return
+        SlopeExplorerDialog(self, self).exec_()
+
+    def apply_slopes(self, slope_x, slope_y):
+        """Apply slopes (cm/100m) with their balanced offset, straight from the grid."""
+        try:
+            plane_offset = float(self.plane_offset_input.text()) / 100.0  # Convert from cm to meters
+        except ValueError:
+            plane_offset = 0.0
+        self.slope_x_input.setText(f"{slope_x:.2f}")
+        self.slope_y_input.setText(f"{slope_y:.2f}")
+        self.field_model.clear_design()
+        self.field_model.plane_b = slope_x / 10000.0
+        self.field_model.plane_c = slope_y / 10000.0
+        valid = ~np.isnan(self.field_model.grid_z)
+        residuals = (self.field_model.grid_z[valid] - self.field_model.plane_b * self.field_model.grid_x[valid]
+                     - self.field_model.plane_c * self.field_model.grid_y[valid])
+        self.field_model.plane_a = float(balanced_offset(residuals)) + plane_offset
+        self.update_interpolated_grid()
+        self.update_cut_fill()
+
+    def zone_design(self):
+        """Design one plane per block of the field, with limited steps between neighbouring blocks."""
+        if not self.field_model.leveling_mode or self.field_model.grid_z is None:
+            QMessageBox.warning(self, "Errore", "Nessuna griglia di livellamento disponibile.")
+            return
+        try:
+            n_cols, n_rows = (int(v) for v in self.zones_input.text().lower().split("x"))
+            max_step = float(self.max_step_input.text()) / 100.0  # Convert from cm to meters
+            if n_cols < 1 or n_rows < 1 or max_step < 0:
+                raise ValueError
+        except ValueError:
+            QMessageBox.warning(self, "Errore", "Zone (es. 2x1) o salto massimo non validi.")
+            return
+
+        valid = ~np.isnan(self.field_model.grid_z)
+        zones = block_zones(valid, n_cols, n_rows)
+        start = time.perf_counter()
+        try:
+            planes, _ = solve_zone_design(self.field_model.grid_x, self.field_model.grid_y,
+                                          self.field_model.grid_z, zones, max_step=max_step)
+        except ValueError as e:
+            QMessageBox.warning(self, "Errore", f"Progetto a zone non possibile: {e}")
+            return
+        print(f"Progetto a zone {n_cols}x{n_rows}: {np.count_nonzero(valid)} celle in {time.perf_counter() - start:.1f} s")
+        self.field_model.set_design(zones, planes)
+        self.update_interpolated_grid()
+        self.update_cut_fill()
+
+    def toggle_contours(self):
+        """Contour lines, switching at every click: elevation, cut/fill depth, off."""
+        mode = {None: "quota", "quota": "riporto", "riporto": None}[self.contour_mode]
+        if mode == "riporto" and (self.target_grid is None or self.target_grid.shape != self.field_model.grid_z.shape):
+            mode = None
+        if mode is not None and self.field_model.grid_z is None:
+            QMessageBox.warning(self, "Errore", "Genera prima la griglia.")
+            return
+        self.contour_mode = mode
+        self.prepare_contours()
+        self.refresh_contours()
+    
+    def prepare_contours(self):
+        """Source and levels of the contour layer shown, after the grid or the target changed."""
+        if self.contour_mode is None:
+            return
+        field_model = self.field_model
+        if self.contour_mode == "quota":
+            def source(rows, cols):
+                return self.field_model.grid_z[rows, cols]
+            values = field_model.grid_z
+        else:
+            def source(rows, cols):
+                return self.target_grid[rows, cols] - self.field_model.grid_z[rows, cols]
+            values = self.target_grid - field_model.grid_z
+        self.contour_layers[self.contour_mode].set_source(
+            source, field_model.grid_z.shape, field_model.grid_x[0, 0], field_model.grid_y[0, 0],
+            field_model.grid_resolution, contour_levels(values, CONTOUR_INTERVAL))
+    
+    def refresh_contours(self):
+        if self.contour_mode is None:
+            self.leveling_plot.update_contours(None)
+            return
+        start = time.perf_counter()
+        segments = self.contour_layers[self.contour_mode].segments()
+        elapsed = time.perf_counter() - start
+        if elapsed > 0.1:
+            print(f"Curve di livello ({self.contour_mode}): {len(segments)} segmenti in {elapsed:.2f} s")
+        self.leveling_plot.update_contours(segments)
+    
+    def drainage(self):
+        """Drainage overlay, switching at every click: current surface, target surface, off."""
+        if self.field_model.grid_z is None:
+            QMessageBox.warning(self, "Errore", "Genera prima la griglia.")
+            return
+        surface = {None: "attuale", "attuale": "progetto", "progetto": None}[self.drainage_surface]
+        if surface == "progetto" and (self.target_grid is None or self.target_grid.shape != self.field_model.grid_z.shape):
+            surface = None
+        self.drainage_surface = surface
+        if surface is None:
+            self.leveling_plot.update_hydrology(None, None)
+            self.drainage_label.setText("")
+            return
+        grid_z = self.field_model.grid_z
+        if surface == "progetto":
+            grid_z = np.where(np.isnan(grid_z), np.nan, self.target_grid)
+        start = time.perf_counter()
+        result = Hydrology(grid_z, self.field_model.grid_resolution).compute()
+        print(f"Drenaggio {surface}: {result.basins} bacini su {grid_z.size} celle in {time.perf_counter() - start:.1f} s")
+        ponding = np.where(result.ponding >= PONDING_MIN_DEPTH, result.ponding, 0.0)
+        with np.errstate(invalid="ignore"):
+            channels = result.accumulation >= CHANNEL_MIN_AREA
+        self.leveling_plot.update_hydrology(ponding, channels)
+        self.drainage_label.setText(f"Ristagni ({surface}): {result.ponding_volume():.0f} m³, "
+                                    f"max {np.nanmax(ponding) * 100:.0f} cm")
+    
+    def edit_implement(self):
+        """Edit the blade geometry; it is saved and used by the grid updates and the blade controller."""
+        dialog = ImplementDialog(self.field_model.implement, self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        implement = dialog.implement
+        self.field_model.implement = implement
+        if self.blade_controller is not None:
+            self.blade_controller.implement = implement
+        try:
+            os.makedirs(os.path.dirname(IMPLEMENT_FILE), exist_ok=True)
+            save_implement(implement, IMPLEMENT_FILE)
+        except OSError as e:
+            QMessageBox.warning(self, "Errore", f"Attrezzo non salvato: {e}")
+    
+    def haul_plan(self):
+        """Show where the cut soil should go (arrows) and the total haul in m³·km."""
+        if self.target_grid is None or self.field_model.grid_z is None:
+            QMessageBox.warning(self, "Errore", "Applica prima le pendenze o un progetto.")
+            return
+        start = time.perf_counter()
+        try:
+            plan = HaulPlan(self.field_model.grid_x, self.field_model.grid_y,
+                            self.field_model.grid_z, self.target_grid).compute()
+        except ValueError as e:
+            QMessageBox.warning(self, "Errore", f"Piano di trasporto non calcolato: {e}")
+            return
+        print(f"Piano trasporto: {len(plan.sources)} x {len(plan.sinks)} celle di {plan.cell_size:.0f} m "
+              f"in {time.perf_counter() - start:.1f} s")
+        x, y, dx, dy, _ = plan.arrows()
+        self.leveling_plot.update_haul(x, y, dx, dy)
+        text = f"Trasporto: {plan.total_m3km:.1f} m³·km"
+        if plan.excess_cut >= 1:
+            text += f", eccesso {plan.excess_cut:.0f} m³"
+        elif plan.excess_fill >= 1:
+            text += f", mancano {plan.excess_fill:.0f} m³"
+        self.haul_label.setText(text)
+
     def save_grid(self):
         filename, _ = QFileDialog.getSaveFileName(self, "Salva Griglia come Punti", "", "File JSON (*.json)")
         if filename:
@@ -223,9 +560,29 @@ class LevelingWidget(QWidget):
     def update_interpolated_grid(self):
         if not self.field_model.leveling_mode:
             return
+        # The haul plan and the drainage overlay belong to the previous target
+        self.leveling_plot.update_haul([], [], [], [])
+        self.haul_label.setText("")
+        self.leveling_plot.update_hydrology(None, None)
+        self.drainage_label.setText("")
+        self.drainage_surface = None
+        # The cut/fill contours follow the target; the elevation ones only a new grid
+        self.contour_layers["riporto"].invalidate()
+        if self.field_model.grid_z is not self.contour_grid:
+            self.contour_grid = self.field_model.grid_z
+            self.contour_layers["quota"].invalidate()
             
-        if self.field_model.plane_b is not None:
-            target_grid = compute_target_grid(
+        if self.field_model.design_target is not None:
+            self.target_grid = self.field_model.design_target
+            self.leveling_plot.update_grid(
+                self.field_model.grid_x,
+                self.field_model.grid_y,
+                self.field_model.grid_z,
+                self.target_grid
+            )
+            self.update_color_range()
+        elif self.field_model.plane_b is not None:
+            self.target_grid = compute_target_grid(
                 self.field_model.grid_x, 
                 self.field_model.grid_y, 
                 self.field_model.plane_a, 
@@ -236,18 +593,69 @@ class LevelingWidget(QWidget):
                 self.field_model.grid_x, 
                 self.field_model.grid_y, 
                 self.field_model.grid_z, 
-                target_grid
+                self.target_grid
             )
-            diff = self.field_model.grid_z - target_grid
-            min_diff = np.nanmin(diff)
-            max_diff = np.nanmax(diff)
-            self.color_bar.setRange(min_diff*100, max_diff*100)
+            self.update_color_range()
+        self.update_flatness()
+        self.publish_target()
+        if self.contour_mode == "riporto" and (self.target_grid is None
+                                               or self.target_grid.shape != self.field_model.grid_z.shape):
+            self.contour_mode = None
+        self.prepare_contours()
+        self.refresh_contours()
+    
+    def publish_target(self):
+        """Hand a snapshot of the target surface to the blade controller."""
+        if self.blade_controller is None:
+            return
+        if self.target_grid is None or self.target_grid.shape != self.field_model.grid_z.shape:
+            self.blade_controller.set_surface(None)
+            return
+        self.blade_controller.set_surface(TargetSurface(
+            self.field_model.grid_x, self.field_model.grid_y, self.target_grid,
+            self.field_model.get_local_transform(), self.field_model.ref_alt,
+            math.degrees(self.field_model.rotation_angle)))
+    
+    def update_grid_region(self, i_min, i_max, j_min, j_max):
+        """Refresh the plot for a block of cells changed by the tractor, without recomputing the whole grid."""
+        if self.target_grid is None or self.target_grid.shape != self.field_model.grid_z.shape:
+            self.update_interpolated_grid()
+            return
+        self.leveling_plot.update_region(
+            i_min, j_min,
+            self.field_model.grid_z[i_min:i_max, j_min:j_max],
+            self.target_grid[i_min:i_max, j_min:j_max]
+        )
+        self.update_color_range()
+        self.update_flatness()
+        for layer in self.contour_layers.values():
+            layer.mark_dirty(i_min, i_max, j_min, j_max)
+        if self.contour_mode is not None:
+            self.refresh_contours()
+    
+    def update_flatness(self):
+        """Spread of the grid around its least squares plane, as it is now (O(1), from running sums)."""
+        fit = self.field_model.get_live_fit()
+        if fit is None:
+            self.flatness_label.setText("Planarità: --")
+            return
+        (_, b, c), sigma = fit
+        self.flatness_label.setText(f"Planarità: ±{sigma*100:.1f} cm "
+                                    f"(pend. {b*10000.0:.0f}/{c*10000.0:.0f} cm/100m)")
+    
+    def update_color_range(self):
+        # The plot shows target - survey, the color bar survey - target
+        min_diff, max_diff = self.leveling_plot.diff_range()
+        self.color_bar.setRange(-max_diff*100, -min_diff*100)
     
     def update_tractor(self, x, y, current_alt, heading):
         self.leveling_plot.update_tractor(x, y, heading)
+        # Height and target at the blade, not at the antenna
+        implement = self.field_model.implement
         if self.field_model.plane_b is not None:
-            target_elev = compute_target_grid(x, y, self.field_model.plane_a, self.field_model.plane_b, self.field_model.plane_c)
+            target_elev = self.field_model.target_at(*implement.blade_position(x, y, heading))
         if current_alt is not None:
+            current_alt -= implement.antenna_height
             diff = current_alt - target_elev
             self.elev_info_label.setText(f"Altezza: {current_alt:.2f}, Obiettivo: {target_elev:.2f}")
             self.diff_label.setText(f"{diff*100:.0f} cm")
@@ -255,6 +663,17 @@ class LevelingWidget(QWidget):
 
     def update_cut_fill(self):
         """Compute and display the cut/fill volumes based on the current plane."""
+        if (self.field_model.leveling_mode and self.target_grid is not None
+                and self.target_grid.shape == self.field_model.grid_z.shape):
+            # Leveling: over the grid cells, against the target shown (plane or zone design)
+            deviations = self.field_model.grid_z - self.target_grid
+            cell_area = self.field_model.grid_resolution ** 2
+            cut = np.nansum(deviations[deviations > 0]) * cell_area
+            fill = np.nansum(-deviations[deviations < 0]) * cell_area
+            self.cut_fill_label.setText(
+                f"Terra da togliere: {cut:.2f} m³, Terra da mettere: {fill:.2f} m³"
+            )
+            return
         points = self.field_model.points
         if not points:
             self.cut_fill_label.setText("Terra da togliere: -- m³, Terra da mettere: -- m³")
@@ -280,6 +699,94 @@ class LevelingWidget(QWidget):
             f"Terra da togliere: {cut:.2f} m³, Terra da mettere: {fill:.2f} m³"
         )
 
+class SlopeExplorerDialog(QDialog):
+    """
+    Cut + fill of the leveling grid for a whole grid of candidate slopes, each with its
+    balanced offset, as a heatmap; clicking a cell applies those slopes to the field.
+    """
+    def __init__(self, leveling_widget, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Esplora Pendenze")
+        self.resize(600, 600)
+        self.leveling_widget = leveling_widget
+        field_model = leveling_widget.field_model
+        layout = QVBoxLayout(self)
+        self.info_label = QLabel("Clicca un punto per applicare le pendenze.")
+        self.info_label.setStyleSheet(f"font-size: {MEDIUM_FONT};")
+        layout.addWidget(self.info_label)
+        self.plot = SlopeCostPlotWidget()
+        layout.addWidget(self.plot)
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+        # Valid cells, every stride-th one in both directions on large grids
+        valid = ~np.isnan(field_model.grid_z)
+        stride = max(1, int(np.ceil(np.sqrt(np.count_nonzero(valid) / EXPLORER_MAX_CELLS))))
+        sample = valid[::stride, ::stride]
+        xs = field_model.grid_x[::stride, ::stride][sample]
+        ys = field_model.grid_y[::stride, ::stride][sample]
+        zs = field_model.grid_z[::stride, ::stride][sample]
+        cell_area = (field_model.grid_resolution * stride) ** 2
+
+        start = time.perf_counter()
+        _, b, c = np.linalg.lstsq(np.column_stack((np.ones_like(xs), xs, ys)), zs, rcond=None)[0]
+        self.slopes_x = np.linspace(-EXPLORER_HALF_RANGE, EXPLORER_HALF_RANGE, EXPLORER_STEPS) + round(b * 10000.0)
+        self.slopes_y = np.linspace(-EXPLORER_HALF_RANGE, EXPLORER_HALF_RANGE, EXPLORER_STEPS) + round(c * 10000.0)
+        _, self.cut, self.fill = explore_slopes(xs, ys, zs, self.slopes_x / 10000.0, self.slopes_y / 10000.0, cell_area)
+        print(f"Esplora pendenze: {EXPLORER_STEPS}x{EXPLORER_STEPS} candidati su {len(zs)} celle "
+              f"in {time.perf_counter() - start:.1f} s")
+        self.plot.update_cost(self.slopes_x, self.slopes_y, self.cut + self.fill)
+        self.plot.slopeClicked.connect(self.slope_clicked)
+
+    def slope_clicked(self, slope_x, slope_y):
+        i = int(np.argmin(np.abs(self.slopes_y - slope_y)))
+        j = int(np.argmin(np.abs(self.slopes_x - slope_x)))
+        self.info_label.setText(f"Pendenze {slope_x:.1f} / {slope_y:.1f} cm/100m: "
+                                f"togliere {self.cut[i, j]:.0f} m³, mettere {self.fill[i, j]:.0f} m³ (stima)")
+        self.leveling_widget.apply_slopes(slope_x, slope_y)
+
+class ImplementDialog(QDialog):
+    """Blade geometry: width, thickness, offsets of the blade centre from the antenna, antenna height."""
+    FIELDS = (("width", "Larghezza lama (m):"),
+              ("thickness", "Spessore lama (m):"),
+              ("forward_offset", "Distanza avanti dall'antenna (m):"),
+              ("lateral_offset", "Distanza a destra dall'antenna (m):"),
+              ("antenna_height", "Altezza antenna sulla lama (m):"))
+
+    def __init__(self, implement, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Attrezzo")
+        self.implement = implement
+        layout = QVBoxLayout(self)
+        values = implement.to_dict()
+        self.inputs = {}
+        for key, text in self.FIELDS:
+            row = QHBoxLayout()
+            label = QLabel(text)
+            label.setStyleSheet(f"font-size: {MEDIUM_FONT};")
+            self.inputs[key] = QLineEdit(f"{values[key]:g}")
+            self.inputs[key].setStyleSheet(f"font-size: {MEDIUM_FONT};")
+            row.addWidget(label)
+            row.addWidget(self.inputs[key])
+            layout.addLayout(row)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.save)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def save(self):
+        try:
+            values = {key: float(self.inputs[key].text()) for key, _ in self.FIELDS}
+        except ValueError:
+            QMessageBox.warning(self, "Errore", "Inserisci valori numerici validi.")
+            return
+        if values["width"] <= 0 or values["thickness"] <= 0:
+            QMessageBox.warning(self, "Errore", "Larghezza e spessore devono essere positivi.")
+            return
+        self.implement = Implement(**values)
+        self.accept()
+
 class RotationDialog(QDialog):
     """Dialog for rotating the field before leveling, with a preview plot similar to survey/leveling."""
     def __init__(self, field_model, parent=None):
@@ -371,6 +878,8 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("Software di Livellamento Terreno")
         self.resize(1000,600)
         self.field_model = FieldModel()
+        self.field_model.grid_cache = GridCache(GRID_CACHE_DIR, GRID_CACHE_MAX_BYTES)
+        self.field_model.implement = load_implement(IMPLEMENT_FILE)
         self.stacked_widget = QStackedWidget()
         self.setCentralWidget(self.stacked_widget)
         
@@ -382,9 +891,15 @@ class MainWindow(QMainWindow):
         self.stacked_widget.setCurrentIndex(0)
         self.survey_widget.end_survey_btn.clicked.connect(self.end_survey)
         
+        # Blade control loop, fed by the receiver thread, independent of the GUI
+        self.blade_controller = BladeController(implement=self.field_model.implement)
+        self.blade_controller.start()
+        self.leveling_widget.blade_controller = self.blade_controller
+        
         # Avvio del GPSReceiver (rimane attivo in entrambe le fasi)
         self.gps_receiver = GPSReceiver()
-        self.gps_receiver.new_data.connect(self.handle_gps_data)
+        self.gps_receiver.listeners.append(self.blade_controller.submit)
+        self.gps_receiver.batches_ready.connect(self.read_gps_fixes)
         self.gps_receiver.start()
         
         # Dock per lo status
@@ -400,60 +915,119 @@ class MainWindow(QMainWindow):
         self.gps_status_label.setStyleSheet(f"font-size: {MEDIUM_FONT};")
         self.elevation_status_label = QLabel("Altitudine: --")
         self.elevation_status_label.setStyleSheet(f"font-size: {MEDIUM_FONT};")
+        self.blade_status_label = QLabel("Lama: --")
+        self.blade_status_label.setStyleSheet(f"font-size: {MEDIUM_FONT};")
+        self.survey_status_label = QLabel("Punti: --")
+        self.survey_status_label.setStyleSheet(f"font-size: {MEDIUM_FONT};")
         status_layout.addWidget(self.gps_status_label)
         status_layout.addWidget(self.elevation_status_label)
+        status_layout.addWidget(self.survey_status_label)
+        status_layout.addWidget(self.blade_status_label)
         self.status_widget.setLayout(status_layout)
         self.status_bar = self.statusBar()
         self.status_bar.addPermanentWidget(self.status_widget)
         
         self.rotation_in_progress = False
-        self.gps_survey_count = 0
-    
-    def handle_gps_data(self, gps_data):
-        """Handle incoming GPS data and update the field model and plot."""
-        if self.rotation_in_progress:
-            return
-        x, y = self.field_model.latlon_to_xy(gps_data["latitude"], gps_data["longitude"])
+        # Decides which fixes become survey points
+        self.ingest_filter = IngestFilter(min_distance=SURVEY_POINT_SPACING, fix_qualities=SURVEY_FIX_QUALITIES)
         
-        # Rotate the tractor coordinates
-        angle = self.field_model.rotation_angle
-        x_rot = x*math.cos(angle) - y*math.sin(angle)
-        y_rot = x*math.sin(angle) + y*math.cos(angle)
+        # Blade latency and survey point counts, once a second
+        self.status_timer = QTimer(self)
+        self.status_timer.timeout.connect(self.update_blade_status)
+        self.status_timer.timeout.connect(self.update_survey_status)
+        self.status_timer.start(1000)
         
-        if gps_data["headingTrue"]>0 and gps_data["headingTrue"]<360:
-            heading = gps_data["headingTrue"] - math.degrees(angle)
-        elif gps_data["headingTrueDual"]>0 and gps_data["headingTrueDual"]<360:
-            heading = gps_data["headingTrueDual"] - math.degrees(angle)
-        else:
-            heading = gps_data["imuHeading"]/10 - math.degrees(angle) #TODO actually to do a manual VTG
+        # Autosave journal, started once the field to work on is chosen
+        self.journal = FieldJournal(AUTOSAVE_DIR)
         
+        # Saved fields; the current one is stored there every time its grid is generated
+        self.workspace = Workspace(WORKSPACE_DIR)
+        self.field_id = None
+        self.field_name = None
+        # Open the workspace field found at the first GPS fix
+        self.auto_pick_field = False
+    
+    def update_blade_status(self):
+        metrics = self.blade_controller.metrics()
+        if metrics is not None:
+            self.blade_status_label.setText(
+                f"Lama: p50 {metrics['p50'] * 1000:.1f} ms, p99 {metrics['p99'] * 1000:.1f} ms")
+    
+    def update_survey_status(self):
+        """Survey points kept and fixes discarded by the ingest filter, so a survey on a
+        fix type not in SURVEY_FIX_QUALITIES does not silently record nothing."""
+        if self.stacked_widget.currentIndex() != 0:
+            return
+        rejected = self.ingest_filter.rejected
+        self.survey_status_label.setText(
+            f"Punti: {len(self.field_model.points)} (scartati: qualità {rejected['quality']}, "
+            f"picchi {rejected['spike']})")
+    
+    def read_gps_fixes(self):
+        """Take the fixes queued by the receiver thread."""
+        batch = self.gps_receiver.get_fixes()
+        if batch:
+            self.handle_gps_batch(batch)
+    
+    def handle_gps_batch(self, batch):
+        """Handle a batch of GPS fixes: transform them all at once, then process each one."""
+        if self.rotation_in_progress or not batch:
+            return
+        last_fix = batch[-1]
+        if self.auto_pick_field:
+            self.pick_field_from_fix(batch[0])
+        if self.field_model.ref_lat is None:
+            # The first survey point sets the reference: transform one fix at a time until then
+            for k, gps_data in enumerate(batch):
+                xs, ys, headings = self.field_model.transform_fixes([gps_data])
+                self.handle_gps_data(gps_data, xs[0], ys[0], headings[0])
+                if self.field_model.ref_lat is not None:
+                    batch = batch[k + 1:]
+                    break
+            else:
+                # Every fix handled and still no reference
+                batch = []
+        if batch:
+            # Field coordinates and heading of every fix in one vectorized call
+            xs, ys, headings = self.field_model.transform_fixes(batch)
+            for gps_data, x_rot, y_rot, heading in zip(batch, xs.tolist(), ys.tolist(), headings.tolist()):
+                self.handle_gps_data(gps_data, x_rot, y_rot, heading)
+        
+        self.gps_status_label.setText("GPS: In ricezione")
+        self.elevation_status_label.setText(f"Altitudine: {last_fix['altitude']:.2f}")  
+    
+    def handle_gps_data(self, gps_data, x_rot, y_rot, heading):
+        """Update the field model and plot with one GPS fix, already in field coordinates."""
         if self.stacked_widget.currentIndex() == 0:  # survey phase
-            self.gps_survey_count += 1
-            # Every 10 points, add to the field model
-            if self.gps_survey_count % 10 == 0:
-                self.field_model.add_point(gps_data)
+            # Only good fixes, spaced by distance, are added to the field model and the coverage
+            if self.ingest_filter.accept(gps_data):
+                # Ground height under the antenna, the same reference as the blade edge written while leveling
+                self.field_model.add_point(
+                    dict(gps_data, altitude=gps_data["altitude"] - self.field_model.implement.antenna_height))
+                point = self.field_model.points[-1]
+                self.survey_widget.add_coverage(point["x"], point["y"])
                 self.survey_widget.update_plot()
-                self.survey_widget.update_tractor(x_rot, y_rot, heading=heading)
+            self.survey_widget.update_tractor(x_rot, y_rot, heading=heading)
         elif self.stacked_widget.currentIndex() == 1:  # leveling phase
-            current_alt = gps_data["altitude"] - self.field_model.ref_alt
+            # Kalman filtered height, its variance weights the update of the grid
+            current_alt = gps_data["altitudeFiltered"] - self.field_model.ref_alt
             # Update grid points in front of the tractor
-            self.field_model.update_grid_elevation(
+            modified = self.field_model.update_grid_elevation(
                 x_rot, 
                 y_rot, 
                 current_alt, 
-                radius=4.5,
-                direction_deg=heading
+                direction_deg=heading,
+                variance=gps_data["altitudeVariance"]
             )
             self.leveling_widget.update_tractor(x_rot, y_rot, current_alt, heading)
-            self.leveling_widget.update_interpolated_grid()
-        
-        self.gps_status_label.setText("GPS: In ricezione")
-        self.elevation_status_label.setText(f"Altitudine: {gps_data['altitude']:.2f}")  
+            if modified:
+                self.leveling_widget.update_grid_region(*self.field_model.last_modified_region)
           
     def end_survey(self):
         filename, _ = QFileDialog.getSaveFileName(self, "Salva Dati Campo", "", "File JSON (*.json)")
         if filename:
             self.field_model.save_to_file(filename)
+            self.field_name = os.path.splitext(os.path.basename(filename))[0]
         
         # Open the rotation dialog
         rotation_dlg = RotationDialog(self.field_model, self)
@@ -469,12 +1043,7 @@ class MainWindow(QMainWindow):
         
     def apply_rotation_to_points(self):
         """Rotate existing points in self.field_model by self.field_model.rotation_angle."""
-        angle = self.field_model.rotation_angle
-        for p in self.field_model.points:
-            x_old, y_old = p["x"], p["y"]
-            x_new = x_old*math.cos(angle) - y_old*math.sin(angle)
-            y_new = x_old*math.sin(angle) + y_old*math.cos(angle)
-            p["x"], p["y"] = x_new, y_new
+        self.field_model.rotate_field(self.field_model.rotation_angle)
     
     def generate_grid(self):
         # Generate the leveling grid before switching to leveling mode
@@ -492,9 +1061,70 @@ class MainWindow(QMainWindow):
         self.field_model.plane_a = compute_best_offset(self.field_model.points, self.field_model.plane_b, self.field_model.plane_c)
         self.leveling_widget.update_interpolated_grid()
         
+        # The new grid is not in the journal, store it in a snapshot
+        self.journal.compact()
+        self.save_to_workspace()
     
+    def save_to_workspace(self):
+        """Store the current field and its grid in the workspace."""
+        if not self.field_model.points:
+            return
+        if self.field_name is None:
+            self.field_name = "Campo " + time.strftime("%d/%m/%Y %H:%M")
+        try:
+            self.field_id = self.workspace.save_field(self.field_model, self.field_name, self.field_id)
+        except OSError as e:
+            print("Workspace error:", e)
+    
+    def open_workspace_field(self, field_id):
+        """Load a field of the workspace and show it."""
+        entry = self.workspace.get(field_id)
+        try:
+            self.workspace.load_field(field_id, self.field_model)
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.warning(self, "Errore", f"Impossibile aprire il campo: {str(e)}")
+            return False
+        self.field_id = field_id
+        self.field_name = entry["name"]
+        self.ingest_filter.reset()
+        self.journal.compact()
+        if self.field_model.leveling_mode:
+            self.stacked_widget.setCurrentIndex(1)
+            self.leveling_widget.update_interpolated_grid()
+        else:
+            for p in self.field_model.points:
+                self.survey_widget.add_coverage(p["x"], p["y"])
+            self.survey_widget.update_plot()
+        return True
+    
+    def pick_field_from_fix(self, gps_data):
+        """Open the workspace field containing the GPS position, if any."""
+        self.auto_pick_field = False
+        field_id = self.workspace.find_field(gps_data["latitude"], gps_data["longitude"])
+        if field_id is None:
+            self.status_bar.showMessage("Nessun campo salvato in questa posizione: nuovo rilevamento", 10000)
+            return
+        if self.open_workspace_field(field_id):
+            self.status_bar.showMessage(f"Campo aperto: {self.field_name}", 10000)
+    
+    def recover_session(self):
+        """Restore the field from the autosave journal of an interrupted session."""
+        if not FieldJournal.recover(AUTOSAVE_DIR, self.field_model):
+            QMessageBox.warning(self, "Errore", "Impossibile recuperare la sessione interrotta.")
+            return
+        self.ingest_filter.reset()
+        if self.field_model.leveling_mode:
+            self.stacked_widget.setCurrentIndex(1)
+            self.leveling_widget.update_interpolated_grid()
+        else:
+            for p in self.field_model.points:
+                self.survey_widget.add_coverage(p["x"], p["y"])
+            self.survey_widget.update_plot()
+        
     def closeEvent(self, event):
         self.gps_receiver.stop()
+        self.blade_controller.stop()
+        self.journal.close()
         event.accept()
 
 def main():
@@ -515,14 +1145,26 @@ def main():
         font.setPointSize(int(font_size * 1.2))  # Increase by 20%
         app.setFont(font)
     
-    dlg = StartupDialog()
+    dlg = StartupDialog(can_recover=FieldJournal.has_recovery(AUTOSAVE_DIR))
     if dlg.exec_() == QDialog.Accepted:
         main_win = MainWindow()
         
-        if dlg.choice == "continue":
+        if dlg.choice == "recover":
+            main_win.recover_session()
+        
+        elif dlg.choice == "workspace":
+            workspace_dlg = WorkspaceDialog(main_win.workspace, main_win)
+            if workspace_dlg.exec_() == QDialog.Accepted:
+                main_win.open_workspace_field(workspace_dlg.selected_id)
+        
+        elif dlg.choice == "auto":
+            main_win.auto_pick_field = True
+        
+        elif dlg.choice == "continue":
             filename, _ = QFileDialog.getOpenFileName(main_win, "Carica Dati Campo", "", "File JSON (*.json)")
             if filename:
                 main_win.field_model.load_from_file(filename)
+                main_win.field_name = os.path.splitext(os.path.basename(filename))[0]
                 
                 # Apply rotation after loading but before generating the grid
                 if abs(main_win.field_model.rotation_angle) > 1e-9:
@@ -553,11 +1195,17 @@ def main():
                         # Switch to leveling mode
                         main_win.stacked_widget.setCurrentIndex(1)
                         main_win.leveling_widget.update_interpolated_grid()
+                        
+                        # AgOpenGPS keeps Elevation.txt in the folder named after the field
+                        main_win.field_name = os.path.basename(os.path.dirname(os.path.abspath(filename)))
+                        main_win.save_to_workspace()
                     else:
                         QMessageBox.warning(main_win, "Errore", "Impossibile importare dati da Elevation.txt. File non valido o vuoto.")
                 except Exception as e:
                     QMessageBox.warning(main_win, "Errore", f"Errore nell'importazione: {str(e)}")
         
+        # From here on every fix and grid edit is autosaved
+        main_win.journal.start(main_win.field_model)
         main_win.show()
         sys.exit(app.exec_())
 
@@ -3,8 +3,9 @@ from PyQt5.QtWidgets import QWidget, QVBoxLayout
 import pyqtgraph as pg
 import numpy as np
 from PyQt5.QtGui import QPainter, QLinearGradient, QColor, QFont, QPen
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 from pyqtgraph.Qt import QtCore
+from raster_pyramid import RasterPyramid
 
 class FieldPlotWidget(pg.GraphicsView):
     def __init__(self, parent=None):
@@ -15,6 +16,12 @@ class FieldPlotWidget(pg.GraphicsView):
         # Lock aspect ratio to 1:1
         self.plot_item.setAspectLocked(True, ratio=1)
         
+        # Survey coverage overlay, drawn below the points
+        self.coverage_item = pg.ImageItem()
+        self.coverage_item.setZValue(-10)
+        self.plot_item.addItem(self.coverage_item)
+        self.coverage_rgba = None  # overlay colours, repainted by the dirty window of the coverage
+        
         self.scatter = pg.ScatterPlotItem()
         self.plot_item.addItem(self.scatter)
         # Tractor marker as an arrow (rotatable)
@@ -48,6 +55,32 @@ class FieldPlotWidget(pg.GraphicsView):
         # Make sure to re-apply the aspect lock after updates, if needed
         self.plot_item.setAspectLocked(True, ratio=1)
     
+    def update_coverage(self, coverage):
+        """
+        Show the survey coverage: green where data was collected, red where there is no
+        data nearby. Only the window of cells changed since the last call is recoloured.
+        """
+        dirty = coverage.take_dirty()
+        if coverage.empty or dirty is None:
+            return
+        if self.coverage_rgba is None or self.coverage_rgba.shape[:2] != coverage.counts.shape:
+            self.coverage_rgba = np.zeros(coverage.counts.shape + (4,), dtype=np.ubyte)
+            dirty = (0, coverage.counts.shape[0], 0, coverage.counts.shape[1])
+        rows, cols = slice(dirty[0], dirty[1]), slice(dirty[2], dirty[3])
+        counts = coverage.counts[rows, cols]
+        rgba = self.coverage_rgba[rows, cols]
+        rgba[...] = 0
+        covered = counts > 0
+        rgba[covered] = (0, 160, 0, 0)
+        # Darker green where more fixes were collected
+        rgba[covered, 3] = np.clip(40 + 20 * counts[covered], 0, 160)
+        rgba[coverage.gap_mask(rows, cols)] = (255, 0, 0, 110)
+        
+        # Transpose for proper orientation, as for the leveling grid
+        self.coverage_item.setImage(self.coverage_rgba.transpose(1, 0, 2), autoLevels=False)
+        x0, y0, width, height = coverage.extent()
+        self.coverage_item.setRect(QtCore.QRectF(x0, y0, width, height))
+    
     def update_tractor(self, x, y, heading=0):
         # Update position and orientation of the arrow marker.
         self.tractor_marker.setPos(x, y)
@@ -67,6 +100,18 @@ class LevelingPlotWidget(pg.GraphicsView):
         # Replace tractor marker with an ArrowItem for proper rotation.
         self.tractor_marker = pg.ArrowItem(angle=0, tipAngle=45, baseAngle=25, headLen=40, tailLen=0, tailWidth=0, brush='g')
         self.plot_item.addItem(self.tractor_marker)
+        # Haul plan arrows (segments drawn in pairs of points)
+        self.haul_item = pg.PlotCurveItem(pen=pg.mkPen((40, 40, 40), width=1.5), connect="pairs")
+        self.haul_item.setZValue(5)
+        self.plot_item.addItem(self.haul_item)
+        # Drainage overlay (ponds and channels), RGBA over the whole grid
+        self.hydro_item = pg.ImageItem(autoDownsample=True)
+        self.hydro_item.setZValue(4)
+        self.plot_item.addItem(self.hydro_item)
+        # Contour lines (segments drawn in pairs of points)
+        self.contour_item = pg.PlotCurveItem(pen=pg.mkPen((60, 60, 60), width=1), connect="pairs")
+        self.contour_item.setZValue(3)
+        self.plot_item.addItem(self.contour_item)
         self.plot_item.setAspectLocked(True)
         lut = np.empty((256, 4), dtype=np.uint8)
         for i in range(256):
@@ -83,33 +128,178 @@ class LevelingPlotWidget(pg.GraphicsView):
                 b = 255
             lut[i] = (r, g, b, 255)
         self.img_item.setLookupTable(lut)
+        
+        # Multi-resolution copy of the diff raster, only the visible part is uploaded
+        self.pyramid = None
+        self.grid_x0 = 0.0
+        self.grid_y0 = 0.0
+        self.grid_resolution = 1.0
+        self.grid_geometry = None
+        self.plot_item.vb.sigRangeChanged.connect(self.refresh_view)
+        self.plot_item.vb.sigResized.connect(self.refresh_view)
     
     def update_grid(self, grid_x, grid_y, survey_grid, target_grid):
         if survey_grid is None or target_grid is None:
             return
             
         diff = target_grid - survey_grid
-        min_diff = np.nanmin(diff)
-        max_diff = np.nanmax(diff)
-        color_bar_diff = np.max([np.abs(min_diff), np.abs(max_diff)])
+        self.pyramid = RasterPyramid(diff)
+        
+        # Grid geometry: cell (i, j) is centred on (grid_x[0, j], grid_y[i, 0])
+        self.grid_x0 = grid_x[0, 0]
+        self.grid_y0 = grid_y[0, 0]
+        self.grid_resolution = grid_x[0, 1] - grid_x[0, 0] if grid_x.shape[1] > 1 else 1.0
+        
+        # Zoom to the whole field only when a new grid is shown, so plane changes keep the user's view.
+        # Setting the range explicitly also disables auto-range, which would otherwise chase the cropped image.
+        geometry = (self.grid_x0, self.grid_y0, diff.shape)
+        if geometry != self.grid_geometry:
+            self.grid_geometry = geometry
+            half = self.grid_resolution / 2
+            self.plot_item.vb.setRange(xRange=(grid_x[0, 0] - half, grid_x[-1, -1] + half),
+                                       yRange=(grid_y[0, 0] - half, grid_y[-1, -1] + half))
+        
+        self.refresh_view()
+        self.plot_item.setAspectLocked(True, ratio=1)
+    
+    def update_region(self, i0, j0, survey_block, target_block):
+        """Refresh only the cells of a block starting at grid index (i0, j0)."""
+        if self.pyramid is None:
+            return
+        self.pyramid.update(i0, j0, target_block - survey_block)
+        self.refresh_view()
+    
+    def diff_range(self):
+        """(min, max) of target - survey over the whole grid."""
+        if self.pyramid is None:
+            return np.nan, np.nan
+        return self.pyramid.value_range()
+    
+    def refresh_view(self, *args):
+        """Upload only the pyramid level matching the current zoom, cropped to the visible area."""
+        if self.pyramid is None:
+            return
+        min_diff, max_diff = self.pyramid.value_range()
+        color_bar_diff = np.nanmax([np.abs(min_diff), np.abs(max_diff), 1e-6])
+        
+        # Pick the level whose cells are about one screen pixel wide
+        res = self.grid_resolution
+        pixel_size = max(self.plot_item.vb.viewPixelSize())
+        level = 0
+        if pixel_size > 0 and np.isfinite(pixel_size):
+            level = int(np.clip(np.floor(np.log2(pixel_size / res)), 0, self.pyramid.num_levels - 1))
+        image = self.pyramid.level(level)
+        cell = res * 2**level
+        
+        # Crop to the visible region (plus one cell of margin)
+        left = self.grid_x0 - res / 2
+        bottom = self.grid_y0 - res / 2
+        (view_x0, view_x1), (view_y0, view_y1) = self.plot_item.vb.viewRange()
+        j0 = int(np.clip(np.floor((view_x0 - left) / cell) - 1, 0, image.shape[1]))
+        j1 = int(np.clip(np.ceil((view_x1 - left) / cell) + 1, 0, image.shape[1]))
+        i0 = int(np.clip(np.floor((view_y0 - bottom) / cell) - 1, 0, image.shape[0]))
+        i1 = int(np.clip(np.ceil((view_y1 - bottom) / cell) + 1, 0, image.shape[0]))
+        if i1 <= i0 or j1 <= j0:
+            self.img_item.clear()
+            return
         
         # Set the image data (transpose for proper orientation)
-        self.img_item.setImage(diff.T, levels=(-color_bar_diff, color_bar_diff))
+        self.img_item.setImage(image[i0:i1, j0:j1].T, levels=(-color_bar_diff, color_bar_diff))
         
         # Set the rectangle that the image should cover in grid coordinates
-        x0 = grid_x[0, 0]
-        y0 = grid_y[0, 0]
-        x1 = grid_x[-1, -1]
-        y1 = grid_y[-1, -1]
-        rect = QtCore.QRectF(x0, y0, x1 - x0, y1 - y0)
+        rect = QtCore.QRectF(left + j0 * cell, bottom + i0 * cell, (j1 - j0) * cell, (i1 - i0) * cell)
         self.img_item.setRect(rect)
-        
-        self.plot_item.setAspectLocked(True, ratio=1)
     
+    def update_haul(self, x, y, dx, dy):
+        """Draw the haul arrows from (x, y) to (x + dx, y + dy); empty arrays clear them."""
+        if len(x) == 0:
+            self.haul_item.setData([], [])
+            return
+        # Shaft plus two head strokes, at 25 degrees from the shaft and a quarter of its length
+        length = np.hypot(dx, dy)
+        angle = np.arctan2(dy, dx)
+        head = np.minimum(0.25 * length, 20.0)
+        tip_x, tip_y = x + dx, y + dy
+        segments = [(x, y, tip_x, tip_y)]
+        for side in (-1, 1):
+            a = angle + np.pi + side * np.radians(25)
+            segments.append((tip_x, tip_y, tip_x + head * np.cos(a), tip_y + head * np.sin(a)))
+        seg = np.array(segments)           # (3, 4, n)
+        xs = np.stack((seg[:, 0], seg[:, 2]), axis=-1).transpose(1, 0, 2).ravel()
+        ys = np.stack((seg[:, 1], seg[:, 3]), axis=-1).transpose(1, 0, 2).ravel()
+        self.haul_item.setData(xs, ys)
+
+    def update_hydrology(self, ponding, channels, max_depth=0.1):
+        """
+        Drainage overlay on the grid shown: ponding depth (m) in blue, more opaque when
+        deeper (full at max_depth), and channel cells (boolean) in dark blue; None clears it.
+        """
+        if ponding is None:
+            self.hydro_item.clear()
+            return
+        rgba = np.zeros(ponding.shape + (4,), dtype=np.uint8)
+        depth = np.nan_to_num(ponding)
+        ponds = depth > 0
+        rgba[ponds] = (0, 150, 255, 0)
+        rgba[ponds, 3] = (60 + 195 * np.clip(depth[ponds] / max_depth, 0, 1)).astype(np.uint8)
+        rgba[channels] = (0, 0, 140, 255)
+        self.hydro_item.setImage(rgba.transpose(1, 0, 2), levels=None)
+        res = self.grid_resolution
+        self.hydro_item.setRect(QtCore.QRectF(self.grid_x0 - res / 2, self.grid_y0 - res / 2,
+                                              ponding.shape[1] * res, ponding.shape[0] * res))
+
+    def update_contours(self, segments):
+        """Draw contour segments, rows (x1, y1, x2, y2); None clears them."""
+        if segments is None or not len(segments):
+            self.contour_item.setData([], [])
+            return
+        self.contour_item.setData(segments[:, [0, 2]].ravel(), segments[:, [1, 3]].ravel())
+
     def update_tractor(self, x, y, heading=0):
         self.tractor_marker.setPos(x, y)
         self.tractor_marker.setRotation(heading+90)
 
+class SlopeCostPlotWidget(pg.GraphicsView):
+    """Heatmap of cut + fill over a grid of candidate slopes; a click emits the slopes of that cell."""
+    slopeClicked = pyqtSignal(float, float)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.plot_item = pg.PlotItem()
+        self.setCentralItem(self.plot_item)
+        self.plot_item.setLabel("bottom", "Pendenza orizz. (cm/100m)")
+        self.plot_item.setLabel("left", "Pendenza vert. (cm/100m)")
+        self.img_item = pg.ImageItem()
+        self.img_item.setLookupTable(pg.colormap.get("viridis").getLookupTable(nPts=256))
+        self.plot_item.addItem(self.img_item)
+        self.best_marker = pg.ScatterPlotItem(symbol="+", size=16, pen=pg.mkPen("w", width=2))
+        self.plot_item.addItem(self.best_marker)
+        self.chosen_marker = pg.ScatterPlotItem(symbol="o", size=12, pen=pg.mkPen("r", width=2), brush=None)
+        self.plot_item.addItem(self.chosen_marker)
+        self.slopes_x = self.slopes_y = None
+        self.scene().sigMouseClicked.connect(self.mouse_clicked)
+
+    def update_cost(self, slopes_x, slopes_y, cost):
+        """cost[i, j] for slopes_y[i], slopes_x[j] (cm/100m, evenly spaced)."""
+        self.slopes_x, self.slopes_y = np.asarray(slopes_x), np.asarray(slopes_y)
+        dx = self.slopes_x[1] - self.slopes_x[0] if len(self.slopes_x) > 1 else 1.0
+        dy = self.slopes_y[1] - self.slopes_y[0] if len(self.slopes_y) > 1 else 1.0
+        self.img_item.setImage(cost.T, levels=(np.nanmin(cost), np.nanmax(cost)))
+        self.img_item.setRect(QtCore.QRectF(self.slopes_x[0] - dx / 2, self.slopes_y[0] - dy / 2,
+                                            len(self.slopes_x) * dx, len(self.slopes_y) * dy))
+        i, j = np.unravel_index(np.nanargmin(cost), cost.shape)
+        self.best_marker.setData([self.slopes_x[j]], [self.slopes_y[i]])
+        self.chosen_marker.clear()
+
+    def mouse_clicked(self, event):
+        if self.slopes_x is None:
+            return
+        pos = self.plot_item.vb.mapSceneToView(event.scenePos())
+        j = int(np.argmin(np.abs(self.slopes_x - pos.x())))
+        i = int(np.argmin(np.abs(self.slopes_y - pos.y())))
+        self.chosen_marker.setData([self.slopes_x[j]], [self.slopes_y[i]])
+        self.slopeClicked.emit(float(self.slopes_x[j]), float(self.slopes_y[i]))
+
 class ElevationDiffColorBar(QWidget):
     def __init__(self, min_diff=-1, max_diff=1, parent=None):
         super().__init__(parent)
@@ -0,0 +1,105 @@
+# raster_pyramid.py
+import numpy as np
+
+
+def _reduce_blocks(total, count, lo, hi):
+    """Combine 2x2 blocks of a level into one cell of the next (coarser) level.
+    Odd sized inputs are padded with empty cells, so NaN never leaks into the means."""
+    h, w = total.shape
+    ph, pw = h % 2, w % 2
+    if ph or pw:
+        total = np.pad(total, ((0, ph), (0, pw)))
+        count = np.pad(count, ((0, ph), (0, pw)))
+        lo = np.pad(lo, ((0, ph), (0, pw)), constant_values=np.nan)
+        hi = np.pad(hi, ((0, ph), (0, pw)), constant_values=np.nan)
+    def quads(a):
+        return a[0::2, 0::2], a[1::2, 0::2], a[0::2, 1::2], a[1::2, 1::2]
+    t00, t10, t01, t11 = quads(total)
+    c00, c10, c01, c11 = quads(count)
+    l00, l10, l01, l11 = quads(lo)
+    h00, h10, h01, h11 = quads(hi)
+    total = (t00 + t10) + (t01 + t11)
+    count = (c00 + c10) + (c01 + c11)
+    lo = np.fmin(np.fmin(l00, l10), np.fmin(l01, l11))
+    hi = np.fmax(np.fmax(h00, h10), np.fmax(h01, h11))
+    return total, count, lo, hi
+
+
+def _mean(total, count):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
+class RasterPyramid:
+    """
+    Mipmap-style pyramid of a raster that may contain NaN (cells outside the field).
+    Level 0 is the raster itself, every following level halves both dimensions and
+    stores, for each coarse cell, the mean of the valid base cells it covers plus
+    their min/max. The last level is a single cell holding the global range.
+    """
+
+    def __init__(self, raster):
+        base = np.array(raster, dtype=float)
+        valid = ~np.isnan(base)
+        total = np.where(valid, base, 0.0)
+        count = valid.astype(np.int64)
+        self.totals = [total]
+        self.counts = [count]
+        self.lows = [base]
+        self.highs = [base]
+        self.means = [base]
+        while max(self.totals[-1].shape) > 1:
+            total, count, lo, hi = _reduce_blocks(self.totals[-1], self.counts[-1],
+                                                  self.lows[-1], self.highs[-1])
+            self.totals.append(total)
+            self.counts.append(count)
+            self.lows.append(lo)
+            self.highs.append(hi)
+            self.means.append(_mean(total, count))
+
+    @property
+    def num_levels(self):
+        return len(self.means)
+
+    @property
+    def shape(self):
+        return self.means[0].shape
+
+    def level(self, k):
+        """Mean raster of level k (NaN where no valid base cell is covered)."""
+        return self.means[k]
+
+    def value_range(self):
+        """(min, max) of all valid base cells, NaN if the raster is empty."""
+        return self.lows[-1][0, 0], self.highs[-1][0, 0]
+
+    def update(self, i0, j0, values):
+        """
+        Overwrite the base cells starting at (i0, j0) with 'values' and refresh
+        only the coarse cells covering that block.
+        """
+        values = np.asarray(values, dtype=float)
+        i1 = min(i0 + values.shape[0], self.shape[0])
+        j1 = min(j0 + values.shape[1], self.shape[1])
+        if i1 <= i0 or j1 <= j0:
+            return
+        values = values[:i1 - i0, :j1 - j0]
+        valid = ~np.isnan(values)
+        self.means[0][i0:i1, j0:j1] = values  # lows/highs of level 0 share this array
+        self.totals[0][i0:i1, j0:j1] = np.where(valid, values, 0.0)
+        self.counts[0][i0:i1, j0:j1] = valid
+
+        for k in range(1, self.num_levels):
+            # Coarse block covering the dirty region, and its children one level below
+            i0, i1 = i0 // 2, (i1 - 1) // 2 + 1
+            j0, j1 = j0 // 2, (j1 - 1) // 2 + 1
+            ci1 = min(2 * i1, self.totals[k - 1].shape[0])
+            cj1 = min(2 * j1, self.totals[k - 1].shape[1])
+            block = (slice(2 * i0, ci1), slice(2 * j0, cj1))
+            total, count, lo, hi = _reduce_blocks(self.totals[k - 1][block], self.counts[k - 1][block],
+                                                  self.lows[k - 1][block], self.highs[k - 1][block])
+            self.totals[k][i0:i1, j0:j1] = total
+            self.counts[k][i0:i1, j0:j1] = count
+            self.lows[k][i0:i1, j0:j1] = lo
+            self.highs[k][i0:i1, j0:j1] = hi
+            self.means[k][i0:i1, j0:j1] = _mean(total, count)
@@ -0,0 +1,108 @@
+# resurvey.py
+"""
+Rebuild a field from raw PGN recordings (GPSReceiver record_path), without the GUI.
+
+The fixes go through the same ingest filter, projection and gridding as a live survey
+and the result is written as a field file (JSON, like "Termina Rilevamento"), plus
+optionally a snapshot with the leveling grid. The recordings are decoded and filtered
+in parallel, one process per file.
+
+    python resurvey.py day1.pgn day2.pgn -o field.json --snapshot field.npz --rotation 12
+"""
+import argparse
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from gps_receiver import read_pgn_log
+from ingest_filter import IngestFilter
+from field_model import FieldModel
+from leveling import compute_best_offset
+
+
+def filter_log(filename, min_distance, fix_qualities):
+    """Decode one recording and return (lat, lon, alt, counts) of the fixes kept by the ingest filter."""
+    columns = read_pgn_log(filename)
+    ingest_filter = IngestFilter(min_distance=min_distance, fix_qualities=fix_qualities)
+    keep = ingest_filter.accept_many(columns)
+    counts = dict(ingest_filter.rejected, accepted=ingest_filter.accepted, total=len(keep))
+    return (columns["latitude"][keep], columns["longitude"][keep],
+            columns["altitude"][keep].astype(float), counts)
+
+
+def build_field(lat, lon, alt, rotation_deg=0.0):
+    """
+    FieldModel with the given survey points, the first one as reference, and rotation_deg
+    as its rotation angle. The points are left unrotated, as "Termina Rilevamento" saves
+    them: "Continua Campo" applies the angle when it loads the file.
+    """
+    field_model = FieldModel()
+    field_model.ref_lat, field_model.ref_lon, field_model.ref_alt = float(lat[0]), float(lon[0]), float(alt[0])
+    # Same projection as FieldModel.latlon_to_xy, on whole arrays
+    x = field_model.R * np.radians(lon - field_model.ref_lon) * math.cos(math.radians(field_model.ref_lat))
+    y = field_model.R * np.radians(lat - field_model.ref_lat)
+    z = alt - field_model.ref_alt
+    field_model.points = [{"lat": la, "lon": lo, "alt": al, "x": xx, "y": yy, "z": zz}
+                          for la, lo, al, xx, yy, zz in zip(lat.tolist(), lon.tolist(), alt.tolist(),
+                                                            x.tolist(), y.tolist(), z.tolist())]
+    field_model.invalidate_spatial_index()
+    field_model.invalidate_triangulation()
+    field_model.rotation_angle = math.radians(rotation_deg)
+    return field_model
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild a field from raw PGN recordings.")
+    parser.add_argument("logs", nargs="+", help="raw PGN recordings, in survey order")
+    parser.add_argument("-o", "--output", required=True, help="field file to write (JSON)")
+    parser.add_argument("--snapshot", help="also write the field with its leveling grid (npz)")
+    parser.add_argument("--rotation", type=float, default=0.0, help="field rotation in degrees")
+    parser.add_argument("--resolution", type=float, default=1.0, help="grid resolution in meters")
+    parser.add_argument("--spacing", type=float, default=1.0, help="minimum distance between survey points")
+    parser.add_argument("--antenna-height", type=float, default=0.0,
+                        help="antenna height above the blade edge (m), subtracted from the altitudes")
+    parser.add_argument("--fix-quality", type=int, nargs="+", default=[4], help="accepted fix qualities")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per core)")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    workers = args.workers or min(len(args.logs), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(filter_log, args.logs,
+                                    [args.spacing] * len(args.logs),
+                                    [tuple(args.fix_quality)] * len(args.logs)))
+    for filename, (_, _, _, counts) in zip(args.logs, results):
+        print(f"{filename}: {counts['total']} fix, {counts['accepted']} punti "
+              f"(scartati qualità {counts['quality']}, picchi {counts['spike']}, spaziatura {counts['spacing']})")
+
+    lat = np.concatenate([r[0] for r in results])
+    lon = np.concatenate([r[1] for r in results])
+    # Ground heights, as the live survey stores them
+    alt = np.concatenate([r[2] for r in results]) - args.antenna_height
+    if len(lat) < 4:
+        print("Sono necessari almeno 4 punti per generare la griglia di livellamento.")
+        return 1
+
+    field_model = build_field(lat, lon, alt, args.rotation)
+    field_model.save_to_file(args.output)
+    print(f"{len(field_model.points)} punti salvati in {args.output}")
+
+    if args.snapshot:
+        # The snapshot holds the grid of the rotated field, like the leveling view
+        if abs(field_model.rotation_angle) > 1e-9:
+            field_model.rotate_field(field_model.rotation_angle)
+        if not field_model.generate_leveling_grid(resolution=args.resolution):
+            print("Impossibile generare la griglia di livellamento.")
+            return 1
+        field_model.plane_a = compute_best_offset(field_model.points, field_model.plane_b, field_model.plane_c)
+        field_model.save_snapshot(args.snapshot)
+        print(f"Griglia {field_model.grid_z.shape} salvata in {args.snapshot}")
+
+    print(f"Completato in {time.perf_counter() - t0:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -14,7 +14,7 @@ class GPSSimulator:
         self.heading = 0.0  # Heading in degrees
         self.roll = 0.0  # Roll in degrees
         self.satellites = 12  # Number of satellites tracked
-        self.fix_quality = 1  # Fix quality
+        self.fix_quality = 4  # Fix quality (RTK fix)
         self.hdop = 0.8  # Horizontal dilution of precision
         self.age = 0.1  # Age of correction data
         self.imu_heading = 0.0  # IMU heading
@@ -0,0 +1,131 @@
+# spatial_index.py
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class PointIndex:
+    """
+    Spatial index over the survey points (x, y) for nearest-neighbour, radius and
+    bounding-box queries.
+
+    Points appended after the last build are kept in a small "pending" tail that is
+    searched by brute force; the cKDTree is rebuilt lazily, at query time, once the
+    tail grows past a fraction of the indexed points. This keeps append O(1) and the
+    rebuild cost amortized over many fixes.
+    """
+
+    def __init__(self, rebuild_fraction=0.25, min_pending=1024):
+        self.rebuild_fraction = rebuild_fraction
+        self.min_pending = min_pending
+        self.xy = np.empty((1024, 2))
+        self.count = 0
+        self.tree = None
+        self.tree_count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, x, y):
+        if self.count == len(self.xy):
+            grown = np.empty((2 * len(self.xy), 2))
+            grown[:self.count] = self.xy[:self.count]
+            self.xy = grown
+        self.xy[self.count] = (x, y)
+        self.count += 1
+
+    def reset(self, xy):
+        """Replace all points (e.g. after a rotation); the tree is rebuilt on the next query."""
+        xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+        self.xy = np.empty((max(1024, len(xy)), 2))
+        self.xy[:len(xy)] = xy
+        self.count = len(xy)
+        self.tree = None
+        self.tree_count = 0
+
+    def _ensure_tree(self):
+        pending = self.count - self.tree_count
+        if self.tree is None or pending > max(self.min_pending, self.rebuild_fraction * self.tree_count):
+            self.tree = cKDTree(self.xy[:self.count].copy()) if self.count else None
+            self.tree_count = self.count
+
+    def _pending(self):
+        return self.xy[self.tree_count:self.count]
+
+    def nearest(self, x, y, k=1):
+        """Return (distances, indices) of the k points closest to (x, y), closest first."""
+        self._ensure_tree()
+        dists = np.empty(0)
+        idx = np.empty(0, dtype=int)
+        if self.tree is not None:
+            kk = min(k, self.tree_count)
+            dists, idx = self.tree.query((x, y), k=kk)
+            dists = np.atleast_1d(dists)
+            idx = np.atleast_1d(idx)
+        pending = self._pending()
+        if len(pending):
+            d_pending = np.hypot(pending[:, 0] - x, pending[:, 1] - y)
+            dists = np.concatenate((dists, d_pending))
+            idx = np.concatenate((idx, np.arange(self.tree_count, self.count)))
+        order = np.argsort(dists, kind="stable")[:k]
+        return dists[order], idx[order]
+
+    def within_radius(self, x, y, radius):
+        """Indices of the points within 'radius' of (x, y), sorted."""
+        self._ensure_tree()
+        idx = np.empty(0, dtype=int)
+        if self.tree is not None:
+            idx = np.array(self.tree.query_ball_point((x, y), radius), dtype=int)
+        pending = self._pending()
+        if len(pending):
+            near = np.hypot(pending[:, 0] - x, pending[:, 1] - y) <= radius
+            idx = np.concatenate((idx, self.tree_count + np.flatnonzero(near)))
+        return np.sort(idx)
+
+    def within_bbox(self, min_x, min_y, max_x, max_y):
+        """Indices of the points inside the axis-aligned box, sorted."""
+        # The box is covered by the circle through its corners; filter the candidates exactly
+        cx, cy = (min_x + max_x) / 2, (min_y + max_y) / 2
+        candidates = self.within_radius(cx, cy, np.hypot(max_x - min_x, max_y - min_y) / 2)
+        pts = self.xy[candidates]
+        inside = (pts[:, 0] >= min_x) & (pts[:, 0] <= max_x) & (pts[:, 1] >= min_y) & (pts[:, 1] <= max_y)
+        return candidates[inside]
+
+
+def _benchmark(n_points=200000, n_queries=2000):
+    """Compare the index with a brute-force scan over the same points."""
+    import time
+    rng = np.random.default_rng(0)
+    xy = rng.uniform(0, 1000, size=(n_points, 2))
+    queries = rng.uniform(0, 1000, size=(n_queries, 2))
+
+    index = PointIndex()
+    t0 = time.perf_counter()
+    for x, y in xy:
+        index.append(x, y)
+    t_append = time.perf_counter() - t0
+    index.nearest(0, 0)  # build the tree outside the timed loops
+
+    def timed(fn):
+        t0 = time.perf_counter()
+        results = [fn(x, y) for x, y in queries]
+        return (time.perf_counter() - t0) / n_queries * 1e6, results
+
+    t_knn, knn = timed(lambda x, y: index.nearest(x, y, k=8)[1])
+    t_knn_bf, knn_bf = timed(lambda x, y: np.argsort(np.hypot(xy[:, 0] - x, xy[:, 1] - y), kind="stable")[:8])
+    t_rad, rad = timed(lambda x, y: index.within_radius(x, y, 5.0))
+    t_rad_bf, rad_bf = timed(lambda x, y: np.flatnonzero(np.hypot(xy[:, 0] - x, xy[:, 1] - y) <= 5.0))
+    t_box, box = timed(lambda x, y: index.within_bbox(x - 5, y - 5, x + 5, y + 5))
+    t_box_bf, box_bf = timed(lambda x, y: np.flatnonzero((np.abs(xy[:, 0] - x) <= 5) & (np.abs(xy[:, 1] - y) <= 5)))
+
+    assert all(np.array_equal(a, b) for a, b in zip(knn, knn_bf))
+    assert all(np.array_equal(a, b) for a, b in zip(rad, rad_bf))
+    assert all(np.array_equal(a, b) for a, b in zip(box, box_bf))
+
+    print(f"{n_points} points, append: {t_append / n_points * 1e6:.2f} us/point")
+    print(f"kNN (k=8):    index {t_knn:8.1f} us/query, brute force {t_knn_bf:8.1f} us/query")
+    print(f"radius (5 m): index {t_rad:8.1f} us/query, brute force {t_rad_bf:8.1f} us/query")
+    print(f"bbox (10 m):  index {t_box:8.1f} us/query, brute force {t_box_bf:8.1f} us/query")
+
+
+if __name__ == "__main__":
+    _benchmark()
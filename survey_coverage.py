@@ -0,0 +1,110 @@
+# survey_coverage.py
+import math
+import numpy as np
+
+
+class CoverageGrid:
+    """
+    Survey coverage raster built incrementally, one fix at a time.
+
+    For every cell it keeps the number of fixes that fell in it and the distance from
+    the cell centre to the closest fix. Each fix only touches the cells within
+    2*gap_distance of it, so the cost per fix does not depend on the survey size.
+    The raster grows (by doubling) as the tractor leaves the covered area.
+    The cells changed since the last take_dirty() are tracked as one window, so the
+    overlay only repaints those.
+    """
+
+    def __init__(self, resolution=1.0, gap_distance=5.0):
+        self.resolution = resolution
+        self.gap_distance = gap_distance
+        self.reach = int(math.ceil(2 * gap_distance / resolution))
+        self.counts = np.zeros((0, 0), dtype=np.int32)
+        self.nearest = np.zeros((0, 0), dtype=np.float32)
+        self.i_offset = 0  # global cell index of counts[0, 0]
+        self.j_offset = 0
+        self.dirty = None  # (i_min, i_max, j_min, j_max) changed since take_dirty(), array indices, max excluded
+        # Cell centre offsets of the window stamped around each fix
+        offsets = np.arange(-self.reach, self.reach + 1) * resolution
+        self._window_dx, self._window_dy = np.meshgrid(offsets, offsets)
+
+    @property
+    def empty(self):
+        return self.counts.size == 0
+
+    def _ensure(self, i_min, i_max, j_min, j_max):
+        """Grow the rasters so global cells [i_min, i_max] x [j_min, j_max] exist."""
+        h, w = self.counts.shape
+        if (h and w and i_min >= self.i_offset and i_max < self.i_offset + h
+                and j_min >= self.j_offset and j_max < self.j_offset + w):
+            return
+        if not (h and w):
+            new_i0, new_i1 = i_min, i_max + 1
+            new_j0, new_j1 = j_min, j_max + 1
+        else:
+            new_i0, new_i1 = self.i_offset, self.i_offset + h
+            new_j0, new_j1 = self.j_offset, self.j_offset + w
+            # Grow by at least the current size in the needed direction (amortized O(1))
+            if i_min < new_i0:
+                new_i0 = min(i_min, new_i0 - h)
+            if i_max >= new_i1:
+                new_i1 = max(i_max + 1, new_i1 + h)
+            if j_min < new_j0:
+                new_j0 = min(j_min, new_j0 - w)
+            if j_max >= new_j1:
+                new_j1 = max(j_max + 1, new_j1 + w)
+        counts = np.zeros((new_i1 - new_i0, new_j1 - new_j0), dtype=np.int32)
+        nearest = np.full(counts.shape, np.inf, dtype=np.float32)
+        if h and w:
+            di, dj = self.i_offset - new_i0, self.j_offset - new_j0
+            counts[di:di + h, dj:dj + w] = self.counts
+            nearest[di:di + h, dj:dj + w] = self.nearest
+        self.counts, self.nearest = counts, nearest
+        self.i_offset, self.j_offset = new_i0, new_j0
+        # Cells moved: everything has to be repainted
+        self.dirty = (0, counts.shape[0], 0, counts.shape[1])
+
+    def add_fix(self, x, y):
+        """Account for one fix at (x, y)."""
+        res = self.resolution
+        ci = int(math.floor(y / res))
+        cj = int(math.floor(x / res))
+        r = self.reach
+        self._ensure(ci - r, ci + r, cj - r, cj + r)
+        i = ci - self.i_offset
+        j = cj - self.j_offset
+        self.counts[i, j] += 1
+
+        # Distance from the cell centres of the window to the fix
+        dist = np.hypot(self._window_dx + ((cj + 0.5) * res - x), self._window_dy + ((ci + 0.5) * res - y))
+        window = self.nearest[i - r:i + r + 1, j - r:j + r + 1]
+        np.minimum(window, dist, out=window)
+        if self.dirty is None:
+            self.dirty = (i - r, i + r + 1, j - r, j + r + 1)
+        else:
+            d = self.dirty
+            self.dirty = (min(d[0], i - r), max(d[1], i + r + 1), min(d[2], j - r), max(d[3], j + r + 1))
+
+    def take_dirty(self):
+        """Window (i_min, i_max, j_min, j_max) of the cells changed since the last call, None if none."""
+        dirty, self.dirty = self.dirty, None
+        return dirty
+
+    def density(self):
+        """Fixes per square metre for every cell."""
+        return self.counts / (self.resolution ** 2)
+
+    def gap_mask(self, rows=slice(None), cols=slice(None)):
+        """
+        Cells of the surveyed area with no fix within gap_distance (of the block rows x
+        cols if given). The surveyed area is everything within 2*gap_distance of a fix,
+        so gaps between passes are marked but the open space around the field is not.
+        """
+        nearest = self.nearest[rows, cols]
+        return (nearest > self.gap_distance) & np.isfinite(nearest)
+
+    def extent(self):
+        """(x0, y0, width, height) of the raster in local coordinates."""
+        h, w = self.counts.shape
+        res = self.resolution
+        return self.j_offset * res, self.i_offset * res, w * res, h * res
@@ -0,0 +1,98 @@
+# survey_tin.py
+import queue
+import threading
+import numpy as np
+from scipy.spatial import Delaunay
+from scipy.spatial import QhullError
+
+
+class SurveyTriangulator:
+    """
+    Delaunay triangulation (TIN) of the survey points, grown in a background thread
+    while the survey is running, so that the leveling grid can be generated right
+    after "Termina Rilevamento" without triangulating from scratch.
+
+    Points are inserted with Qhull's incremental mode. Every add_points call costs
+    O(n) on top of the insertion itself, so points are inserted in batches that grow
+    with the triangulation (at least 'min_batch' points or 'batch_fraction' of it).
+    """
+
+    def __init__(self, min_batch=256, batch_fraction=0.05):
+        self.min_batch = min_batch
+        self.batch_fraction = batch_fraction
+        self.queue = queue.Queue()
+        self.tri = None
+        self.pending = []       # points received but not yet in the triangulation
+        self.submitted = 0      # points given to add_point since the last reset
+        self.angle = 0.0        # rotation applied to the points after they were triangulated
+        self.valid = True
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def add_point(self, x, y):
+        if not self.valid:
+            return
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="SurveyTriangulator", daemon=True)
+            self.thread.start()
+        self.submitted += 1
+        self.queue.put((x, y))
+
+    def rotate(self, angle):
+        """Record that the triangulated points were rotated by 'angle' radians."""
+        self.angle += angle
+
+    def invalidate(self):
+        """The points no longer match the triangulation (e.g. they were replaced)."""
+        self.valid = False
+
+    def result(self, n_points):
+        """
+        Wait for the pending points and return (tri, angle): the triangulation of the
+        first n_points survey points and the rotation to apply to its coordinates to
+        get the current ones. Returns (None, 0.0) if it does not match the points.
+        """
+        if not self.valid or self.submitted != n_points:
+            return None, 0.0
+        self.queue.join()
+        with self.lock:
+            self._flush(force=True)
+            if self.tri is None or self.tri.npoints != n_points:
+                return None, 0.0
+            return self.tri, self.angle
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self.lock:
+                self.pending.extend(batch)
+                try:
+                    self._flush(force=False)
+                except Exception as e:
+                    print("SurveyTriangulator error:", e)
+                    self.valid = False
+            for _ in batch:
+                self.queue.task_done()
+
+    def _flush(self, force):
+        if not self.pending:
+            return
+        if self.tri is None:
+            # Qhull needs a non-degenerate start (the first fixes are often on a straight line)
+            if len(self.pending) < 3:
+                return
+            try:
+                self.tri = Delaunay(np.array(self.pending), incremental=True)
+            except QhullError:
+                return
+        else:
+            threshold = max(self.min_batch, self.batch_fraction * self.tri.npoints)
+            if not force and len(self.pending) < threshold:
+                return
+            self.tri.add_points(np.array(self.pending))
+        self.pending = []
@@ -0,0 +1,218 @@
+# tiled_grid.py
+import os
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from scipy.spatial import ConvexHull, Delaunay, QhullError
+
+PARALLEL_MIN_POINTS = 100000  # below this the worker start-up costs more than it saves
+
+def interpolate_linear(points_xy, points_z, tri, index, query):
+    """
+    Linear interpolation of points_z at 'query' on the triangulation 'tri' of the points
+    points_xy[index]. The vertices of every triangle are taken in increasing global
+    index, so a triangle gives the same bits whatever triangulation it comes from.
+    NaN outside the triangulation.
+    """
+    values = np.full(len(query), np.nan)
+    simplex = tri.find_simplex(query)
+    found = simplex >= 0
+    if not np.any(found):
+        return values, simplex
+    vertices = np.sort(index[tri.simplices[simplex[found]]], axis=1)
+    qx, qy = query[found, 0], query[found, 1]
+    xa, ya = points_xy[vertices[:, 0], 0], points_xy[vertices[:, 0], 1]
+    xb, yb = points_xy[vertices[:, 1], 0], points_xy[vertices[:, 1], 1]
+    xc, yc = points_xy[vertices[:, 2], 0], points_xy[vertices[:, 2], 1]
+    det = (yb - yc) * (xa - xc) + (xc - xb) * (ya - yc)
+    la = ((yb - yc) * (qx - xc) + (xc - xb) * (qy - yc)) / det
+    lb = ((yc - ya) * (qx - xc) + (xa - xc) * (qy - yc)) / det
+    values[found] = la * points_z[vertices[:, 0]] + lb * points_z[vertices[:, 1]] + (1.0 - la - lb) * points_z[vertices[:, 2]]
+    return values, simplex
+
+
+def _inside_hull(hull, query):
+    """True for the query points inside the convex hull given by its facet equations."""
+    inside = np.ones(len(query), dtype=bool)
+    for a, b, c in hull:
+        inside &= a * query[:, 0] + b * query[:, 1] + c <= 0
+    return inside
+
+
+def _points_in_box(points_xy, min_x, max_x, min_y, max_y):
+    """Indices of the points in the box; points_xy is sorted by x."""
+    start = np.searchsorted(points_xy[:, 0], min_x, side="left")
+    stop = np.searchsorted(points_xy[:, 0], max_x, side="right")
+    y = points_xy[start:stop, 1]
+    return start + np.flatnonzero((y >= min_y) & (y <= max_y))
+
+
+def _globally_delaunay(points_xy, tri, index, simplices, box):
+    """
+    True if the triangles of the local triangulation (of points_xy[index], all the
+    points inside 'box') are also triangles of the triangulation of all the points,
+    i.e. no point lies strictly inside their circumcircle.
+    """
+    min_x, max_x, min_y, max_y = box
+    corners = tri.points[tri.simplices[simplices]]
+    ax, ay = corners[:, 0, 0], corners[:, 0, 1]
+    bx, by = corners[:, 1, 0] - ax, corners[:, 1, 1] - ay
+    cx, cy = corners[:, 2, 0] - ax, corners[:, 2, 1] - ay
+    d = 2.0 * (bx * cy - by * cx)
+    ux = (cy * (bx * bx + by * by) - by * (cx * cx + cy * cy)) / d
+    uy = (bx * (cx * cx + cy * cy) - cx * (bx * bx + by * by)) / d
+    r = np.hypot(ux, uy)
+    ux, uy = ux + ax, uy + ay
+
+    # The local triangulation already has no point of the box in the circumcircles:
+    # a circle is fine if the part of it holding points (the points bbox) is in the box
+    p_min, p_max = points_xy.min(axis=0), points_xy.max(axis=0)
+    contained = (((ux - r >= min_x) | (min_x <= p_min[0])) & ((ux + r <= max_x) | (max_x >= p_max[0])) &
+                 ((uy - r >= min_y) | (min_y <= p_min[1])) & ((uy + r <= max_y) | (max_y >= p_max[1])))
+
+    # Others (long triangles on the hull): look for a point inside the circle
+    for k in np.flatnonzero(~contained):
+        candidates = _points_in_box(points_xy, ux[k] - r[k], ux[k] + r[k], uy[k] - r[k], uy[k] + r[k])
+        d2 = (points_xy[candidates, 0] - ux[k]) ** 2 + (points_xy[candidates, 1] - uy[k]) ** 2
+        if np.any(d2 < r[k] * r[k] * (1 - 1e-9)):
+            return False
+    return True
+
+
+def interpolate_tile(points_xy, points_z, hull, x_range, y_range, overlap):
+    """
+    Interpolate the grid cells x_range * y_range from the points within 'overlap' of
+    the tile, with the result of the triangulation of all the points (points_xy sorted
+    by x). If a cell falls in a triangle that is not in the global triangulation, or
+    outside the local hull but inside the global one ('hull' equations), the overlap
+    is doubled.
+    """
+    grid_x, grid_y = np.meshgrid(x_range, y_range)
+    query = np.column_stack((grid_x.ravel(), grid_y.ravel()))
+    p_min, p_max = points_xy.min(axis=0), points_xy.max(axis=0)
+    while True:
+        box = (x_range[0] - overlap, x_range[-1] + overlap, y_range[0] - overlap, y_range[-1] + overlap)
+        covers_all = box[0] <= p_min[0] and box[1] >= p_max[0] and box[2] <= p_min[1] and box[3] >= p_max[1]
+        index = _points_in_box(points_xy, *box)
+        try:
+            tri = Delaunay(points_xy[index]) if len(index) >= 3 else None
+        except QhullError:
+            tri = None
+        if tri is not None:
+            values, simplex = interpolate_linear(points_xy, points_z, tri, index, query)
+            if covers_all:
+                break
+            outside = simplex < 0
+            if (_globally_delaunay(points_xy, tri, index, np.unique(simplex[~outside]), box) and
+                    not np.any(_inside_hull(hull, query[outside]))):
+                break
+        elif covers_all:
+            values = np.full(len(query), np.nan)
+            break
+        overlap *= 2
+    return values.reshape(grid_x.shape)
+
+
+# Shared memory of the worker processes: points, z and the output grid
+_shared = {}
+
+
+def _attach(names, n_points, shape):
+    for key, name in names.items():
+        _shared[key + "_shm"] = shared_memory.SharedMemory(name=name)
+    _shared["points_xy"] = np.ndarray((n_points, 2), dtype=float, buffer=_shared["points_shm"].buf)
+    _shared["points_z"] = np.ndarray((n_points,), dtype=float, buffer=_shared["z_shm"].buf)
+    _shared["grid"] = np.ndarray(shape, dtype=float, buffer=_shared["grid_shm"].buf)
+
+
+def _run_tile(hull, x_range, y_range, i0, j0, overlap):
+    values = interpolate_tile(_shared["points_xy"], _shared["points_z"], hull, x_range, y_range, overlap)
+    _shared["grid"][i0:i0 + values.shape[0], j0:j0 + values.shape[1]] = values
+
+
+def interpolate_grid(points_xy, points_z, x_range, y_range, tile_size=256, overlap=None, workers=None):
+    """
+    Linear interpolation of the points on the grid meshgrid(x_range, y_range), like
+    griddata(method='linear'), computed in tiles of tile_size x tile_size cells spread
+    over 'workers' processes sharing the points and the output through shared memory
+    (default: one per core for large point sets, else in this process).
+    The result is the same, bit for bit, as a single tile over the whole grid wherever
+    the Delaunay triangulation is unique (no four points on a circle).
+    """
+    # Sorted by x, so that the tiles find their points with a binary search
+    order = np.argsort(np.asarray(points_xy, dtype=float)[:, 0], kind="stable")
+    points_xy = np.ascontiguousarray(np.asarray(points_xy, dtype=float)[order])
+    points_z = np.ascontiguousarray(np.asarray(points_z, dtype=float)[order])
+    x_range = np.asarray(x_range, dtype=float)
+    y_range = np.asarray(y_range, dtype=float)
+    shape = (len(y_range), len(x_range))
+    try:
+        hull = ConvexHull(points_xy).equations
+    except QhullError:
+        return np.full(shape, np.nan)
+    if overlap is None:
+        # A few times the mean point spacing
+        extent = np.ptp(points_xy, axis=0)
+        overlap = 4.0 * float(np.sqrt(max(extent[0] * extent[1], 1e-12) / len(points_xy)))
+    tiles = [(i0, j0) for i0 in range(0, shape[0], tile_size) for j0 in range(0, shape[1], tile_size)]
+    if workers is None:
+        workers = (os.cpu_count() or 1) if len(points_xy) >= PARALLEL_MIN_POINTS else 1
+    workers = min(workers, len(tiles))
+
+    if workers <= 1:
+        grid = np.empty(shape)
+        for i0, j0 in tiles:
+            xr, yr = x_range[j0:j0 + tile_size], y_range[i0:i0 + tile_size]
+            grid[i0:i0 + len(yr), j0:j0 + len(xr)] = interpolate_tile(points_xy, points_z, hull, xr, yr, overlap)
+        return grid
+
+    blocks = {}
+    try:
+        for key, array in (("points", points_xy), ("z", points_z), ("grid", np.empty(shape))):
+            blocks[key] = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=float, buffer=blocks[key].buf)[...] = array
+        names = {key: block.name for key, block in blocks.items()}
+        # Spawned workers: forking the GUI process with its threads running is not safe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_attach,
+                                 initargs=(names, len(points_xy), shape)) as executor:
+            futures = [executor.submit(_run_tile, hull, x_range[j0:j0 + tile_size], y_range[i0:i0 + tile_size],
+                                       i0, j0, overlap) for i0, j0 in tiles]
+            for future in futures:
+                future.result()
+        return np.ndarray(shape, dtype=float, buffer=blocks["grid"].buf).copy()
+    finally:
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+
+def _benchmark(n_points=300000, size=1000.0, resolution=0.5):
+    """Single tile against the tiled path on every core, and against griddata."""
+    import time
+    from scipy.interpolate import griddata
+    rng = np.random.default_rng(0)
+    points_xy = rng.uniform(0, size, size=(n_points, 2))
+    points_z = np.sin(points_xy[:, 0] / 50) + points_xy[:, 1] / 100
+    x_range = np.arange(-5.0, size + 5.0, resolution)
+    y_range = np.arange(-5.0, size + 5.0, resolution)
+
+    t0 = time.perf_counter()
+    single = interpolate_grid(points_xy, points_z, x_range, y_range, tile_size=max(len(x_range), len(y_range)))
+    t_single = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    tiled = interpolate_grid(points_xy, points_z, x_range, y_range)
+    t_tiled = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    reference = griddata(points_xy, points_z, tuple(np.meshgrid(x_range, y_range)), method="linear")
+    t_griddata = time.perf_counter() - t0
+
+    same = np.array_equal(single, tiled, equal_nan=True)
+    print(f"{n_points} points, {single.size} cells, {os.cpu_count()} cores")
+    print(f"griddata {t_griddata:6.2f} s, single tile {t_single:6.2f} s, tiled {t_tiled:6.2f} s")
+    print(f"tiled == single tile: {same}, max |single - griddata|: {np.nanmax(np.abs(single - reference)):.1e}")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,119 @@
+# workspace.py
+import json
+import os
+import time
+import uuid
+import numpy as np
+from raster_pyramid import RasterPyramid
+
+INDEX_FILE = "index.json"
+THUMBNAIL_SIZE = 64     # cells, longest side
+
+
+class Workspace:
+    """
+    Directory holding many fields, for a contractor moving between them.
+
+    index.json lists every field with its metadata (name, dates, point count, grid
+    shape) and its bounds in lat/lon; next to it each field has a small thumbnail of
+    the grid (<id>.thumb.npy) and the whole model in the snapshot format (<id>.npz).
+    Listing the fields only reads the index; the model is loaded when a field is opened.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.fields = self._read_index()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_index(self):
+        try:
+            with open(self._path(INDEX_FILE), "r") as f:
+                return json.load(f)["fields"]
+        except (OSError, ValueError, KeyError):
+            return []
+
+    def _write_index(self):
+        tmp = self._path(INDEX_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"fields": self.fields}, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path(INDEX_FILE))
+
+    def get(self, field_id):
+        for entry in self.fields:
+            if entry["id"] == field_id:
+                return entry
+        return None
+
+    def save_field(self, field_model, name, field_id=None):
+        """Store the field (new, or replacing field_id) and return its id."""
+        entry = self.get(field_id) if field_id is not None else None
+        if entry is None:
+            entry = {"id": field_id or uuid.uuid4().hex, "created": time.time()}
+            self.fields.append(entry)
+        lats = [p["lat"] for p in field_model.points]
+        lons = [p["lon"] for p in field_model.points]
+        entry.update({
+            "name": name,
+            "modified": time.time(),
+            "points": len(field_model.points),
+            "bounds": [min(lats), max(lats), min(lons), max(lons)] if lats else None,
+            "grid_shape": list(field_model.grid_z.shape) if field_model.grid_z is not None else None,
+            "resolution": field_model.grid_resolution,
+        })
+        field_model.save_snapshot(self._path(entry["id"] + ".npz"))
+        thumbnail = make_thumbnail(field_model.grid_z)
+        if thumbnail is not None:
+            np.save(self._path(entry["id"] + ".thumb.npy"), thumbnail)
+        self._write_index()
+        return entry["id"]
+
+    def load_field(self, field_id, field_model):
+        """Load the whole model of a field."""
+        return field_model.load_snapshot(self._path(field_id + ".npz"))
+
+    def thumbnail(self, field_id):
+        """Small float32 raster of the field elevation, None if there is none."""
+        try:
+            return np.load(self._path(field_id + ".thumb.npy"))
+        except (OSError, ValueError):
+            return None
+
+    def remove_field(self, field_id):
+        self.fields = [entry for entry in self.fields if entry["id"] != field_id]
+        self._write_index()
+        for suffix in (".npz", ".thumb.npy"):
+            try:
+                os.remove(self._path(field_id + suffix))
+            except OSError:
+                pass
+
+    def find_field(self, lat, lon):
+        """Id of the field whose bounds contain (lat, lon), the smallest one if several; None if none."""
+        best, best_area = None, None
+        for entry in self.fields:
+            bounds = entry.get("bounds")
+            if bounds is None:
+                continue
+            min_lat, max_lat, min_lon, max_lon = bounds
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                area = (max_lat - min_lat) * (max_lon - min_lon)
+                if best is None or area < best_area:
+                    best, best_area = entry["id"], area
+        return best
+
+
+def make_thumbnail(grid_z, size=THUMBNAIL_SIZE):
+    """Mean-reduced copy of the grid no larger than size x size (NaN outside the field)."""
+    if grid_z is None or grid_z.size == 0:
+        return None
+    pyramid = RasterPyramid(grid_z)
+    for k in range(pyramid.num_levels):
+        level = pyramid.level(k)
+        if max(level.shape) <= size:
+            break
+    return level.astype(np.float32)